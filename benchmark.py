@@ -0,0 +1,626 @@
+"""
+Benchmarks for the video pipeline.
+
+Usage:
+    python benchmark.py backends [--audio AUDIO] [--duration 30] [--background VIDEO] [--segments SEGMENTS.json]
+    python benchmark.py pipeline [--sizes 30 180 900] [--report bench.json] [--compare baseline.json]
+    python benchmark.py transcribe --audio LONG_AUDIO [--workers 1 2 4 8]
+    python benchmark.py uploads [--videos 50] [--fail-rate 0.1] [--crash-after 100]
+    python benchmark.py imports [--repeat 5] [--budget-ms 500]
+    python benchmark.py variants [--audio AUDIO] [--duration 30] [--background VIDEO] [--variant vertical square ...]
+    python benchmark.py memory [--durations 30 300 900] [--backend stream] [--background VIDEO] [--size 1080x1920]
+
+backends: renders the same input with each render backend. If no audio file is given, a tone of
+--duration seconds is generated with ffmpeg, and if no segments file is given, one-word segments
+are spread evenly over the audio (like the real MAX_WORDS_PER_SUBTITLE = 1 output).
+
+pipeline: runs the whole pipeline (TTS -> subtitles -> render -> uploads) on synthetic stories
+against local stand-ins for ElevenLabs, YouTube and Instagram, so it needs no network or
+credentials. Per-stage metrics are written to --report (.json or .csv); with --compare, stages
+that got slower than the baseline report by more than --tolerance fail the run.
+
+transcribe: transcribes the same audio with 1, 2, 4, ... long-audio workers (1 = the plain
+single-process path) and reports the speedup and how many words each run found.
+
+uploads: fills the upload outbox with --videos files and drains it to fake YouTube and Instagram
+endpoints that fail requests at random and "crash" once mid-upload, then checks that every
+video reached every target exactly once, with interrupted YouTube uploads resumed.
+
+imports: measures CLI start-up in fresh interpreters: `import main`, `--help` of every stage
+subcommand, and for comparison the cost of importing every heavy dependency up front (what
+`import main` used to do). Fails if `import main` pulls in a heavy dependency or takes longer
+than --budget-ms.
+
+variants: renders the output variants (9:16, 1:1, 16:9, preview, ...) once as separate ffmpeg
+runs, each decoding the background itself, and once as a single run with a branched filter graph
+that decodes it only once, and reports both times.
+
+memory: renders generated narrations of each --durations length with each backend, every render
+in a fresh interpreter, and reports the peak RSS of that Python process and of its ffmpeg
+children. With the stream backend both stay flat as the duration grows.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import main
+
+# Modules that only the stage that needs them may import
+HEAVY_MODULES = ("moviepy", "whisper", "torch", "numpy", "PIL", "elevenlabs", "googleapiclient",
+                 "google_auth_oauthlib", "instagrapi")
+SAMPLE_WORDS = ("the night was quiet and nobody in the old house heard the door open "
+                "until the dog started barking at something nobody else could see").split()
+
+
+def make_test_audio(path, duration):
+    """Generates `duration` seconds of a 220 Hz tone, standing in for a narration."""
+    cmd = [main._ffmpeg_binary(), "-y", "-loglevel", "error",
+           "-f", "lavfi", "-i", f"sine=frequency=220:duration={duration}",
+           "-ar", "44100", path]
+    subprocess.run(cmd, check=True)
+    return path
+
+
+def make_test_segments(duration, words_per_second=2.5):
+    """One-word segments spread evenly over `duration` seconds."""
+    word_length = 1.0 / words_per_second
+    segments = []
+    for i in range(int(duration * words_per_second)):
+        start = i * word_length
+        segments.append({
+            'text': SAMPLE_WORDS[i % len(SAMPLE_WORDS)],
+            'start': start,
+            'end': start + word_length * 0.9,
+        })
+    return segments
+
+
+def make_test_story(duration, words_per_second=2.5):
+    """A synthetic story that takes about `duration` seconds to read, in sentences of 12 words."""
+    words = [SAMPLE_WORDS[i % len(SAMPLE_WORDS)] for i in range(int(duration * words_per_second))]
+    sentences = [" ".join(words[i:i + 12]).capitalize() + "." for i in range(0, len(words), 12)]
+    return " ".join(sentences)
+
+
+class FakeElevenLabsClient:
+    """
+    Local stand-in for the ElevenLabs client: "speaks" the text as a tone that lasts as long as
+    reading it would, with evenly spaced character timestamps.
+    """
+
+    def __init__(self, characters_per_second=15.0):
+        self.characters_per_second = characters_per_second
+        self.text_to_speech = self # Mirrors client.text_to_speech.<method>
+
+    def _audio_bytes(self, text, output_format=None):
+        duration = max(1.0, len(text) / self.characters_per_second)
+        if output_format and output_format.startswith("pcm_"):
+            # Raw 16-bit mono PCM, like the API's pcm_* formats
+            output_args = ["-ar", output_format.split("_")[1], "-ac", "1", "-f", "s16le"]
+        else:
+            output_args = ["-ar", "44100", "-f", "mp3"]
+        cmd = [main._ffmpeg_binary(), "-loglevel", "error",
+               "-f", "lavfi", "-i", f"sine=frequency=220:duration={duration:.3f}",
+               *output_args, "-"]
+        return subprocess.run(cmd, check=True, capture_output=True).stdout
+
+    def convert_with_timestamps(self, voice_id, text, output_format=None, **kwargs):
+        seconds_per_char = 1.0 / self.characters_per_second
+        starts = [i * seconds_per_char for i in range(len(text))]
+        return SimpleNamespace(
+            audio_base_64=base64.b64encode(self._audio_bytes(text, output_format)).decode("ascii"),
+            alignment=SimpleNamespace(
+                characters=list(text),
+                character_start_times_seconds=starts,
+                character_end_times_seconds=[start + seconds_per_char for start in starts],
+            ),
+        )
+
+    def stream(self, text, voice_id=None, output_format=None, **kwargs):
+        audio = self._audio_bytes(text, output_format)
+        for i in range(0, len(audio), 64 * 1024):
+            yield audio[i:i + 64 * 1024]
+
+
+class SimulatedCrash(BaseException):
+    """Stands in for the process dying mid-upload (not an Exception, so nothing in main catches it)."""
+
+
+class FakeYouTubeService:
+    """
+    Local stand-in for the YouTube Data API service with server-side resumable upload sessions:
+    reads the upload in chunks, can fail chunks at random (fail_rate) or "crash" the process after
+    crash_after_chunks chunks, and counts finished uploads per file to catch duplicates.
+    """
+
+    def __init__(self, fail_rate=0.0, crash_after_chunks=None, seed=0):
+        self.fail_rate = fail_rate
+        self.crash_after_chunks = crash_after_chunks
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sessions = {} # Upload session URI -> bytes received
+        self.finished = {} # Upload session URI -> response of the finished upload
+        self.uploads = Counter() # File SHA-256 -> finished uploads
+        self.chunks = 0
+        self.bytes_received = 0
+        self.resumed = 0
+
+    def videos(self):
+        return self
+
+    def insert(self, part, body, media_body):
+        return _FakeUploadRequest(self, media_body)
+
+
+class _FakeResponse(dict):
+    """Like httplib2.Response: the headers as a dict, plus the HTTP status."""
+
+    def __init__(self, status, **headers):
+        super().__init__(headers)
+        self.status = status
+
+
+class _FakeUploadHttp:
+    """Answers the status check of the resumable upload protocol (empty PUT, "Content-Range: bytes */size")."""
+
+    def __init__(self, service):
+        self.service = service
+
+    def request(self, uri, method="GET", body=None, headers=None):
+        service = self.service
+        with service.lock:
+            if uri in service.finished:
+                return _FakeResponse(200), json.dumps(service.finished[uri])
+            if uri not in service.sessions:
+                return _FakeResponse(404), "{}"
+            service.resumed += 1
+            received = service.sessions[uri]
+        return (_FakeResponse(308, range=f"bytes=0-{received - 1}") if received else _FakeResponse(308)), ""
+
+
+class _FakeUploadRequest:
+    def __init__(self, service, media_body):
+        self.service = service
+        self.media_body = media_body
+        self.resumable_uri = None
+        self.resumable_progress = 0
+        self.http = _FakeUploadHttp(service)
+
+    def postproc(self, resp, content):
+        return json.loads(content)
+
+    def next_chunk(self):
+        from googleapiclient.http import MediaUploadProgress
+        service = self.service
+        total = self.media_body.size()
+        with service.lock:
+            if self.resumable_uri is None:
+                self.resumable_uri = f"fake://upload/{len(service.sessions)}"
+                service.sessions[self.resumable_uri] = 0
+            service.chunks += 1
+            if service.crash_after_chunks is not None and service.chunks > service.crash_after_chunks:
+                service.crash_after_chunks = None
+                raise SimulatedCrash()
+            failed = service.random.random() < service.fail_rate
+        if failed:
+            raise ConnectionError("simulated network error")
+        chunk_size = self.media_body.chunksize()
+        chunk_size = total if chunk_size in (None, -1) else chunk_size
+        received = len(self.media_body.getbytes(self.resumable_progress, chunk_size))
+        self.resumable_progress += received
+        with service.lock:
+            service.sessions[self.resumable_uri] = self.resumable_progress
+            service.bytes_received += received
+            if self.resumable_progress < total:
+                return MediaUploadProgress(self.resumable_progress, total), None
+            service.uploads[main.file_sha256(self.media_body._filename)] += 1
+            service.finished[self.resumable_uri] = {'id': f"local-video-{self.resumable_uri.rsplit('/', 1)[1]}"}
+        return None, service.finished[self.resumable_uri]
+
+
+class FakeInstagramClient:
+    """Local stand-in for a logged-in instagrapi Client; counts uploads per file and can fail at random."""
+
+    def __init__(self, fail_rate=0.0, seed=1):
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.uploads = Counter()
+
+    def video_upload(self, path, caption, **kwargs):
+        if self.random.random() < self.fail_rate:
+            raise ConnectionError("simulated network error")
+        with open(path, "rb") as f:
+            while f.read(1024 * 1024):
+                pass
+        self.uploads[main.file_sha256(path)] += 1
+        return SimpleNamespace(id=f"local-media-{sum(self.uploads.values())}")
+
+    def media_comment(self, media_id, text):
+        if self.random.random() < self.fail_rate:
+            raise ConnectionError("simulated network error")
+        return SimpleNamespace(pk="local-comment-id")
+
+
+def run_pipeline_once(story_text, work_dir, background_video_path=None, backend=None):
+    """Runs TTS -> subtitles -> render -> uploads for one story with the local stand-ins."""
+    audio_path = os.path.join(work_dir, f"audio{main.TTS_AUDIO_EXTENSION}")
+    video_path = os.path.join(work_dir, "video.mp4")
+    if not main.text_to_speech_elevenlabs(story_text, audio_path, with_timestamps=True,
+                                          client=FakeElevenLabsClient()):
+        return False
+    segments = main.get_subtitle_segments(audio_path, story_text)
+    if not segments:
+        return False
+    if not main.create_styled_subtitle_video(audio_path, segments, output_path=video_path,
+                                             background_video_path=background_video_path, backend=backend):
+        return False
+    main.OUTBOX_DIR = os.path.join(work_dir, "outbox")
+    results = main.publish_video(video_path, {'title': "Benchmark", 'description': "", 'tags': []},
+                                 {'caption': "Benchmark"},
+                                 clients={'youtube': FakeYouTubeService(), 'instagram': FakeInstagramClient()})
+    return all(results.values())
+
+
+def _stage_totals(records):
+    """Sums wall seconds per (story, stage)."""
+    totals = {}
+    for record in records:
+        key = (record.get('story'), record['stage'])
+        totals[key] = totals.get(key, 0.0) + record['wall_seconds']
+    return totals
+
+
+def compare_reports(records, baseline_records, tolerance):
+    """Returns [(story, stage, baseline seconds, seconds)] for stages slower than baseline * (1 + tolerance)."""
+    current = _stage_totals(records)
+    baseline = _stage_totals(baseline_records)
+    regressions = []
+    for key, seconds in sorted(current.items(), key=lambda item: str(item[0])):
+        # Ignore very short stages, their timings are mostly noise
+        if key in baseline and baseline[key] >= 0.05 and seconds > baseline[key] * (1 + tolerance):
+            regressions.append((key[0], key[1], baseline[key], seconds))
+    return regressions
+
+
+def run_pipeline(args):
+    main.ARTIFACT_CACHE_ENABLED = False # Every stage has to do its real work
+    records = []
+    for duration in args.sizes:
+        label = f"{duration:g}s"
+        print(f"\n=== Pipeline benchmark: {label} story ===")
+        main.reset_stage_metrics()
+        with tempfile.TemporaryDirectory() as work_dir:
+            with main.instrument_stage("pipeline_total") as record:
+                record['ok'] = run_pipeline_once(make_test_story(duration), work_dir, args.background, args.backend)
+        for record in main.get_stage_metrics():
+            record['story'] = label
+            records.append(record)
+
+    print(f"\n{'story':<8} {'stage':<18} {'wall s':>9} {'cpu s':>9} {'rss MB':>9} {'fps':>8}")
+    for record in records:
+        print(f"{record['story']:<8} {record['stage']:<18} {record['wall_seconds']:>9.2f} "
+              f"{record['cpu_seconds']:>9.2f} {record['peak_rss_mb'] or 0:>9.1f} {record.get('fps', ''):>8}")
+    main.write_metrics_report(args.report, records)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline_records = json.load(f)
+        regressions = compare_reports(records, baseline_records, args.tolerance)
+        for story, stage, before, after in regressions:
+            print(f"REGRESSION {story} {stage}: {before:.2f}s -> {after:.2f}s")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage slower than the baseline by more than {args.tolerance:.0%}.")
+
+
+def time_python(argv, repeat):
+    """Median wall seconds of `python <argv>` in a fresh interpreter."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *argv], check=True, stdout=subprocess.DEVNULL,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def run_imports(args):
+    main_path = os.path.abspath(main.__file__)
+    cases = [
+        ("python (empty)", ["-c", "pass"]),
+        ("import main", ["-c", "import main"]),
+    ]
+    for command in ("tts", "transcribe", "render", "upload-youtube", "upload-instagram", "run"):
+        cases.append((f"main.py {command} --help", [main_path, command, "--help"]))
+    cases.append(("all heavy imports", ["-c", "import " + ", ".join(
+        ["moviepy.editor", "whisper", "numpy", "PIL.Image", "elevenlabs.client", "googleapiclient.discovery",
+         "google_auth_oauthlib.flow", "instagrapi"])]))
+
+    print(f"{'command':<32} {'median ms':>10}")
+    timings = {}
+    for label, argv in cases:
+        timings[label] = time_python(argv, args.repeat)
+        print(f"{label:<32} {timings[label] * 1000:>10.0f}")
+
+    check = ("import sys, main; print(','.join(m for m in %r if m in sys.modules))" % (HEAVY_MODULES,))
+    loaded = subprocess.run([sys.executable, "-c", check], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(main_path)).stdout.strip()
+    failed = False
+    if loaded:
+        print(f"FAIL: `import main` loaded heavy modules: {loaded}")
+        failed = True
+    if timings["import main"] * 1000 > args.budget_ms:
+        print(f"FAIL: `import main` took {timings['import main'] * 1000:.0f} ms (budget {args.budget_ms:.0f} ms)")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("`import main` loads no heavy dependencies and is within budget.")
+
+
+def run_transcribe(args):
+    main.ARTIFACT_CACHE_ENABLED = False
+    timings = {}
+    for workers in args.workers:
+        main.LONG_AUDIO_WORKERS = workers
+        main.LONG_AUDIO_SECONDS = 0 if workers > 1 else float("inf")
+        if workers > 1:
+            # Start the pool (and load the models) outside the timing, like a long-running process would
+            main._get_long_audio_pool(workers, main.WHISPER_MODEL_NAME, main._resolve_whisper_device(),
+                                      main._resolve_whisper_precision(main._resolve_whisper_device())).submit(int).result()
+        start = time.perf_counter()
+        words = main.transcribe_audio_to_words(args.audio)
+        timings[workers] = (time.perf_counter() - start, len(words))
+
+    print(f"\n{'workers':>8} {'seconds':>10} {'speedup':>10} {'words':>8}")
+    baseline = timings[args.workers[0]][0]
+    for workers, (seconds, word_count) in timings.items():
+        print(f"{workers:>8} {seconds:>10.1f} {baseline / seconds:>9.2f}x {word_count:>8}")
+
+
+def run_uploads(args):
+    """
+    Drains an outbox of --videos files to both fake targets with random failures and one
+    simulated crash, then checks that every video reached every target exactly once.
+    """
+    main.UPLOAD_RETRY_BACKOFF = 0.05
+    main.UPLOAD_MAX_ATTEMPTS = 20
+    main.YOUTUBE_UPLOAD_CHUNK_SIZE = 256 * 1024
+    youtube = FakeYouTubeService(fail_rate=args.fail_rate, crash_after_chunks=args.crash_after)
+    instagram = FakeInstagramClient(fail_rate=args.fail_rate)
+    clients = {'youtube': youtube, 'instagram': instagram}
+    with tempfile.TemporaryDirectory() as work_dir:
+        main.OUTBOX_DIR = os.path.join(work_dir, "outbox")
+        video_paths = []
+        for i in range(args.videos):
+            path = os.path.join(work_dir, f"video_{i:03d}.mp4")
+            with open(path, "wb") as f:
+                f.write(os.urandom(int(args.size_mb * 1024 * 1024)))
+            video_paths.append(path)
+
+        start = time.perf_counter()
+        for path in video_paths:
+            main.enqueue_upload(path, 'youtube', {'title': os.path.basename(path), 'description': "", 'tags': []})
+            main.enqueue_upload(path, 'instagram', {'caption': os.path.basename(path)})
+        try:
+            main.drain_outbox(clients=clients)
+        except SimulatedCrash:
+            print(f"Simulated crash after {args.crash_after} YouTube chunks; restarting from the outbox on disk...")
+            main.drain_outbox(clients=clients)
+        # Publishing again must not upload anything a second time
+        for path in video_paths:
+            main.publish_video(path, {'title': os.path.basename(path), 'description': "", 'tags': []},
+                               {'caption': os.path.basename(path)}, clients=clients)
+        seconds = time.perf_counter() - start
+        entries = main.load_outbox_entries()
+
+    total_bytes = int(args.size_mb * 1024 * 1024) * args.videos
+    print(f"\n{args.videos} videos x 2 targets in {seconds:.2f}s")
+    print(f"outbox: {sum(entry['status'] == 'done' for entry in entries)}/{len(entries)} done, "
+          f"{sum(entry['attempts'] for entry in entries)} attempts")
+    print(f"youtube: {sum(youtube.uploads.values())} uploads, {youtube.resumed} resumed sessions, "
+          f"{youtube.bytes_received / max(total_bytes, 1):.2f}x the video bytes sent")
+    print(f"instagram: {sum(instagram.uploads.values())} uploads")
+    duplicates = [sha for counter in (youtube.uploads, instagram.uploads) for sha, count in counter.items() if count > 1]
+    missing = args.videos * 2 - len(youtube.uploads) - len(instagram.uploads)
+    if duplicates or missing:
+        print(f"FAIL: {len(duplicates)} duplicate uploads, {missing} videos missing on a target")
+        sys.exit(1)
+    print("Every video reached every target exactly once.")
+
+
+def benchmark_backends(audio_path, segments, background_video_path=None, backends=("moviepy", "ffmpeg")):
+    """
+    Renders the same input once per backend and returns {backend: seconds}.
+    "static" is the static-background fast path; the other backends run with it turned off.
+    """
+    timings = {}
+    fast_path = main.STATIC_BACKGROUND_FAST_PATH
+    with tempfile.TemporaryDirectory() as work_dir:
+        for backend in backends:
+            output_path = os.path.join(work_dir, f"{backend}.mp4")
+            main.STATIC_BACKGROUND_FAST_PATH = backend == "static"
+            start = time.perf_counter()
+            ok = main.create_styled_subtitle_video(audio_path, segments, output_path=output_path,
+                                                   background_video_path=background_video_path,
+                                                   backend=None if backend == "static" else backend)
+            timings[backend] = time.perf_counter() - start if ok else None
+            if ok:
+                print(f"{backend}: {os.path.getsize(output_path) / 1e6:.2f} MB")
+    main.STATIC_BACKGROUND_FAST_PATH = fast_path
+    return timings
+
+
+def run_backends(args):
+    with tempfile.TemporaryDirectory() as work_dir:
+        audio_path = args.audio or make_test_audio(os.path.join(work_dir, "audio.mp3"), args.duration)
+        if args.segments:
+            with open(args.segments, encoding="utf-8") as f:
+                segments = json.load(f)
+        else:
+            segments = make_test_segments(main.audio_duration(audio_path))
+        timings = benchmark_backends(audio_path, segments, args.background, args.backend)
+
+    print(f"\n{'backend':<10} {'seconds':>10} {'speedup':>10}")
+    baseline = timings.get(args.backend[0])
+    for backend, seconds in timings.items():
+        if seconds is None:
+            print(f"{backend:<10} {'failed':>10}")
+            continue
+        speedup = f"{baseline / seconds:.2f}x" if baseline else "-"
+        print(f"{backend:<10} {seconds:>10.2f} {speedup:>10}")
+
+
+def run_variants(args):
+    main.ARTIFACT_CACHE_ENABLED = False
+    with tempfile.TemporaryDirectory() as work_dir:
+        audio_path = args.audio or make_test_audio(os.path.join(work_dir, "audio.mp3"), args.duration)
+        segments = make_test_segments(main.audio_duration(audio_path))
+        timings = {}
+        for mode in ("separate", "single pass"):
+            variants = [{'name': name, 'path': os.path.join(work_dir, f"{mode[0]}_{name}.mp4")} for name in args.variant]
+            start = time.perf_counter()
+            if mode == "separate":
+                ok = all(main.render_video_variants(audio_path, segments, [variant], args.background) for variant in variants)
+            else:
+                ok = main.render_video_variants(audio_path, segments, variants, args.background)
+            timings[mode] = time.perf_counter() - start if ok else None
+
+    print(f"\n{'mode':<12} {'seconds':>10} {'speedup':>10}")
+    baseline = timings["separate"]
+    for mode, seconds in timings.items():
+        if seconds is None:
+            print(f"{mode:<12} {'failed':>10}")
+            continue
+        speedup = f"{baseline / seconds:.2f}x" if baseline else "-"
+        print(f"{mode:<12} {seconds:>10.2f} {speedup:>10}")
+
+
+# Runs one render in a fresh interpreter and prints the peak RSS of the process and its children
+MEMORY_PROBE = """
+import json, resource, sys
+import main
+audio_path, segments_path, output_path, backend, background, width, height = sys.argv[1:]
+main.STATIC_BACKGROUND_FAST_PATH = False # Measure the frame-by-frame renderers
+main.STREAM_RENDER_SECONDS = float("inf") # "moviepy" means the MoviePy path at any length
+main.ARTIFACT_CACHE_ENABLED = False
+with open(segments_path, encoding="utf-8") as f:
+    segments = json.load(f)
+ok = main.create_styled_subtitle_video(audio_path, segments, output_path=output_path,
+                                       video_size=(int(width), int(height)),
+                                       background_video_path=background or None, backend=backend)
+scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+print(json.dumps({'ok': ok,
+                  'python_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+                  'children_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale}))
+"""
+
+
+def run_memory(args):
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    rows = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for duration in args.durations:
+            audio_path = make_test_audio(os.path.join(work_dir, f"audio_{duration:g}.mp3"), duration)
+            segments_path = os.path.join(work_dir, f"segments_{duration:g}.json")
+            with open(segments_path, "w", encoding="utf-8") as f:
+                json.dump(make_test_segments(duration), f)
+            for backend in args.backend:
+                output_path = os.path.join(work_dir, f"{backend}_{duration:g}.mp4")
+                start = time.perf_counter()
+                result = subprocess.run(
+                    [sys.executable, "-c", MEMORY_PROBE, audio_path, segments_path, output_path, backend,
+                     args.background or "", str(width), str(height)],
+                    capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+                seconds = time.perf_counter() - start
+                try:
+                    probe = json.loads(result.stdout.strip().splitlines()[-1])
+                except (IndexError, ValueError):
+                    probe = {'ok': False}
+                if not probe['ok']:
+                    print(f"{backend} {duration:g}s failed:\n{result.stdout[-1000:]}{result.stderr[-1000:]}")
+                rows.append((backend, duration, probe, seconds))
+
+    print(f"\n{'backend':<10} {'seconds':>8} {'wall s':>8} {'python MB':>10} {'children MB':>12}")
+    for backend, duration, probe, seconds in rows:
+        if not probe['ok']:
+            print(f"{backend:<10} {duration:>8g} {'failed':>8}")
+            continue
+        print(f"{backend:<10} {duration:>8g} {seconds:>8.1f} {probe['python_mb']:>10.1f} {probe['children_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks for the podcast video pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backends_parser = subparsers.add_parser("backends", help="Compare render backends on the same input.")
+    backends_parser.add_argument("--audio", help="Audio file to render (default: generated tone).")
+    backends_parser.add_argument("--duration", type=float, default=30, help="Length of the generated tone in seconds.")
+    backends_parser.add_argument("--background", help="Background video (default: solid colour).")
+    backends_parser.add_argument("--segments", help="JSON file with [{'text','start','end'}, ...] segments.")
+    backends_parser.add_argument("--backend", action="append", default=None,
+                                 help="Backend to include: moviepy, ffmpeg, parallel or static "
+                                      "(repeatable, default: moviepy, ffmpeg, and static without --background).")
+    backends_parser.set_defaults(func=run_backends)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="Run the whole pipeline offline on synthetic stories.")
+    pipeline_parser.add_argument("--sizes", type=float, nargs="+", default=[30, 180, 900],
+                                 help="Story lengths in seconds (default: 30 180 900).")
+    pipeline_parser.add_argument("--background", help="Background video (default: solid colour).")
+    pipeline_parser.add_argument("--backend", help="Render backend (default: RENDER_BACKEND).")
+    pipeline_parser.add_argument("--report", default="bench_report.json", help="Metrics report path (.json or .csv).")
+    pipeline_parser.add_argument("--compare", help="Baseline .json report to check for regressions.")
+    pipeline_parser.add_argument("--tolerance", type=float, default=0.2,
+                                 help="Allowed slowdown per stage before it counts as a regression (default: 0.2).")
+    pipeline_parser.set_defaults(func=run_pipeline)
+
+    transcribe_parser = subparsers.add_parser("transcribe", help="Long-audio transcription scaling across worker processes.")
+    transcribe_parser.add_argument("--audio", required=True, help="A long narration (several minutes).")
+    transcribe_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                                   help="Worker counts to compare (default: 1 2 4).")
+    transcribe_parser.set_defaults(func=run_transcribe)
+
+    uploads_parser = subparsers.add_parser("uploads", help="Drain an outbox against fake endpoints with failures.")
+    uploads_parser.add_argument("--videos", type=int, default=50, help="Number of videos (default: 50).")
+    uploads_parser.add_argument("--size-mb", type=float, default=2, help="Size of each video in MB (default: 2).")
+    uploads_parser.add_argument("--fail-rate", type=float, default=0.1, help="Chance that a request fails (default: 0.1).")
+    uploads_parser.add_argument("--crash-after", type=int, default=100,
+                                help="Simulate a crash after this many YouTube chunks (default: 100).")
+    uploads_parser.set_defaults(func=run_uploads)
+
+    imports_parser = subparsers.add_parser("imports", help="Measure CLI start-up time per subcommand.")
+    imports_parser.add_argument("--repeat", type=int, default=5, help="Runs per command (median is reported).")
+    imports_parser.add_argument("--budget-ms", type=float, default=500, help="Maximum time for `import main`.")
+    imports_parser.set_defaults(func=run_imports)
+
+    variants_parser = subparsers.add_parser("variants", help="Separate renders per output format vs one branched render.")
+    variants_parser.add_argument("--audio", help="Audio file to render (default: generated tone).")
+    variants_parser.add_argument("--duration", type=float, default=30, help="Length of the generated tone in seconds.")
+    variants_parser.add_argument("--background", help="Background video (default: solid colour).")
+    variants_parser.add_argument("--variant", nargs="+", default=list(main.OUTPUT_VARIANTS),
+                                 help=f"Variants to render (default: {' '.join(main.OUTPUT_VARIANTS)}).")
+    variants_parser.set_defaults(func=run_variants)
+
+    memory_parser = subparsers.add_parser("memory", help="Peak RSS of a render as the narration gets longer.")
+    memory_parser.add_argument("--durations", type=float, nargs="+", default=[30, 300, 900],
+                               help="Narration lengths in seconds (default: 30 300 900).")
+    memory_parser.add_argument("--backend", action="append", default=None,
+                               help="Backend to measure (repeatable, default: stream and moviepy).")
+    memory_parser.add_argument("--background", help="Background video (default: solid colour).")
+    memory_parser.add_argument("--size", default="1080x1920", help="Video size WxH (default: 1080x1920).")
+    memory_parser.set_defaults(func=run_memory)
+
+    args = parser.parse_args()
+    if args.command == "backends" and args.backend is None:
+        args.backend = ["moviepy", "ffmpeg"] if args.background else ["moviepy", "ffmpeg", "static"]
+    elif args.command == "memory" and args.backend is None:
+        args.backend = ["stream", "moviepy"]
+    args.func(args)
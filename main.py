@@ -1,28 +1,59 @@
 # filepath: /Users/borna/Documents/borna_projects/podcast-new/main.py
-from moviepy.editor import (AudioFileClip, ColorClip, CompositeVideoClip,
-                            TextClip, VideoFileClip) # VideoFileClip is correctly part of this import
-import whisper # Added import for Whisper
+# Heavy dependencies (moviepy, whisper/torch, numpy, Pillow, the API clients) are imported
+# inside the functions that need them, so each CLI stage only loads what it uses.
+import argparse
+import atexit
+import base64
+import bisect
+import csv
+import functools
+import hashlib
+import io
+import json
+import math
 import os # Already imported below, but good to have at top if used globally
+import queue
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
 import time # For potential delays
+import urllib.error
+import urllib.request
+import uuid
+import wave
+from array import array
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from dotenv import load_dotenv
-from elevenlabs.client import ElevenLabs # New import for the main client
-from elevenlabs import Voice, VoiceSettings # Voice and VoiceSettings are often here or under elevenlabs.types
-
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from instagrapi import Client
-from instagrapi.types import Usertag, Location
 
 # Load environment variables from .env file
 load_dotenv()
 
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "EXAVITQu4vr4xnSDxMaL") # Default voice if not set
+ELEVENLABS_MODEL_ID = os.getenv("ELEVENLABS_MODEL_ID", "eleven_multilingual_v2") # Or other models like "eleven_mono_v1", "eleven_turbo_v2"
+ELEVENLABS_VOICE_SETTINGS = {
+    "stability": 0.71,
+    "similarity_boost": 0.5,
+    "style": 0.0,
+    "use_speaker_boost": True,
+    "speed": 1.1, # Speed of speech (1.0 is normal speed)
+}
+# Set to e.g. "pcm_44100" to get lossless PCM from ElevenLabs (saved as .wav), so the only lossy
+# step is the final AAC encode; unset = the API default (MP3)
+ELEVENLABS_OUTPUT_FORMAT = os.getenv("ELEVENLABS_OUTPUT_FORMAT")
+TTS_AUDIO_EXTENSION = ".wav" if (ELEVENLABS_OUTPUT_FORMAT or "").startswith("pcm_") else ".mp3"
 INSTAGRAM_USERNAME = os.getenv("INSTAGRAM_USERNAME")
 INSTAGRAM_PASSWORD = os.getenv("INSTAGRAM_PASSWORD")
+INSTAGRAM_SESSION_FILE = "instagram_session.json"
 
 # API key for ElevenLabs is now typically passed when initializing the client, so direct set_api_key might not be needed at global scope
 # if ELEVENLABS_API_KEY:
@@ -36,52 +67,479 @@ SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
 API_SERVICE_NAME = "youtube"
 API_VERSION = "v3"
 
-def text_to_speech_elevenlabs(text, output_path="generated_audio.mp3"):
+# Whisper settings
+WHISPER_MODEL_NAME = os.getenv("WHISPER_MODEL", "base") # "tiny", "base", "small", "medium", "large"
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE") # e.g. "cpu" or "cuda"; unset = CUDA when available
+WHISPER_PRECISION = os.getenv("WHISPER_PRECISION") # "fp16" or "fp32"; unset = fp16 on GPU, fp32 on CPU
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "0")) # torch threads per transcription, 0 = automatic
+WHISPER_CONCURRENCY = int(os.getenv("WHISPER_CONCURRENCY", "1")) # Transcriptions expected to run at once on this box
+# Long audio is split at silences into pieces that are transcribed in parallel worker processes
+LONG_AUDIO_SECONDS = float(os.getenv("LONG_AUDIO_SECONDS", "300")) # Audio longer than this uses the long-audio mode
+LONG_AUDIO_PIECE_SECONDS = float(os.getenv("LONG_AUDIO_PIECE_SECONDS", "60")) # Target piece length
+LONG_AUDIO_OVERLAP = 1.0 # Seconds of audio shared by neighbouring pieces
+# Worker processes, 0 = one per core. Batch and daemon workers never start their own pool (see _long_audio_workers)
+LONG_AUDIO_WORKERS = int(os.getenv("LONG_AUDIO_WORKERS", "0"))
+_long_audio_pool = None
+_long_audio_pool_key = None
+_long_audio_pool_lock = threading.Lock()
+
+# --- Parameters for grouping words into subtitles ---
+# Max words to join in a single subtitle line
+MAX_WORDS_PER_SUBTITLE = 1 # Changed from 3 to 1 for single word display
+# Max duration for a single subtitle line (in seconds)
+MAX_DURATION_PER_SUBTITLE = 2.0
+# If the gap between words is larger than this (in seconds), force a new subtitle
+MIN_GAP_TO_FORCE_SPLIT = 0.3
+
+# Where subtitle timings come from: "align" uses the known script (TTS character timestamps, else
+# forced alignment against the audio) and falls back to Whisper; "whisper" always transcribes
+SUBTITLE_TIMING_MODE = os.getenv("SUBTITLE_TIMING_MODE", "align")
+
+# Loaded Whisper models, keyed by (model name, device, precision), shared by every call in this process
+_whisper_models = {}
+_whisper_models_lock = threading.Lock()
+
+# Per-stage timing/resource records; written to METRICS_REPORT (.json or .csv) at the end of a run if set
+METRICS_REPORT_PATH = os.getenv("METRICS_REPORT")
+_stage_metrics = []
+_stage_metrics_lock = threading.Lock()
+
+# Content-addressed cache of stage outputs (TTS audio, subtitle segments, rendered videos)
+ARTIFACT_CACHE_ENABLED = os.getenv("ARTIFACT_CACHE", "1") != "0"
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", ".cache/artifacts")
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(5 * 1024 ** 3))) # 5 GB
+FILE_HASH_INDEX_MAX_ENTRIES = 2000 # Remembered file hashes; files that no longer exist are dropped first
+_artifact_cache_lock = threading.Lock()
+_file_hash_index = {}
+_audio_buffer_dir = None # Decoded audio buffers when the artifact cache is disabled, removed at exit
+
+# Batch mode: workers per pipeline stage and the size of each stage's input queue
+BATCH_TTS_WORKERS = int(os.getenv("BATCH_TTS_WORKERS", "4"))
+BATCH_TRANSCRIBE_WORKERS = int(os.getenv("BATCH_TRANSCRIBE_WORKERS", "1"))
+BATCH_RENDER_WORKERS = int(os.getenv("BATCH_RENDER_WORKERS", "2"))
+BATCH_UPLOAD_WORKERS = int(os.getenv("BATCH_UPLOAD_WORKERS", "4"))
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "4"))
+DEFAULT_BACKGROUND_VIDEO = "assets/video/minecraft_gameplay.mp4"
+
+# Daemon mode: a local HTTP API in front of worker processes that keep models and API clients warm
+DAEMON_HOST = os.getenv("DAEMON_HOST", "127.0.0.1")
+DAEMON_PORT = int(os.getenv("DAEMON_PORT", "8765"))
+DAEMON_WORKERS = int(os.getenv("DAEMON_WORKERS", "1")) # Each worker holds its own Whisper model
+DAEMON_JOBS_PER_WORKER = int(os.getenv("DAEMON_JOBS_PER_WORKER", "20")) # Recycle a worker after this many jobs
+DAEMON_DIR = ".daemon" # Cancellation markers shared between the daemon and its workers
+_daemon_clients = {} # Warm API clients of a daemon worker process
+
+# Uploads go through a disk-backed outbox (one JSON file per video and target) and are retried
+# with exponential backoff; YouTube uploads are resumable in chunks of YOUTUBE_UPLOAD_CHUNK_SIZE
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", "output/outbox")
+YOUTUBE_UPLOAD_CHUNK_SIZE = int(os.getenv("YOUTUBE_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024))) # Multiple of 256 KiB
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", "5"))
+UPLOAD_RETRY_BACKOFF = float(os.getenv("UPLOAD_RETRY_BACKOFF", "30")) # Seconds before the first retry, doubled after each
+_upload_target_limits = { # Concurrent uploads per target; instagrapi clients aren't thread-safe
+    'youtube': threading.Semaphore(int(os.getenv("UPLOAD_YOUTUBE_CONCURRENCY", "2"))),
+    'instagram': threading.Semaphore(1),
+}
+_upload_clients = {} # One authenticated client per target for the life of the process
+_upload_clients_lock = threading.Lock()
+_outbox_lock = threading.Lock()
+# Pre-scaled copies of background videos, and where in them each render starts:
+# "random", "seeded" (same audio -> same offset) or a fixed number of seconds; random renders are not cached
+BACKGROUND_PROXY_DIR = os.getenv("BACKGROUND_PROXY_DIR", "assets/video/proxies")
+BACKGROUND_OFFSET = os.getenv("BACKGROUND_OFFSET", "random")
+
+# Long stories are split at sentence boundaries and synthesised in concurrent chunks
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "1500"))
+TTS_CHUNK_CONCURRENCY = int(os.getenv("TTS_CHUNK_CONCURRENCY", "3"))
+TTS_CHUNK_RETRIES = int(os.getenv("TTS_CHUNK_RETRIES", "3"))
+TTS_RETRY_BACKOFF = 2.0 # Seconds before the first retry, doubled on each further attempt
+# Words that end with a period without ending the sentence (lowercase, without the period)
+SENTENCE_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "e.g", "i.e", "approx", "u.s"}
+
+# Audio is decoded once into a shared mono float32 buffer at this rate (a multiple of Whisper's 16 kHz)
+AUDIO_BUFFER_RATE = 48000
+WHISPER_SAMPLE_RATE = 16000
+
+# Subtitle style constants (shared by every render path)
+SUBTITLE_FONT = os.getenv("SUBTITLE_FONT", "Impact") # Font name or path to a .ttf/.otf file
+SUBTITLE_FONTSIZE = 100
+SUBTITLE_COLOR = "white"
+SUBTITLE_STROKE_COLOR = "black"
+SUBTITLE_STROKE_WIDTH = 5
+SUBTITLE_WIDTH_RATIO = 0.85 # Text width is 85% of video width
+# Rendered subtitle images are kept in memory (LRU) and optionally on disk between runs
+SUBTITLE_CACHE_SIZE = int(os.getenv("SUBTITLE_CACHE_SIZE", "512"))
+SUBTITLE_CACHE_DIR = os.getenv("SUBTITLE_CACHE_DIR") # e.g. ".cache/subtitles", unset = memory only
+
+# Video render settings
+VIDEO_FPS = 60
+BACKGROUND_COLOR = (30, 30, 30) # Dark grey, used when there is no background video
+# "moviepy" composites frames in Python; "ffmpeg" burns ASS subtitles in a single ffmpeg pass;
+# "stream" composites frames in Python in bounded memory (see render_video_streaming)
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "moviepy")
+# Number of processes for the MoviePy backend; more than 1 renders the timeline in parallel chunks
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "1"))
+# Single-process MoviePy renders of audio longer than this (seconds) use the streaming renderer,
+# whose memory use does not grow with the length of the video
+STREAM_RENDER_SECONDS = float(os.getenv("STREAM_RENDER_SECONDS", "600"))
+STREAM_CAPTION_CACHE_SIZE = 32 # Caption images the streaming renderer keeps around the current time
+# With no background video (solid colour) or a still image as background, encode only the frames
+# where the captions change, each shown for its duration (variable frame rate)
+STATIC_BACKGROUND_FAST_PATH = os.getenv("STATIC_BACKGROUND_FAST_PATH", "1") == "1"
+STILL_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+# Output variants that render_video_variants can produce from one decode. Caption size and stroke
+# scale with the shorter side unless a variant sets its own 'caption_layout'.
+OUTPUT_VARIANTS = {
+    'vertical': {'size': (1080, 1920), 'fps': VIDEO_FPS, 'codec': "libx264", 'crf': 20, 'preset': "medium"},
+    'square': {'size': (1080, 1080), 'fps': VIDEO_FPS, 'codec': "libx264", 'crf': 20, 'preset': "medium"},
+    'landscape': {'size': (1920, 1080), 'fps': VIDEO_FPS, 'codec': "libx264", 'crf': 20, 'preset': "medium",
+                  'caption_layout': {'alignment': 2, 'margin_v': 120}}, # Bottom centre, clear of the action
+    'preview': {'size': (360, 640), 'fps': 30, 'codec': "libx264", 'crf': 30, 'preset': "veryfast"},
+}
+
+@contextmanager
+def instrument_stage(stage, **details):
+    """
+    Records wall time, CPU time (this process plus finished child processes such as ffmpeg),
+    peak RSS and, if the block sets record['frames'], frames per second for a pipeline stage.
+    Yields the record so the block can add fields (e.g. 'ok', 'frames').
+    """
+    record = {'stage': stage, **details}
+    wall_start = time.perf_counter()
+    cpu_start = _cpu_seconds()
+    try:
+        yield record
+    finally:
+        record['wall_seconds'] = round(time.perf_counter() - wall_start, 4)
+        record['cpu_seconds'] = round(_cpu_seconds() - cpu_start, 4)
+        record['peak_rss_mb'] = _peak_rss_mb()
+        if record.get('frames') and record['wall_seconds'] > 0:
+            record['fps'] = round(record['frames'] / record['wall_seconds'], 2)
+        with _stage_metrics_lock:
+            _stage_metrics.append(record)
+
+def instrumented(stage):
+    """Decorator form of instrument_stage; record['ok'] is set from the function's return value."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with instrument_stage(stage) as record:
+                result = fn(*args, **kwargs)
+                record['ok'] = bool(result)
+                return result
+        return wrapper
+    return decorator
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def _peak_rss_mb():
+    """Peak resident set size of this process and its waited-for children, in MB (None on Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def get_stage_metrics():
+    """Returns a copy of the stage records collected so far in this process."""
+    with _stage_metrics_lock:
+        return [dict(record) for record in _stage_metrics]
+
+def reset_stage_metrics():
+    with _stage_metrics_lock:
+        _stage_metrics.clear()
+
+def write_metrics_report(path=None, records=None):
+    """Writes the stage records to a .json or .csv file (by extension). Returns the path."""
+    path = path or METRICS_REPORT_PATH
+    records = get_stage_metrics() if records is None else records
+    if path.endswith(".csv"):
+        columns = []
+        for record in records:
+            columns += [key for key in record if key not in columns]
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(records)
+        data = buffer.getvalue()
+    else:
+        data = json.dumps(records, indent=2)
+    _atomic_write_bytes(path, data.encode("utf-8"))
+    print(f"Metrics report saved to {path}")
+    return path
+
+def content_hash(*parts):
+    """SHA-256 of the JSON form of `parts`; used as the key of cached artifacts."""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def file_sha256(path):
+    """
+    SHA-256 of a file's contents. Results are remembered by (path, size, mtime) in the cache
+    directory, so a large background video is only read once. The index keeps one entry per
+    path and forgets files that no longer exist (temporary chunks, deleted outputs).
+    """
+    stat = os.stat(path)
+    index_key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    index_path = os.path.join(ARTIFACT_CACHE_DIR, "file_hashes.json")
+    with _artifact_cache_lock:
+        if not _file_hash_index and os.path.exists(index_path):
+            try:
+                with open(index_path, encoding="utf-8") as f:
+                    _file_hash_index.update((key, value) for key, value in json.load(f).items()
+                                            if os.path.exists(key.rsplit("|", 2)[0]))
+            except Exception as e:
+                print(f"Could not read file hash index: {e}")
+        if index_key in _file_hash_index:
+            return _file_hash_index[index_key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    file_hash = digest.hexdigest()
+
+    with _artifact_cache_lock:
+        path_prefix = f"{os.path.abspath(path)}|"
+        for key in [key for key in _file_hash_index if key.startswith(path_prefix)]:
+            del _file_hash_index[key] # Older versions of the same file
+        _file_hash_index[index_key] = file_hash
+        if len(_file_hash_index) > FILE_HASH_INDEX_MAX_ENTRIES:
+            for key in [key for key in _file_hash_index if not os.path.exists(key.rsplit("|", 2)[0])]:
+                del _file_hash_index[key]
+            while len(_file_hash_index) > FILE_HASH_INDEX_MAX_ENTRIES:
+                del _file_hash_index[next(iter(_file_hash_index))] # Oldest first
+        if ARTIFACT_CACHE_ENABLED:
+            try:
+                _atomic_write_bytes(index_path, json.dumps(_file_hash_index).encode("utf-8"))
+            except Exception as e:
+                print(f"Could not write file hash index: {e}")
+    return file_hash
+
+def _atomic_write_bytes(path, data):
+    """Writes data to path via a temporary file and os.replace, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _atomic_copy(src_path, dst_path):
+    """Copies src_path to dst_path atomically (temporary file in the destination directory + os.replace)."""
+    os.makedirs(os.path.dirname(dst_path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst_path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _artifact_path(kind, key, suffix=""):
+    return os.path.join(ARTIFACT_CACHE_DIR, kind, f"{key}{suffix}")
+
+def cache_get_file(kind, key, dst_path, suffix=""):
+    """Copies the cached artifact to dst_path and returns True, or returns False on a miss."""
+    if not ARTIFACT_CACHE_ENABLED:
+        return False
+    path = _artifact_path(kind, key, suffix)
+    if not os.path.exists(path):
+        return False
+    try:
+        os.utime(path) # Mark as recently used for eviction
+        _atomic_copy(path, dst_path)
+        return True
+    except Exception as e:
+        print(f"Could not read cached {kind} artifact: {e}")
+        return False
+
+def cache_put_file(kind, key, src_path, suffix=""):
+    """Stores a copy of src_path in the cache under (kind, key)."""
+    if not ARTIFACT_CACHE_ENABLED:
+        return
+    try:
+        _atomic_copy(src_path, _artifact_path(kind, key, suffix))
+        evict_artifact_cache()
+    except Exception as e:
+        print(f"Could not store {kind} artifact in cache: {e}")
+
+def cache_get_json(kind, key):
+    """Returns the cached JSON artifact, or None on a miss."""
+    if not ARTIFACT_CACHE_ENABLED:
+        return None
+    path = _artifact_path(kind, key, ".json")
+    if not os.path.exists(path):
+        return None
+    try:
+        os.utime(path)
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Could not read cached {kind} artifact: {e}")
+        return None
+
+def cache_put_json(kind, key, value):
+    """Stores a JSON-serialisable value in the cache under (kind, key)."""
+    if not ARTIFACT_CACHE_ENABLED:
+        return
+    try:
+        _atomic_write_bytes(_artifact_path(kind, key, ".json"), json.dumps(value).encode("utf-8"))
+        evict_artifact_cache()
+    except Exception as e:
+        print(f"Could not store {kind} artifact in cache: {e}")
+
+def evict_artifact_cache(max_bytes=None, cache_dir=None):
+    """Deletes the least recently used artifacts until the cache (ARTIFACT_CACHE_DIR by default) is below max_bytes."""
+    max_bytes = ARTIFACT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    cache_dir = cache_dir or ARTIFACT_CACHE_DIR
+    entries = []
+    total_bytes = 0
+    for kind in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+        kind_dir = os.path.join(cache_dir, kind)
+        if not os.path.isdir(kind_dir):
+            continue
+        for name in os.listdir(kind_dir):
+            path = os.path.join(kind_dir, name)
+            if name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_bytes += stat.st_size
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total_bytes -= size
+        except FileNotFoundError:
+            pass
+
+@instrumented("tts")
+def text_to_speech_elevenlabs(text, output_path="generated_audio.mp3", with_timestamps=False, client=None,
+                              previous_text=None, next_text=None):
     """
     Converts text to speech using ElevenLabs API and saves it to a file.
+    With with_timestamps=True the character-level timestamps are requested too and saved
+    next to the audio (see alignment_sidecar_path) for subtitle alignment.
+    previous_text/next_text give the surrounding text when `text` is one chunk of a longer story,
+    so the intonation flows across chunk boundaries.
+    A client can be passed in (e.g. a stub for offline testing); otherwise one is created.
+    Results are cached by (text, voice ID, model ID, voice settings), so an unchanged story
+    does not call the API again.
     """
-    if not ELEVENLABS_API_KEY:
+    from elevenlabs import VoiceSettings
+    from elevenlabs.client import ElevenLabs
+    sidecar_path = alignment_sidecar_path(output_path)
+    audio_suffix = os.path.splitext(output_path)[1]
+    audio_key = content_hash("tts", text, ELEVENLABS_VOICE_ID, ELEVENLABS_MODEL_ID,
+                             ELEVENLABS_VOICE_SETTINGS, with_timestamps, previous_text, next_text,
+                             ELEVENLABS_OUTPUT_FORMAT)
+    # Never leave character timestamps from an earlier run next to new audio
+    if os.path.exists(sidecar_path):
+        os.remove(sidecar_path)
+    if cache_get_file("audio", audio_key, output_path, audio_suffix):
+        alignment_data = cache_get_json("alignment", audio_key) if with_timestamps else None
+        if alignment_data:
+            _atomic_write_bytes(sidecar_path, json.dumps(alignment_data).encode("utf-8"))
+        print(f"Using cached audio for this text: {output_path}")
+        return True
+
+    if client is None and not ELEVENLABS_API_KEY:
         print("Cannot generate audio: ElevenLabs API key is not set.")
         return False
     
     try:
         # Initialize the ElevenLabs client with your API key
-        client = ElevenLabs(
-            api_key=ELEVENLABS_API_KEY
-        )
+        if client is None:
+            client = ElevenLabs(
+                api_key=ELEVENLABS_API_KEY
+            )
         print(f"Generating audio with ElevenLabs for text: '{text[:50]}...'")
         
         # Define voice settings
         # You can adjust these values as needed
-        voice_settings_obj = VoiceSettings(
-            stability=0.71,
-            similarity_boost=0.5,
-            style=0.0, 
-            use_speaker_boost=True,
-            speed=1.1  # Speed of speech (1.0 is normal speed)
-        )
+        voice_settings_obj = VoiceSettings(**ELEVENLABS_VOICE_SETTINGS)
+        context_kwargs = {}
+        if previous_text:
+            context_kwargs['previous_text'] = previous_text
+        if next_text:
+            context_kwargs['next_text'] = next_text
+        if ELEVENLABS_OUTPUT_FORMAT:
+            context_kwargs['output_format'] = ELEVENLABS_OUTPUT_FORMAT
 
-        # Generate audio using the client's text_to_speech.stream method
-        audio_stream = client.text_to_speech.stream(
-            text=text,
-            voice_id=ELEVENLABS_VOICE_ID,
-            model_id="eleven_multilingual_v2", # Or other models like "eleven_mono_v1", "eleven_turbo_v2"
-            voice_settings=voice_settings_obj
-        )
+        alignment_data = None
+        if with_timestamps:
+            # Same audio plus the start/end time of every character of the text
+            response = client.text_to_speech.convert_with_timestamps(
+                voice_id=ELEVENLABS_VOICE_ID,
+                text=text,
+                model_id=ELEVENLABS_MODEL_ID,
+                voice_settings=voice_settings_obj,
+                **context_kwargs
+            )
+            _write_tts_audio(output_path, base64.b64decode(response.audio_base_64))
+            alignment = response.alignment
+            if alignment is not None:
+                alignment_data = {
+                    'characters': list(alignment.characters),
+                    'character_start_times_seconds': list(alignment.character_start_times_seconds),
+                    'character_end_times_seconds': list(alignment.character_end_times_seconds),
+                }
+                _atomic_write_bytes(sidecar_path, json.dumps(alignment_data).encode("utf-8"))
+        else:
+            # Generate audio using the client's text_to_speech.stream method
+            audio_stream = client.text_to_speech.stream(
+                text=text,
+                voice_id=ELEVENLABS_VOICE_ID,
+                model_id=ELEVENLABS_MODEL_ID,
+                voice_settings=voice_settings_obj,
+                **context_kwargs
+            )
 
-        # Write the audio stream to a file
-        with open(output_path, "wb") as f:
-            for chunk in audio_stream:
-                if chunk:
-                    f.write(chunk)
+            # Write the audio stream to a file
+            _write_tts_audio(output_path, b"".join(chunk for chunk in audio_stream if chunk))
         print(f"Audio successfully saved to {output_path}")
+
+        cache_put_file("audio", audio_key, output_path, audio_suffix)
+        if alignment_data:
+            cache_put_json("alignment", audio_key, alignment_data)
         return True
     except Exception as e:
         print(f"Error generating audio with ElevenLabs: {e}")
         return False
 
+def _write_tts_audio(output_path, audio_bytes):
+    """Saves TTS audio; raw PCM output formats (e.g. "pcm_44100") are wrapped in a WAV header."""
+    if (ELEVENLABS_OUTPUT_FORMAT or "").startswith("pcm_"):
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2) # 16-bit little-endian
+            wav_file.setframerate(int(ELEVENLABS_OUTPUT_FORMAT.split("_")[1]))
+            wav_file.writeframes(audio_bytes)
+        audio_bytes = buffer.getvalue()
+    _atomic_write_bytes(output_path, audio_bytes)
+
 def get_youtube_credentials():
     """Gets valid user credentials from storage or runs the OAuth2 flow."""
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
     creds = None
     # The file token.json stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first time.
@@ -103,16 +561,76 @@ def get_youtube_credentials():
             token.write(creds.to_json())
     return creds
 
-def upload_to_youtube(video_path, title, description, tags, privacy_status="public", made_for_kids=False):
-    """Uploads a video to YouTube."""
+def get_youtube_service():
+    """
+    Returns the process-wide YouTube service, building it (and refreshing the credentials)
+    only on first use, so uploads in the same process share one authenticated client.
+    """
+    from googleapiclient.discovery import build
+    with _upload_clients_lock:
+        if 'youtube' not in _upload_clients:
+            credentials = get_youtube_credentials()
+            if not credentials:
+                return None
+            _upload_clients['youtube'] = build(API_SERVICE_NAME, API_VERSION, credentials=credentials)
+        return _upload_clients['youtube']
+
+def get_instagram_client():
+    """
+    Returns the process-wide logged-in Instagram client. A saved session is reused as is
+    (checked with one cheap request); a password login only happens when there is no valid session.
+    """
+    from instagrapi import Client
+    with _upload_clients_lock:
+        if 'instagram' in _upload_clients:
+            return _upload_clients['instagram']
+        if not INSTAGRAM_USERNAME or not INSTAGRAM_PASSWORD:
+            print("Instagram username or password not found in .env file. Skipping Instagram upload.")
+            return None
+        cl = Client()
+        if os.path.exists(INSTAGRAM_SESSION_FILE):
+            try:
+                cl.load_settings(INSTAGRAM_SESSION_FILE)
+                cl.get_timeline_feed() # Raises if the session has expired
+                print("Instagram session loaded from file.")
+                _upload_clients['instagram'] = cl
+                return cl
+            except Exception as e:
+                print(f"Saved Instagram session is no longer valid ({e}), logging in again...")
+                cl = Client()
+        print("Attempting to log in to Instagram...")
+        cl.login(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
+        cl.dump_settings(INSTAGRAM_SESSION_FILE) # Save session for next time
+        print("Logged in to Instagram and session saved.")
+        _upload_clients['instagram'] = cl
+        return cl
+
+def forget_upload_client(target):
+    """Drops a cached client (e.g. after its session was rejected) so the next upload authenticates again."""
+    with _upload_clients_lock:
+        _upload_clients.pop(target, None)
+
+@instrumented("upload_youtube")
+def upload_to_youtube(video_path, title, description, tags, privacy_status="public", made_for_kids=False, youtube=None,
+                      upload_state=None, save_state=None):
+    """
+    Uploads a video to YouTube as a resumable upload in YOUTUBE_UPLOAD_CHUNK_SIZE chunks.
+    A YouTube service object can be passed in (e.g. a local stand-in); otherwise the shared one is used.
+    upload_state (a dict, e.g. an outbox entry) receives the upload session URI and progress after
+    every chunk, and save_state(upload_state) is called to persist it; passing the same state back
+    in continues an interrupted upload instead of starting over. The video ID ends up in
+    upload_state['result_id'].
+    """
+    from googleapiclient.http import MediaFileUpload
+    upload_state = upload_state if upload_state is not None else {}
     try:
         print(f"Attempting to upload '{video_path}' to YouTube...")
-        credentials = get_youtube_credentials()
-        if not credentials:
-            print("Could not get YouTube credentials. Skipping upload.")
-            return False
-
-        youtube = build(API_SERVICE_NAME, API_VERSION, credentials=credentials)
+        if youtube is None:
+            youtube = get_youtube_service()
+            if youtube is None:
+                print("Could not get YouTube credentials. Skipping upload.")
+                upload_state['retryable'] = False # Retrying won't help until credentials are set up
+                return False
 
         body = {
             "snippet": {
@@ -128,83 +646,328 @@ def upload_to_youtube(video_path, title, description, tags, privacy_status="publ
             }
         }
 
-        media = MediaFileUpload(video_path, chunksize=-1, resumable=True)
+        media = MediaFileUpload(video_path, chunksize=YOUTUBE_UPLOAD_CHUNK_SIZE, resumable=True)
         
         request = youtube.videos().insert(
             part=",".join(body.keys()),
             body=body,
             media_body=media
         )
-        
         response = None
+        if upload_state.get('resumable_uri'):
+            # Continue the interrupted session from what the server actually received
+            progress, response = _resumable_upload_status(request, upload_state['resumable_uri'], media.size())
+            request.resumable_uri = upload_state['resumable_uri']
+            request.resumable_progress = progress
+            print(f"Resuming the YouTube upload at {progress / 1e6:.1f} MB.")
+
         while response is None:
             status, response = request.next_chunk()
+            upload_state['resumable_uri'] = request.resumable_uri
+            upload_state['resumable_progress'] = request.resumable_progress
+            if save_state:
+                save_state(upload_state)
             if status:
                 print(f"Uploaded {int(status.progress() * 100)}%")
         
+        upload_state['result_id'] = response.get('id')
+        upload_state.pop('resumable_uri', None)
         print(f"YouTube upload successful! Video ID: {response.get('id')}")
         print(f"Watch it here: https://www.youtube.com/watch?v={response.get('id')}")
         return True
     except Exception as e:
         print(f"An error occurred during YouTube upload: {e}")
+        if getattr(getattr(e, "resp", None), "status", None) in (404, 410):
+            # The upload session expired; the next attempt starts a new one
+            upload_state.pop('resumable_uri', None)
+            upload_state.pop('resumable_progress', None)
+        elif getattr(getattr(e, "resp", None), "status", None) == 401:
+            forget_upload_client('youtube')
         return False
 
-def upload_to_instagram_reel(video_path, caption, first_comment=""):
-    """Uploads a video to Instagram as a Reel."""
-    if not INSTAGRAM_USERNAME or not INSTAGRAM_PASSWORD:
-        print("Instagram username or password not found in .env file. Skipping Instagram upload.")
-        return False
+def _resumable_upload_status(request, resumable_uri, size):
+    """
+    Asks the server how much of an interrupted resumable upload session it has, with the status
+    check of the resumable upload protocol (an empty PUT with "Content-Range: bytes */size").
+    Returns (bytes received, None), or (size, response) if the upload had already finished.
+    """
+    from googleapiclient.errors import HttpError
+    resp, content = request.http.request(resumable_uri, "PUT",
+                                         headers={"Content-Range": f"bytes */{size}", "Content-Length": "0"})
+    if resp.status in (200, 201):
+        return size, request.postproc(resp, content)
+    if resp.status != 308:
+        raise HttpError(resp, content, uri=resumable_uri) # 404/410: the session expired
+    # "Range: bytes=0-N" is what the server has; without the header it has nothing yet
+    return (int(resp["range"].split("-")[1]) + 1 if "range" in resp else 0), None
 
-    cl = Client()
+@instrumented("upload_instagram")
+def upload_to_instagram_reel(video_path, caption, first_comment="", client=None, upload_state=None, save_state=None):
+    """
+    Uploads a video to Instagram as a Reel.
+    A logged-in client can be passed in (e.g. a local stand-in); otherwise the shared one is used.
+    With upload_state, the media ID is recorded (and saved with save_state) as soon as the upload
+    succeeds, so a retry after a failed first comment doesn't upload the video a second time.
+    """
+    upload_state = upload_state if upload_state is not None else {}
     try:
-        print("Attempting to log in to Instagram...")
-        # Check for session file
-        session_file = "instagram_session.json"
-        if os.path.exists(session_file):
-            cl.load_settings(session_file)
-            cl.login(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD) # Verifies session
-            print("Instagram session loaded from file.")
+        cl = client or get_instagram_client()
+        if cl is None:
+            upload_state['retryable'] = False # Not configured, retrying won't help
+            return False
+
+        if upload_state.get('result_id'):
+            print(f"Video already on Instagram (media ID {upload_state['result_id']}), not uploading it again.")
         else:
-            cl.login(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
-            cl.dump_settings(session_file) # Save session for next time
-            print("Logged in to Instagram and session saved.")
-
-        print(f"Uploading '{video_path}' to Instagram Reels...")
-        media = cl.video_upload(
-            path=video_path,
-            caption=caption,
-            # For Reels, it's usually uploaded as a standard video post that appears in the Reels tab.
-            # The differentiation is often by aspect ratio and content style.
-            # To explicitly make it a reel, you might need to use a different endpoint if available
-            # or ensure it's treated as such by Instagram's backend.
-            # The `upload_video` method with a 9:16 aspect ratio video is standard for Reels.
-            # Adding usertags or location if needed:
-            # usertags=[Usertag(user=cl.user_info_by_username("someuser"), x=0.5, y=0.5)],
-            # location=Location(name="Some Place", lat=40.7128, lng=-74.0060)
-        )
-        print(f"Instagram Reel upload successful! Media ID: {media.id}")
-        if first_comment:
-            cl.media_comment(media.id, first_comment)
+            print(f"Uploading '{video_path}' to Instagram Reels...")
+            media = cl.video_upload(
+                path=video_path,
+                caption=caption,
+                # For Reels, it's usually uploaded as a standard video post that appears in the Reels tab.
+                # The differentiation is often by aspect ratio and content style.
+                # To explicitly make it a reel, you might need to use a different endpoint if available
+                # or ensure it's treated as such by Instagram's backend.
+                # The `upload_video` method with a 9:16 aspect ratio video is standard for Reels.
+                # Adding usertags or location if needed:
+                # usertags=[Usertag(user=cl.user_info_by_username("someuser"), x=0.5, y=0.5)],
+                # location=Location(name="Some Place", lat=40.7128, lng=-74.0060)
+            )
+            upload_state['result_id'] = media.id
+            if save_state:
+                save_state(upload_state)
+            print(f"Instagram Reel upload successful! Media ID: {media.id}")
+        if first_comment and not upload_state.get('comment_id'):
+            comment = cl.media_comment(upload_state['result_id'], first_comment)
+            upload_state['comment_id'] = getattr(comment, "pk", True)
             print(f"Added first comment: {first_comment}")
         return True
     except Exception as e:
         print(f"An error occurred during Instagram upload: {e}")
-        if "login_required" in str(e).lower() and os.path.exists(session_file):
+        if client is None and "login_required" in str(e).lower():
             print("Instagram login session might be invalid. Deleting session file and try again.")
-            os.remove(session_file)
+            forget_upload_client('instagram')
+            if os.path.exists(INSTAGRAM_SESSION_FILE):
+                os.remove(INSTAGRAM_SESSION_FILE)
         return False
 
-def transcribe_audio_to_segments(audio_path):
+def _outbox_entry_path(entry_id):
+    return os.path.join(OUTBOX_DIR, f"{entry_id}.json")
+
+def _save_outbox_entry(entry):
+    with _outbox_lock:
+        _atomic_write_bytes(_outbox_entry_path(entry['id']), json.dumps(entry, indent=2).encode("utf-8"))
+
+def load_outbox_entries():
+    """Returns every outbox entry, oldest first."""
+    entries = []
+    if not os.path.isdir(OUTBOX_DIR):
+        return entries
+    for name in os.listdir(OUTBOX_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(OUTBOX_DIR, name), encoding="utf-8") as f:
+                entries.append(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Skipping unreadable outbox entry '{name}': {e}")
+    return sorted(entries, key=lambda entry: entry['created_at'])
+
+def enqueue_upload(video_path, target, metadata):
+    """
+    Adds an upload of video_path to `target` ("youtube" or "instagram") to the outbox and returns
+    its entry. Entries are keyed by target and video content, so enqueueing the same video again
+    returns the existing entry (already uploaded, or still pending) instead of a duplicate.
+    """
+    entry_id = content_hash("upload", target, file_sha256(video_path))
+    path = _outbox_entry_path(entry_id)
+    with _outbox_lock:
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            if entry['status'] == 'failed': # Asked for again: give it a fresh set of attempts
+                entry.update(status='pending', attempts=0, next_attempt_at=0.0)
+            entry['video_path'] = os.path.abspath(video_path)
+        else:
+            entry = {
+                'id': entry_id,
+                'target': target,
+                'video_path': os.path.abspath(video_path),
+                'metadata': metadata,
+                'status': 'pending',
+                'attempts': 0,
+                'next_attempt_at': 0.0,
+                'created_at': time.time(),
+                'last_error': None,
+            }
+        os.makedirs(OUTBOX_DIR, exist_ok=True)
+        _atomic_write_bytes(path, json.dumps(entry, indent=2).encode("utf-8"))
+    return entry
+
+def _attempt_upload(entry, clients):
+    """One upload attempt for an outbox entry; schedules a retry with exponential backoff on failure."""
+    metadata = entry['metadata']
+    with _upload_target_limits[entry['target']]:
+        if entry['target'] == 'youtube':
+            ok = upload_to_youtube(entry['video_path'], youtube=clients.get('youtube'),
+                                   upload_state=entry, save_state=_save_outbox_entry, **metadata)
+        else:
+            ok = upload_to_instagram_reel(entry['video_path'], client=clients.get('instagram'),
+                                          upload_state=entry, save_state=_save_outbox_entry, **metadata)
+    entry['attempts'] += 1
+    retryable = entry.pop('retryable', True)
+    if ok:
+        entry.update(status='done', last_error=None, finished_at=time.time())
+    elif not retryable:
+        entry.update(status='failed', last_error="not configured (credentials missing)")
+    elif entry['attempts'] >= UPLOAD_MAX_ATTEMPTS:
+        entry.update(status='failed', last_error=f"gave up after {entry['attempts']} attempts")
+        print(f"Giving up on the {entry['target']} upload of '{entry['video_path']}'.")
+    else:
+        delay = UPLOAD_RETRY_BACKOFF * 2 ** (entry['attempts'] - 1)
+        entry.update(next_attempt_at=time.time() + delay, last_error=f"attempt {entry['attempts']} failed")
+        print(f"Retrying the {entry['target']} upload of '{entry['video_path']}' in {delay:.0f}s.")
+    _save_outbox_entry(entry)
+    return entry
+
+def drain_outbox(entry_ids=None, clients=None, max_workers=None):
+    """
+    Uploads pending outbox entries (all of them, or only entry_ids) until each one is done or out
+    of attempts. Uploads to different targets run at the same time; per-target limits keep a
+    single client from being used by too many threads. Returns the entries that were processed.
+    """
+    clients = clients or {}
+    processed = {}
+    in_flight = {} # Future -> outbox entry ID
+    with ThreadPoolExecutor(max_workers=max_workers or UPLOAD_WORKERS) as pool:
+        while True:
+            pending = [entry for entry in load_outbox_entries()
+                       if entry['status'] == 'pending' and entry['id'] not in in_flight.values()
+                       and (entry_ids is None or entry['id'] in entry_ids)]
+            now = time.time()
+            for entry in pending:
+                if entry['next_attempt_at'] <= now:
+                    in_flight[pool.submit(_attempt_upload, entry, clients)] = entry['id']
+            retry_times = [entry['next_attempt_at'] for entry in pending if entry['next_attempt_at'] > now]
+            if not in_flight:
+                if not retry_times:
+                    break
+                time.sleep(min(retry_times) - now)
+                continue
+            # Look at the outbox again as soon as any upload finishes or the next retry is due,
+            # instead of waiting for the slowest upload of a batch
+            done, _ = wait(in_flight, timeout=min(retry_times) - now if retry_times else None,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+                entry = future.result()
+                processed[entry['id']] = entry
+    return list(processed.values())
+
+def publish_video(video_path, youtube_metadata=None, instagram_metadata=None, clients=None):
+    """
+    Publishes a video to every target with metadata (through the outbox, so an interrupted or
+    repeated publish never uploads twice) and returns {target: succeeded}.
+    """
+    entries = []
+    if youtube_metadata is not None:
+        entries.append(enqueue_upload(video_path, 'youtube', youtube_metadata))
+    if instagram_metadata is not None:
+        entries.append(enqueue_upload(video_path, 'instagram', instagram_metadata))
+    drain_outbox({entry['id'] for entry in entries}, clients=clients)
+    results = {entry['id']: entry for entry in load_outbox_entries()}
+    return {entry['target']: results.get(entry['id'], entry)['status'] == 'done' for entry in entries}
+
+def _resolve_whisper_device(device=None):
+    """Returns the torch device to run Whisper on: WHISPER_DEVICE, else CUDA when available, else CPU."""
+    import torch
+    device = device or WHISPER_DEVICE
+    if device:
+        return device
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def _resolve_whisper_precision(device, precision=None):
+    """fp16 only makes sense on GPU; CPU always runs in fp32."""
+    precision = precision or WHISPER_PRECISION or ("fp16" if device != "cpu" else "fp32")
+    return "fp32" if device == "cpu" else precision
+
+def apply_torch_thread_policy(threads=None):
+    """
+    Limits torch's intra-op threads so several transcriptions can share one machine.
+    Defaults to WHISPER_THREADS, or an even share of the cores between WHISPER_CONCURRENCY jobs.
+    """
+    import torch
+    threads = threads or WHISPER_THREADS or max(1, (os.cpu_count() or 1) // max(1, WHISPER_CONCURRENCY))
+    if torch.get_num_threads() != threads:
+        torch.set_num_threads(threads)
+    return threads
+
+def get_whisper_model(model_name=None, device=None, precision=None):
+    """
+    Returns a loaded Whisper model from the process-wide registry, loading it on first use.
+    Models are keyed by (model name, device, precision) and stay in memory until evicted.
+    """
+    import whisper
+    model_name = model_name or WHISPER_MODEL_NAME
+    device = _resolve_whisper_device(device)
+    precision = _resolve_whisper_precision(device, precision)
+    key = (model_name, device, precision)
+    with _whisper_models_lock:
+        if key not in _whisper_models:
+            print(f"Loading Whisper model '{model_name}' on {device} ({precision})...")
+            model = whisper.load_model(model_name, device=device)
+            if precision == "fp16":
+                model = model.half()
+            _whisper_models[key] = model
+        return _whisper_models[key]
+
+def evict_whisper_model(model_name=None, device=None, precision=None):
+    """
+    Removes models from the registry so their memory can be freed.
+    With no arguments every model is evicted; otherwise only the matching ones.
+    """
+    with _whisper_models_lock:
+        for key in list(_whisper_models):
+            if ((model_name is None or key[0] == model_name) and
+                    (device is None or key[1] == device) and
+                    (precision is None or key[2] == precision)):
+                del _whisper_models[key]
+                print(f"Evicted Whisper model '{key[0]}' ({key[1]}, {key[2]}).")
+    import gc
+    gc.collect()
+    import torch
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+def transcribe_audio_to_segments(audio_path, model_name=None, device=None, precision=None, threads=None):
     """
     Transcribes the audio file using Whisper and returns segments tailored for
     word-by-word or small group display.
+    The model comes from the process-wide registry, so it is only loaded once per process.
     """
-    print(f"Loading Whisper model and transcribing: {audio_path}")
+    all_words_with_timing = transcribe_audio_to_words(audio_path, model_name, device, precision, threads)
+    if not all_words_with_timing:
+        return []
+
+    final_segments = group_words_into_segments(all_words_with_timing)
+    if not final_segments:
+        print("No subtitle segments were generated after grouping words.")
+    else:
+        print(f"Transcription and word grouping complete. Generated {len(final_segments)} subtitle segments.")
+    return final_segments
+
+def transcribe_audio_to_words(audio_path, model_name=None, device=None, precision=None, threads=None):
+    """Transcribes the audio file using Whisper and returns its words as {'text','start','end'} dicts."""
+    workers = _long_audio_workers()
+    if workers > 1 and audio_duration(audio_path) > LONG_AUDIO_SECONDS:
+        return transcribe_long_audio_to_words(audio_path, model_name, device, precision, workers)
+    print(f"Transcribing with Whisper: {audio_path}")
     # You can choose different models like "tiny", "base", "small", "medium", "large"
     # Smaller models are faster but less accurate. "base" is a good starting point.
-    model_name = "base"
+    model_name = model_name or WHISPER_MODEL_NAME
     try:
-        model = whisper.load_model(model_name)
+        apply_torch_thread_policy(threads)
+        with instrument_stage("whisper_load", model=model_name):
+            model = get_whisper_model(model_name, device, precision)
     except Exception as e:
         print(f"Error loading Whisper model '{model_name}': {e}")
         print("Please ensure openai-whisper is installed correctly and the model can be downloaded.")
@@ -215,46 +978,190 @@ def transcribe_audio_to_segments(audio_path):
     try:
         # Crucially, enable word_timestamps
         print("Starting transcription with word-level timestamps...")
-        result = model.transcribe(audio_path, verbose=False, word_timestamps=True)
+        import torch
+        fp16 = next(model.parameters()).dtype == torch.float16 # Match the precision the model was loaded with
+        with instrument_stage("whisper_decode", model=model_name):
+            # 16 kHz view of the shared buffer, so Whisper doesn't start its own ffmpeg decode
+            result = model.transcribe(load_whisper_audio(audio_path), verbose=False, word_timestamps=True, fp16=fp16)
         print("Transcription API call finished.")
     except Exception as e:
         print(f"Error during transcription: {e}")
         return []
 
-    # --- Parameters for grouping words into subtitles ---
-    # Max words to join in a single subtitle line
-    MAX_WORDS_PER_SUBTITLE = 1 # Changed from 3 to 1 for single word display
-    # Max duration for a single subtitle line (in seconds)
-    MAX_DURATION_PER_SUBTITLE = 2.0
-    # If the gap between words is larger than this (in seconds), force a new subtitle
-    MIN_GAP_TO_FORCE_SPLIT = 0.3
-
-    all_words_with_timing = []
-    if 'segments' in result:
-        for segment_info in result['segments']:
-            if 'words' in segment_info:
-                for word_data in segment_info['words']:
-                    text = word_data.get('word', '').strip()
-                    if text and 'start' in word_data and 'end' in word_data:
-                        all_words_with_timing.append({
-                            'text': text,
-                            'start': float(word_data['start']),
-                            'end': float(word_data['end'])
-                        })
-                    # else:
-                        # print(f"Debug: Skipping word_data due to missing text or timestamps: {word_data}")
-            # else:
-                # print(f"Debug: Segment found without 'words' key: {segment_info.get('text', 'N/A')}")
-    else:
+    if 'segments' not in result:
         print("Error: No 'segments' key in transcription result. Cannot extract words.")
         return []
+    all_words_with_timing = _words_from_whisper_result(result)
 
     if not all_words_with_timing:
         print("Transcription complete, but no words with timestamps could be extracted.")
         return []
     
     # print(f"Debug: Extracted {len(all_words_with_timing)} individual words with timestamps.")
+    return all_words_with_timing
+
+def _words_from_whisper_result(result, offset=0.0):
+    """The words of a Whisper result as {'text','start','end'} dicts, shifted by offset seconds."""
+    all_words_with_timing = []
+    for segment_info in result.get('segments', []):
+        for word_data in segment_info.get('words', []):
+            text = word_data.get('word', '').strip()
+            if text and 'start' in word_data and 'end' in word_data:
+                all_words_with_timing.append({
+                    'text': text,
+                    'start': float(word_data['start']) + offset,
+                    'end': float(word_data['end']) + offset
+                })
+    return all_words_with_timing
+
+def find_silence_splits(samples, sample_rate, piece_seconds=None, search_seconds=None):
+    """
+    Returns split times (seconds) roughly every piece_seconds, each moved to the quietest point
+    (lowest short-term energy, smoothed over 200 ms) within search_seconds of its target, so
+    splits land in pauses between words instead of in the middle of them.
+    """
+    import numpy as np
+    piece_seconds = piece_seconds or LONG_AUDIO_PIECE_SECONDS
+    search_seconds = search_seconds or piece_seconds / 6
+    frame = int(sample_rate * 0.02) # 20 ms energy frames
+    frame_count = len(samples) // frame
+    if frame_count == 0:
+        return []
+    energy = np.sqrt(np.mean(np.square(samples[:frame_count * frame].reshape(frame_count, frame)), axis=1))
+    energy = np.convolve(energy, np.ones(10) / 10, mode="same")
+    frames_per_second = sample_rate / frame
+    duration = len(samples) / sample_rate
+
+    splits = []
+    target = piece_seconds
+    while target < duration - piece_seconds / 2: # Don't leave a tiny last piece
+        lo = max(int((target - search_seconds) * frames_per_second), int((splits[-1] if splits else 0) * frames_per_second) + 1)
+        hi = min(int((target + search_seconds) * frames_per_second), frame_count)
+        if lo >= hi:
+            break
+        split = (lo + int(np.argmin(energy[lo:hi]))) / frames_per_second
+        splits.append(split)
+        target = split + piece_seconds
+    return splits
+
+def merge_piece_words(pieces_words, splits):
+    """
+    Joins the word lists of overlapping pieces. Around each split, a word belongs to the piece
+    its midpoint falls in, and a word repeated by both pieces at the same time is kept once.
+    """
+    merged = []
+    bounds = [float("-inf")] + list(splits) + [float("inf")]
+    for i, words in enumerate(pieces_words):
+        for word in words:
+            midpoint = (word['start'] + word['end']) / 2
+            if not bounds[i] <= midpoint < bounds[i + 1]:
+                continue
+            if merged and _same_word(merged[-1], word):
+                continue
+            merged.append(word)
+    return merged
+
+def _same_word(a, b):
+    """True if a and b look like the same spoken word heard by two overlapping pieces."""
+    normalize = lambda text: re.sub(r"[^\w']", "", text.lower())
+    return normalize(a['text']) == normalize(b['text']) and b['start'] < a['end']
+
+def _long_audio_workers():
+    """
+    Worker processes for long-audio mode: LONG_AUDIO_WORKERS, else one per core. Inside a pool
+    worker (batch transcription, daemon) it is always 1: that process already has its share of
+    the cores, and a nested pool per worker would start workers x cores Whisper processes.
+    """
+    import multiprocessing
+    if multiprocessing.parent_process() is not None:
+        return 1
+    return LONG_AUDIO_WORKERS or os.cpu_count() or 1
+
+def _init_long_audio_worker(threads, model_name, device, precision):
+    """Long-audio worker initializer: its share of the cores and its own copy of the model, loaded once."""
+    apply_torch_thread_policy(threads)
+    get_whisper_model(model_name, device, precision)
+
+def _detect_language(samples, model_name, device, precision):
+    """Detects the spoken language from the first 30 s of 16 kHz audio (one encoder pass)."""
+    from whisper.audio import log_mel_spectrogram, pad_or_trim
+    model = get_whisper_model(model_name, device, precision)
+    if not model.is_multilingual:
+        return "en" # English-only models (e.g. base.en) cannot detect the language
+    mel = log_mel_spectrogram(pad_or_trim(samples), model.dims.n_mels).to(model.device)
+    _, probs = model.detect_language(mel.to(next(model.parameters()).dtype))
+    return max(probs, key=probs.get)
+
+def _transcribe_piece(samples, offset, model_name, device, precision, language=None):
+    """Transcribes one piece of 16 kHz audio in a worker; returns its words on the full audio's timeline."""
+    import torch
+    model = get_whisper_model(model_name, device, precision)
+    fp16 = next(model.parameters()).dtype == torch.float16
+    result = model.transcribe(samples, verbose=False, word_timestamps=True, fp16=fp16, language=language)
+    return _words_from_whisper_result(result, offset)
+
+def _get_long_audio_pool(workers, model_name, device, precision):
+    """The long-audio process pool, kept between transcriptions so its workers keep their models loaded."""
+    global _long_audio_pool, _long_audio_pool_key
+    import multiprocessing
+    key = (workers, model_name, device, precision)
+    with _long_audio_pool_lock:
+        if _long_audio_pool is not None and _long_audio_pool_key != key:
+            _long_audio_pool.shutdown(wait=False)
+            _long_audio_pool = None
+        if _long_audio_pool is None:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            # Spawned, not forked: forking a process that already runs torch threads can deadlock
+            _long_audio_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                                   initializer=_init_long_audio_worker,
+                                                   initargs=(threads, model_name, device, precision))
+            _long_audio_pool_key = key
+        return _long_audio_pool
+
+def transcribe_long_audio_to_words(audio_path, model_name=None, device=None, precision=None, workers=None):
+    """
+    Long-audio mode of transcribe_audio_to_words: splits the audio at silences into pieces of
+    about LONG_AUDIO_PIECE_SECONDS (plus LONG_AUDIO_OVERLAP on each side), transcribes them in a
+    pool of worker processes and merges the words back into one timeline.
+    """
+    model_name = model_name or WHISPER_MODEL_NAME
+    device = _resolve_whisper_device(device)
+    precision = _resolve_whisper_precision(device, precision)
+    workers = workers or _long_audio_workers()
+    samples = load_whisper_audio(audio_path)
+    splits = find_silence_splits(samples, WHISPER_SAMPLE_RATE)
+    bounds = [0.0] + splits + [len(samples) / WHISPER_SAMPLE_RATE]
+    pieces = []
+    for start, end in zip(bounds, bounds[1:]):
+        start = max(start - LONG_AUDIO_OVERLAP, 0.0)
+        end = min(end + LONG_AUDIO_OVERLAP, bounds[-1])
+        pieces.append((start, samples[int(start * WHISPER_SAMPLE_RATE):int(end * WHISPER_SAMPLE_RATE)]))
+    print(f"Transcribing {bounds[-1]:.0f}s of audio as {len(pieces)} pieces on {workers} worker processes: {audio_path}")
+
+    try:
+        with instrument_stage("whisper_decode", model=model_name, pieces=len(pieces), workers=workers):
+            pool = _get_long_audio_pool(workers, model_name, device, precision)
+            # Detect the language once, so every piece is decoded the same way
+            language = pool.submit(_detect_language, samples[:30 * WHISPER_SAMPLE_RATE],
+                                   model_name, device, precision).result()
+            futures = [pool.submit(_transcribe_piece, piece_samples, offset, model_name, device, precision, language)
+                       for offset, piece_samples in pieces]
+            pieces_words = [future.result() for future in futures]
+    except Exception as e:
+        print(f"Error during transcription: {e}")
+        return []
+
+    all_words_with_timing = merge_piece_words(pieces_words, splits)
+    if not all_words_with_timing:
+        print("Transcription complete, but no words with timestamps could be extracted.")
+    return all_words_with_timing
 
+def group_words_into_segments(all_words_with_timing, max_words=MAX_WORDS_PER_SUBTITLE,
+                              max_duration=MAX_DURATION_PER_SUBTITLE, min_gap=MIN_GAP_TO_FORCE_SPLIT):
+    """
+    Groups timed words ({'text','start','end'} dicts, in order) into subtitle segments
+    of at most max_words words and max_duration seconds, splitting on gaps of min_gap or more.
+    """
     # Group words into final subtitle segments
     final_segments = []
     if not all_words_with_timing:
@@ -275,9 +1182,9 @@ def transcribe_audio_to_segments(audio_path):
             potential_duration = word_info['end'] - current_sub_start_time
             gap_since_last_word = word_info['start'] - current_sub_end_time
 
-            if (potential_num_words <= MAX_WORDS_PER_SUBTITLE and
-                potential_duration <= MAX_DURATION_PER_SUBTITLE and
-                gap_since_last_word < MIN_GAP_TO_FORCE_SPLIT):
+            if (potential_num_words <= max_words and
+                potential_duration <= max_duration and
+                gap_since_last_word < min_gap):
                 # Add word to current subtitle segment
                 current_sub_words_list.append(word_info['text'])
                 current_sub_end_time = word_info['end']
@@ -301,138 +1208,2231 @@ def transcribe_audio_to_segments(audio_path):
             'end': current_sub_end_time
         })
 
-    if not final_segments:
-        print("No subtitle segments were generated after grouping words.")
-    else:
-        print(f"Transcription and word grouping complete. Generated {len(final_segments)} subtitle segments.")
     return final_segments
 
-def create_styled_subtitle_video(audio_path, segments, output_path="output_video.mp4", video_size=(1080, 1920), background_video_path=None):
+def alignment_sidecar_path(audio_path):
+    """Path of the JSON file holding the TTS character timestamps for an audio file."""
+    return f"{os.path.splitext(audio_path)[0]}_alignment.json"
+
+def segments_sidecar_path(audio_path):
+    """Path of the JSON file holding the subtitle segments for an audio file (written by `tts`/`transcribe`)."""
+    return f"{os.path.splitext(audio_path)[0]}_segments.json"
+
+def save_segments(segments, path):
+    _atomic_write_bytes(path, json.dumps(segments, indent=2).encode("utf-8"))
+    print(f"Subtitle segments saved to {path}")
+
+def load_segments(path):
+    """Returns the segments saved at path, or [] if the file is missing or unreadable."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not read subtitle segments from '{path}': {e}")
+        return []
+
+def load_tts_alignment(audio_path):
+    """Returns the TTS character alignment saved next to audio_path, or None if there is none."""
+    path = alignment_sidecar_path(audio_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Could not read TTS alignment '{path}': {e}")
+        return None
+
+def words_from_character_alignment(alignment):
     """
-    Creates a video with styled, synchronized subtitles.
+    Turns ElevenLabs character timestamps ({'characters', 'character_start_times_seconds',
+    'character_end_times_seconds'}) into timed words split on whitespace.
+    """
+    words = []
+    current_chars = []
+    current_start = current_end = 0.0
+    for char, start, end in zip(alignment['characters'], alignment['character_start_times_seconds'],
+                                alignment['character_end_times_seconds']):
+        if char.isspace():
+            if current_chars:
+                words.append({'text': "".join(current_chars), 'start': current_start, 'end': current_end})
+                current_chars = []
+            continue
+        if not current_chars:
+            current_start = float(start)
+        current_chars.append(char)
+        current_end = float(end)
+    if current_chars:
+        words.append({'text': "".join(current_chars), 'start': current_start, 'end': current_end})
+    return words
 
-    Args:
-        audio_path (str): Path to the audio file.
-        segments (list): A list of dictionaries, where each dictionary represents a subtitle segment.
-                         Each dict should have 'text' (str), 'start' (float), and 'end' (float) keys.
-                         Example: [{'text': 'HELLO', 'start': 0.5, 'end': 1.0}, ...]
-        output_path (str): Path to save the output video file.
-        video_size (tuple): (width, height) of the output video. Default is 1080x1920 for shorts/reels.
-        background_video_path (str, optional): Path to a background video file. Defaults to None (solid color).
+def force_align_words(audio_path, words, model_name=None, language="en"):
+    """
+    Finds the timing of the known `words` in the audio with Whisper's cross-attention alignment
+    (the same DTW step Whisper uses for word_timestamps), without any autoregressive decoding.
+    Audio longer than Whisper's 30 s window is aligned window by window: words that end safely
+    inside the window are kept and the next window starts after the last kept word.
     """
-    audio_clip = AudioFileClip(audio_path)
-    video_duration = audio_clip.duration
+    import torch
+    from whisper.audio import (HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE,
+                               log_mel_spectrogram, pad_or_trim)
+    from whisper.timing import find_alignment
+    from whisper.tokenizer import get_tokenizer
 
-    if background_video_path:
-        print(f"Using background video: {background_video_path}")
-        # Ensure the background video is at least as long as the audio
-        # If shorter, it will loop. If longer, it will be cut.
-        background_clip = VideoFileClip(background_video_path).subclip(0, video_duration)
-        # Resize background to target video_size, cropping if necessary
-        background_clip = background_clip.resize(height=video_size[1]) # Resize based on height
-        if background_clip.w < video_size[0]: # If width is still too small (after height resize), resize by width
-             background_clip = background_clip.resize(width=video_size[0])
-        background_clip = background_clip.crop(x_center=background_clip.w/2, y_center=background_clip.h/2, width=video_size[0], height=video_size[1])
+    model = get_whisper_model(model_name)
+    tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                              language=language, task="transcribe")
+    audio = load_whisper_audio(audio_path)
+    mel = log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES)
+    content_frames = mel.shape[-1] - N_FRAMES
+    frames_per_second = SAMPLE_RATE / HOP_LENGTH
+    words_per_frame = len(words) / max(content_frames, 1)
+    max_tokens = model.dims.n_text_ctx // 2 - 4
+    dtype = next(model.parameters()).dtype
 
-    else:
-        print("Using solid color background.")
-        background_clip = ColorClip(size=video_size, color=(30, 30, 30), duration=video_duration) # Dark grey background
+    aligned = []
+    frame_offset = 0
+    i = 0
+    while i < len(words) and frame_offset < content_frames:
+        segment_frames = min(N_FRAMES, content_frames - frame_offset)
+        is_last_window = frame_offset + N_FRAMES >= content_frames
+        mel_segment = pad_or_trim(mel[:, frame_offset:frame_offset + N_FRAMES], N_FRAMES)
+        mel_segment = mel_segment.to(model.device).to(dtype)
 
-    subtitle_text_clips = []
-    for seg in segments:
-        text_to_display = seg['text'].upper()
-        start_time = seg['start']
-        end_time = seg['end']
-        segment_duration = end_time - start_time
-
-        text_clip = TextClip(
-            text_to_display,
-            fontsize=100,  # Adjust font size as needed
-            color='white',
-            font='Impact', # Ensure Impact font is available or choose another
-            stroke_color='black',
-            stroke_width=5,   # Adjust stroke width as needed
-            method='caption',
-            size=(video_size[0] * 0.85, None), # Text width is 85% of video width
-            align='center'
-        )
+        # Take more words than the window should hold, then keep only those that end inside it
+        count = len(words) - i if is_last_window else int(words_per_frame * segment_frames * 1.3) + 1
+        count = max(1, min(count, len(words) - i))
+        text = " " + " ".join(words[i:i + count])
+        text_tokens = tokenizer.encode(text)
+        while len(text_tokens) > max_tokens and count > 1:
+            count = max(1, int(count * 0.8))
+            text = " " + " ".join(words[i:i + count])
+            text_tokens = tokenizer.encode(text)
 
-        text_clip = text_clip.set_position('center').set_duration(segment_duration).set_start(start_time)
-        subtitle_text_clips.append(text_clip)
+        with torch.no_grad():
+            timings = find_alignment(model, tokenizer, text_tokens, mel_segment, segment_frames)
 
-    final_video_clip = CompositeVideoClip([background_clip] + subtitle_text_clips, size=video_size)
-    final_video_clip = final_video_clip.set_audio(audio_clip)
+        # Whisper splits punctuation into separate "words"; map each timing back to our word by character position
+        word_bounds = []
+        position = 0
+        for word in words[i:i + count]:
+            position += 1 # Leading space
+            word_bounds.append((position, position + len(word)))
+            position += len(word)
+        starts = [None] * count
+        ends = [None] * count
+        position = 0
+        word_index = 0
+        for timing in timings:
+            first_char = position + (len(timing.word) - len(timing.word.lstrip()))
+            position += len(timing.word)
+            if not timing.word.strip():
+                continue
+            while word_index < count - 1 and first_char >= word_bounds[word_index][1]:
+                word_index += 1
+            if starts[word_index] is None:
+                starts[word_index] = timing.start
+            ends[word_index] = timing.end
 
+        window_seconds = segment_frames / frames_per_second
+        offset_seconds = frame_offset / frames_per_second
+        kept = 0
+        for j in range(count):
+            if starts[j] is None:
+                break
+            if not is_last_window and ends[j] > window_seconds - 1.0:
+                break
+            aligned.append({'text': words[i + j], 'start': offset_seconds + float(starts[j]),
+                            'end': offset_seconds + float(ends[j])})
+            kept += 1
+
+        if is_last_window:
+            break
+        if kept == 0:
+            frame_offset += N_FRAMES // 2 # No word fits this window (e.g. a long pause), move on
+            continue
+        i += kept
+        frame_offset += max(1, int(round(float(ends[kept - 1]) * frames_per_second)))
+
+    if len(aligned) < len(words):
+        print(f"Forced alignment only placed {len(aligned)} of {len(words)} words.")
+    return aligned
+
+def align_script_to_segments(audio_path, script_text, model_name=None):
+    """
+    Builds subtitle segments from the known script instead of transcribing the audio.
+    Uses the TTS character timestamps saved next to the audio when available, otherwise
+    forced alignment of the script's words against the audio. Returns [] on failure.
+    """
+    alignment = load_tts_alignment(audio_path)
     try:
-        final_video_clip.write_videofile(
-            output_path,
-            fps=60,
-            codec='libx264',
-            audio_codec='aac',
-            threads=4 # Use multiple threads for faster processing if available
-        )
-        print(f"Video successfully saved to {output_path}")
+        if alignment:
+            print("Using TTS character timestamps for subtitle timing.")
+            words = words_from_character_alignment(alignment)
+        else:
+            print("Force-aligning the script against the audio for subtitle timing...")
+            words = force_align_words(audio_path, script_text.split(), model_name)
     except Exception as e:
-        print(f"Error writing video file: {e}")
-        print("Please ensure FFMPEG is installed and accessible by MoviePy.")
-        print("If you are using a custom font, ensure the font file path is correct or the font name is recognized.")
-        print("If issues persist with text rendering (especially strokes), ensure ImageMagick is installed and configured (though MoviePy often handles this well on its own).")
-    finally:
-        # Release resources
-        audio_clip.close()
-        if background_video_path:
-            background_clip.close()
-        for tc in subtitle_text_clips:
-            tc.close()
-        if 'final_video_clip' in locals():
-            final_video_clip.close()
+        print(f"Error aligning script to audio: {e}")
+        return []
+    if len(words) < len(script_text.split()):
+        print("Alignment did not cover the whole script.")
+        return []
+    final_segments = group_words_into_segments(words)
+    print(f"Alignment complete. Generated {len(final_segments)} subtitle segments.")
+    return final_segments
 
+@instrumented("subtitle_timing")
+def get_subtitle_segments(audio_path, script_text=None, mode=None, model_name=None):
+    """
+    Returns subtitle segments for the audio. In "align" mode with a known script the timings
+    come from align_script_to_segments; Whisper transcription is the fallback.
+    """
+    mode = mode or SUBTITLE_TIMING_MODE
+    model_name = model_name or WHISPER_MODEL_NAME
+    use_script = mode == "align" and script_text and script_text.strip()
+    sidecar_path = alignment_sidecar_path(audio_path)
+    segments_key = content_hash(
+        "segments", file_sha256(audio_path), model_name,
+        MAX_WORDS_PER_SUBTITLE, MAX_DURATION_PER_SUBTITLE, MIN_GAP_TO_FORCE_SPLIT,
+        script_text if use_script else None,
+        file_sha256(sidecar_path) if use_script and os.path.exists(sidecar_path) else None,
+    )
+    cached_segments = cache_get_json("segments", segments_key)
+    if cached_segments:
+        print(f"Using cached subtitle segments ({len(cached_segments)} segments).")
+        return cached_segments
 
-if __name__ == '__main__':
-    # --- Step 0: Get story from user ---
-    print("Please paste your story below. Press Ctrl+D (Unix) or Ctrl+Z then Enter (Windows) when done:")
-    story_lines = []
-    while True:
-        try:
-            line = input()
-            story_lines.append(line)
-        except EOFError:
-            break
-    story_text = "\\n".join(story_lines)
+    final_segments = []
+    if use_script:
+        final_segments = align_script_to_segments(audio_path, script_text, model_name)
+        if not final_segments:
+            print("Falling back to Whisper transcription.")
+    if not final_segments:
+        final_segments = transcribe_audio_to_segments(audio_path, model_name=model_name)
+    if final_segments:
+        cache_put_json("segments", segments_key, final_segments)
+    return final_segments
 
-    if not story_text.strip():
-        print("No story text provided. Exiting.")
-        exit()
-    
-    video_title = story_text.split('.')[0] # Use first sentence as title, or part of it
-    if len(video_title) > 80 : video_title = video_title[:80] + "..."
-    video_description_youtube = f"AI Generated Story: {video_title}\\n\\n{story_text[:200]}..."
-    video_caption_instagram = f"{video_title} #AIStory #ShortStory #ReelContent"
-    hashtags_youtube = ["AIStory", "ShortStory", "AutomatedVideo", "TextToSpeech"]
+def split_sentences(text):
+    """
+    Splits text after ".", "!" or "?" (and a closing quote or bracket) followed by whitespace,
+    except after an abbreviation from SENTENCE_ABBREVIATIONS ("Dr. Smith") or an initial ("J. Doe").
+    """
+    sentences = []
+    for part in re.split(r"(?<=[.!?])\s+|(?<=[.!?][\"'”’)\]])\s+", text.strip()):
+        last_word = sentences[-1].split()[-1] if sentences and sentences[-1] else ""
+        stem = last_word[:-1].lstrip("\"'(").lower() if last_word.endswith(".") else None
+        if stem is not None and (stem in SENTENCE_ABBREVIATIONS or re.fullmatch(r"[a-z]", stem)):
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return sentences
 
+def split_story_into_chunks(text, max_chars=None):
+    """
+    Splits a story at sentence boundaries (see split_sentences) into chunks of at most max_chars
+    characters (a single longer sentence is split between words).
+    """
+    max_chars = max_chars or TTS_CHUNK_CHARS
+    chunks = []
+    current = ""
+    for sentence in split_sentences(text):
+        pieces = [sentence]
+        if len(sentence) > max_chars:
+            pieces = []
+            piece = ""
+            for word in sentence.split():
+                if piece and len(piece) + 1 + len(word) > max_chars:
+                    pieces.append(piece)
+                    piece = word
+                else:
+                    piece = f"{piece} {word}" if piece else word
+            pieces.append(piece)
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
 
-    # --- Step 1: Configure paths ---
-    base_filename = "".join(filter(str.isalnum, video_title.lower().replace(" ", "_")))[:30]
-    generated_audio_file = f"assets/audio/{base_filename}_audio.mp3"
-    your_background_video = "assets/video/minecraft_gameplay.mp4" 
-    output_video_file = f"output/{base_filename}_final_video.mp4"
+def _synthesize_chunk_with_retries(chunk_text, chunk_path, with_timestamps, client, previous_text, next_text, retries):
+    for attempt in range(retries + 1):
+        if text_to_speech_elevenlabs(chunk_text, chunk_path, with_timestamps=with_timestamps, client=client,
+                                     previous_text=previous_text, next_text=next_text):
+            return chunk_path
+        if attempt < retries:
+            delay = TTS_RETRY_BACKOFF * (2 ** attempt)
+            print(f"Retrying TTS chunk in {delay:.1f}s (attempt {attempt + 2} of {retries + 1})...")
+            time.sleep(delay)
+    raise RuntimeError(f"TTS failed after {retries + 1} attempts for chunk: '{chunk_text[:50]}...'")
 
-    # Create output directories if they don't exist
-    os.makedirs("output", exist_ok=True)
-    os.makedirs("assets/audio", exist_ok=True)
-    os.makedirs("assets/video", exist_ok=True)
+def _time_chunk_words(chunk_path, chunk_text):
+    """Word timings for one chunk: TTS timestamps, else forced alignment, else Whisper."""
+    alignment = load_tts_alignment(chunk_path)
+    if alignment:
+        return words_from_character_alignment(alignment)
+    if SUBTITLE_TIMING_MODE == "align":
+        try:
+            words = force_align_words(chunk_path, chunk_text.split())
+            if len(words) == len(chunk_text.split()):
+                return words
+        except Exception as e:
+            print(f"Error aligning chunk: {e}")
+    return transcribe_audio_to_words(chunk_path)
 
-    # --- Step 1b: Generate Audio from Text ---
-    print("\\n--- Generating Audio ---")
-    if not text_to_speech_elevenlabs(story_text, generated_audio_file):
-        print("Failed to generate audio. Exiting.")
-        exit()
-    
-    your_audio_file = generated_audio_file # Use the newly generated audio
+@instrumented("tts_chunked")
+def text_to_speech_chunked(text, output_path, client=None, max_workers=None, retries=None, time_words=True):
+    """
+    Long-story TTS: splits the story at sentence boundaries, synthesises the chunks concurrently
+    (bounded by max_workers, each retried with backoff) and times each chunk's words as soon as
+    it arrives, while the other chunks are still being synthesised. The decoded chunk audio is
+    joined and encoded into output_path, and the word timelines are shifted by each chunk's start.
+    Returns the subtitle segments for the whole story, or [] on failure.
 
-    # Check if the audio/video paths exist
-    if not os.path.exists(your_audio_file):
-        print("="*50)
+    With time_words=False nothing is timed here: the untimed chunks ({'text', 'path', 'offset'})
+    are returned instead, for time_story_chunks to time elsewhere (e.g. in a transcription worker).
+    """
+    max_workers = max_workers or TTS_CHUNK_CONCURRENCY
+    retries = TTS_CHUNK_RETRIES if retries is None else retries
+    with_timestamps = SUBTITLE_TIMING_MODE == "align"
+    chunks = split_story_into_chunks(text)
+    print(f"Synthesising {len(chunks)} chunks with up to {max_workers} concurrent requests...")
+
+    work_dir = tempfile.mkdtemp(prefix="tts_chunks_")
+    chunk_paths = [os.path.join(work_dir, f"chunk_{i:04d}{os.path.splitext(output_path)[1]}") for i in range(len(chunks))]
+    chunk_words = [None] * len(chunks)
+    chunk_offsets = []
+    keep_work_dir = False
+    start = time.perf_counter()
+    try:
+        # Network-bound synthesis in a thread pool; timing (CPU) in a single thread so it never oversubscribes
+        with ThreadPoolExecutor(max_workers=max_workers) as tts_pool, ThreadPoolExecutor(max_workers=1) as timing_pool:
+            tts_futures = {}
+            for i, chunk_text in enumerate(chunks):
+                previous_text = chunks[i - 1] if i > 0 else None
+                next_text = chunks[i + 1] if i + 1 < len(chunks) else None
+                future = tts_pool.submit(_synthesize_chunk_with_retries, chunk_text, chunk_paths[i],
+                                         with_timestamps, client, previous_text, next_text, retries)
+                tts_futures[future] = i
+            timing_futures = {}
+            for future in as_completed(tts_futures):
+                i = tts_futures[future]
+                future.result() # Raises if the chunk failed after all retries
+                if time_words:
+                    timing_futures[timing_pool.submit(_time_chunk_words, chunk_paths[i], chunks[i])] = i
+            for future in as_completed(timing_futures):
+                i = timing_futures[future]
+                chunk_words[i] = future.result()
+                if sum(words is not None for words in chunk_words) == 1:
+                    print(f"First chunk ready after {time.perf_counter() - start:.1f}s.")
+
+        # Stitch the decoded chunks, so the audio and the word offsets come from the same samples
+        # (stream-copying MP3s would keep every chunk's encoder delay and padding at the seams)
+        pcm_path = os.path.join(work_dir, "story.f32")
+        all_words_with_timing = []
+        offset = 0.0
+        with open(pcm_path, "wb") as f:
+            for chunk_path, words in zip(chunk_paths, chunk_words):
+                buffer = decode_audio_buffer(chunk_path)
+                f.write(buffer.tobytes())
+                chunk_offsets.append(offset)
+                for word in words or []:
+                    all_words_with_timing.append({'text': word['text'], 'start': word['start'] + offset,
+                                                  'end': word['end'] + offset})
+                offset += len(buffer) / AUDIO_BUFFER_RATE
+        cmd = [_ffmpeg_binary(), "-y", "-loglevel", "error",
+               "-f", "f32le", "-ar", str(AUDIO_BUFFER_RATE), "-ac", "1", "-i", pcm_path,
+               *(["-b:a", "192k"] if output_path.lower().endswith(".mp3") else []),
+               os.path.abspath(output_path)]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"Could not join the audio chunks: {result.stderr.strip()[-500:]}")
+            return []
+        os.remove(pcm_path)
+        if not time_words:
+            print(f"Chunked TTS complete in {time.perf_counter() - start:.1f}s ({len(chunks)} untimed chunks).")
+            keep_work_dir = True # time_story_chunks removes it
+            return [{'text': chunk_text, 'path': chunk_path, 'offset': offset}
+                    for chunk_text, chunk_path, offset in zip(chunks, chunk_paths, chunk_offsets)]
+    except Exception as e:
+        print(f"Error during chunked TTS: {e}")
+        return []
+    finally:
+        if not keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    final_segments = group_words_into_segments(all_words_with_timing)
+    print(f"Chunked TTS complete in {time.perf_counter() - start:.1f}s. Generated {len(final_segments)} subtitle segments.")
+    return final_segments
+
+def time_story_chunks(chunks):
+    """
+    Times the untimed chunks from text_to_speech_chunked(time_words=False), shifts each chunk's
+    words by its offset in the story audio and returns the subtitle segments for the whole story.
+    The chunk audio is deleted afterwards, whether or not timing succeeded.
+    """
+    words_with_timing = []
+    try:
+        for chunk in chunks:
+            for word in _time_chunk_words(chunk['path'], chunk['text']):
+                words_with_timing.append({'text': word['text'], 'start': word['start'] + chunk['offset'],
+                                          'end': word['end'] + chunk['offset']})
+    finally:
+        for work_dir in {os.path.dirname(chunk['path']) for chunk in chunks}:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    final_segments = group_words_into_segments(words_with_timing)
+    print(f"Timed {len(chunks)} chunks. Generated {len(final_segments)} subtitle segments.")
+    return final_segments
+
+class SubtitleImageCache:
+    """
+    Bounded LRU cache of rendered subtitle images (RGBA numpy arrays).
+    If cache_dir is set, images are also saved as .npy files so later runs can reuse them.
+    """
+
+    def __init__(self, max_items=SUBTITLE_CACHE_SIZE, cache_dir=SUBTITLE_CACHE_DIR):
+        self.max_items = max_items
+        self.cache_dir = cache_dir
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.npy")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+        if self.cache_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                try:
+                    import numpy as np
+                    image = np.load(path)
+                    self._put_memory(key, image)
+                    with self._lock:
+                        self.hits += 1
+                    return image
+                except Exception as e:
+                    print(f"Could not read cached subtitle image '{path}': {e}")
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, image):
+        image.flags.writeable = False # Cached images are shared, never modify them in place
+        self._put_memory(key, image)
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                path = self._disk_path(key)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                import numpy as np
+                with open(tmp_path, "wb") as f:
+                    np.save(f, image)
+                os.replace(tmp_path, path) # Atomic, so a crashed run never leaves a half-written file
+            except Exception as e:
+                print(f"Could not write subtitle image to disk cache: {e}")
+
+    def _put_memory(self, key, image):
+        with self._lock:
+            self._items[key] = image
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_subtitle_image_cache = SubtitleImageCache()
+_font_cache = {}
+
+def _load_subtitle_font(font, fontsize):
+    """
+    Loads a Pillow TrueType font by name or path. Raises FileNotFoundError if it is not installed:
+    Pillow's bitmap default font would give tiny captions that don't match the libass renders.
+    """
+    from PIL import ImageFont
+    key = (font, fontsize)
+    if key not in _font_cache:
+        try:
+            # Pillow searches the system font directories when given a bare name like "Impact"
+            _font_cache[key] = ImageFont.truetype(font, fontsize)
+        except OSError:
+            raise FileNotFoundError(f"Subtitle font '{font}' not found. "
+                                    "Set SUBTITLE_FONT to the path of a .ttf/.otf file.") from None
+    return _font_cache[key]
+
+def check_subtitle_font():
+    """Returns True if SUBTITLE_FONT can be loaded, otherwise prints why and returns False."""
+    try:
+        _load_subtitle_font(SUBTITLE_FONT, SUBTITLE_FONTSIZE)
+        return True
+    except OSError as e:
+        print(f"Cannot render subtitles: {e}")
+        return False
+
+def _copy_subtitle_font(work_dir):
+    """
+    Copies the font file Pillow resolved for SUBTITLE_FONT into work_dir and returns the option
+    that points libass at it, so the burned-in captions use exactly the font the layout was measured with.
+    """
+    shutil.copy(_load_subtitle_font(SUBTITLE_FONT, SUBTITLE_FONTSIZE).path, work_dir)
+    return ":fontsdir=."
+
+def _font_line_metrics(font):
+    """Returns (ascent, descent) in pixels; Pillow's old bitmap default font has no getmetrics()."""
+    if hasattr(font, "getmetrics"):
+        return font.getmetrics()
+    left, top, right, bottom = font.getbbox("Ag")
+    return bottom, 0
+
+def _wrap_caption_lines(draw, text, font, max_width, stroke_width):
+    """Greedy word wrap, like ImageMagick's 'caption' method."""
+    lines = []
+    current_line = ""
+    for word in text.split():
+        candidate = f"{current_line} {word}" if current_line else word
+        left, _, right, _ = draw.textbbox((0, 0), candidate, font=font, stroke_width=stroke_width)
+        if current_line and right - left > max_width:
+            lines.append(current_line)
+            current_line = word
+        else:
+            current_line = candidate
+    if current_line:
+        lines.append(current_line)
+    return lines
+
+def _rasterize_subtitle(text, font, fontsize, color, stroke_color, stroke_width, width):
+    """Renders centred, wrapped, stroked text into an RGBA array that is `width` pixels wide."""
+    import numpy as np
+    from PIL import Image, ImageDraw
+    pil_font = _load_subtitle_font(font, fontsize)
+    measure = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    lines = _wrap_caption_lines(measure, text, pil_font, width, stroke_width) or [""]
+
+    ascent, descent = _font_line_metrics(pil_font)
+    line_height = ascent + descent + 2 * stroke_width
+    height = line_height * len(lines)
+
+    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        left, _, right, _ = draw.textbbox((0, 0), line, font=pil_font, stroke_width=stroke_width)
+        x = (width - (right - left)) / 2 - left
+        y = i * line_height + stroke_width
+        draw.text((x, y), line, font=pil_font, fill=color,
+                  stroke_width=stroke_width, stroke_fill=stroke_color)
+    return np.asarray(image)
+
+def render_subtitle_image(text, video_width, font=SUBTITLE_FONT, fontsize=SUBTITLE_FONTSIZE,
+                          color=SUBTITLE_COLOR, stroke_color=SUBTITLE_STROKE_COLOR,
+                          stroke_width=SUBTITLE_STROKE_WIDTH, width_ratio=SUBTITLE_WIDTH_RATIO,
+                          cache=None):
+    """
+    Returns the subtitle `text` rendered as an RGBA numpy array (height, width, 4).
+    Each distinct (text, font, size, colours, stroke, width) combination is rasterized only once.
+    """
+    cache = cache or _subtitle_image_cache
+    width = int(video_width * width_ratio)
+    key = (text, font, fontsize, color, stroke_color, stroke_width, width)
+    image = cache.get(key)
+    if image is None:
+        image = _rasterize_subtitle(text, font, fontsize, color, stroke_color, stroke_width, width)
+        cache.put(key, image)
+    return image
+
+class SubtitleTimeline:
+    """
+    Sorted interval index over subtitle segments.
+    active_at(t) only looks at segments whose start lies in (t - longest duration, t],
+    found with bisect, so each frame costs O(log n + active) instead of O(n).
+    Segments are kept in typed arrays (start/end as doubles, the text as an index into the list
+    of distinct texts), about 20 bytes per segment instead of a dict each.
+    """
+
+    def __init__(self, segments):
+        self.starts = array("d")
+        self.ends = array("d")
+        self.text_ids = array("I")
+        self.order = array("I") # Original position, so overlapping subtitles stack like they did in CompositeVideoClip
+        self.texts = [] # Distinct texts, in order of first appearance
+        text_ids = {}
+        for position in sorted(range(len(segments)), key=lambda i: segments[i]['start']):
+            seg = segments[position]
+            self.starts.append(float(seg['start']))
+            self.ends.append(float(seg['end']))
+            self.text_ids.append(text_ids.setdefault(seg['text'], len(text_ids)))
+            self.order.append(position)
+        self.texts.extend(text_ids)
+        self.max_duration = max((end - start for start, end in zip(self.starts, self.ends)), default=0.0)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def text(self, i):
+        """Text of segment i (an index into this timeline)."""
+        return self.texts[self.text_ids[i]]
+
+    def active_at(self, t):
+        """Returns the indices (into this timeline) of segments visible at time t, bottom to top."""
+        lo = bisect.bisect_right(self.starts, t - self.max_duration)
+        hi = bisect.bisect_right(self.starts, t)
+        active = [i for i in range(lo, hi) if t < self.ends[i]]
+        active.sort(key=lambda i: self.order[i])
+        return active
+
+def _blend_rgba_onto(frame, rgba, x, y):
+    """Alpha-blends an RGBA overlay onto an RGB uint8 frame in place, with its top-left corner at (x, y)."""
+    import numpy as np
+    frame_h, frame_w = frame.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + rgba.shape[1], frame_w), min(y + rgba.shape[0], frame_h)
+    if x0 >= x1 or y0 >= y1:
+        return frame
+    overlay = rgba[y0 - y:y1 - y, x0 - x:x1 - x]
+    alpha = overlay[:, :, 3:4].astype(np.float32) / 255.0
+    region = frame[y0:y1, x0:x1]
+    region[:] = (overlay[:, :, :3] * alpha + region * (1.0 - alpha)).astype(np.uint8)
+    return frame
+
+def make_subtitle_frame_function(background_clip, timeline, video_size):
+    """
+    Returns a make_frame(t) for MoviePy's VideoClip that draws only the subtitles active at t
+    on top of the background frame, instead of asking every subtitle clip on every frame.
+    """
+    import numpy as np
+    def make_frame(t):
+        frame = np.array(background_clip.get_frame(t), dtype=np.uint8) # Copy, MoviePy may reuse its buffer
+        for i in timeline.active_at(t):
+            rgba = render_subtitle_image(timeline.text(i).upper(), video_size[0])
+            x = (video_size[0] - rgba.shape[1]) // 2
+            y = (video_size[1] - rgba.shape[0]) // 2
+            _blend_rgba_onto(frame, rgba, x, y)
+        return frame
+    return make_frame
+
+def _ffmpeg_binary():
+    """Returns the ffmpeg executable MoviePy is configured to use (bundled by imageio-ffmpeg)."""
+    from moviepy.config import get_setting
+    return get_setting("FFMPEG_BINARY")
+
+def _media_duration(path):
+    """Returns the duration of an audio/video file in seconds, as reported by ffmpeg."""
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+    return ffmpeg_parse_infos(path)['duration']
+
+def _audio_buffer_root():
+    """The artifact cache, or a directory owned by this process when the cache is disabled."""
+    global _audio_buffer_dir
+    if ARTIFACT_CACHE_ENABLED:
+        return ARTIFACT_CACHE_DIR
+    with _artifact_cache_lock:
+        if _audio_buffer_dir is None:
+            _audio_buffer_dir = tempfile.mkdtemp(prefix="audio-buffers-")
+            atexit.register(shutil.rmtree, _audio_buffer_dir, True)
+    return _audio_buffer_dir
+
+def decode_audio_buffer(audio_path):
+    """
+    Decodes an audio file once into a mono float32 buffer at AUDIO_BUFFER_RATE, stored as a raw
+    file in the artifact cache and returned as a read-only np.memmap. Every later consumer
+    (Whisper, the ffmpeg muxers and renders, worker processes) shares this buffer instead of
+    decoding the file again; memory-mapping keeps one copy in the page cache for all processes.
+    Buffers are evicted like other artifacts and marked as used on every call, so one in use
+    stays. With the cache disabled they go to a temporary directory that is removed at exit.
+    """
+    import numpy as np
+    key = content_hash("pcm", file_sha256(audio_path), AUDIO_BUFFER_RATE)
+    root = _audio_buffer_root()
+    buffer_path = os.path.join(root, "pcm", f"{key}.f32")
+    try:
+        os.utime(buffer_path) # Mark as recently used for eviction
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(buffer_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(buffer_path), suffix=".tmp")
+        os.close(fd)
+        cmd = [_ffmpeg_binary(), "-y", "-loglevel", "error", "-i", audio_path,
+               "-f", "f32le", "-ac", "1", "-ar", str(AUDIO_BUFFER_RATE), tmp_path]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            os.remove(tmp_path)
+            raise RuntimeError(f"Could not decode '{audio_path}': {result.stderr.strip()[-500:]}")
+        os.replace(tmp_path, buffer_path)
+        evict_artifact_cache(cache_dir=root)
+    if os.path.getsize(buffer_path) == 0:
+        return np.zeros(0, dtype=np.float32)
+    buffer = np.memmap(buffer_path, dtype=np.float32, mode="r")
+    buffer.path = buffer_path # So ffmpeg and other processes can open the same buffer
+    return buffer
+
+def audio_duration(audio_path):
+    """Duration of the audio in seconds, from the shared decoded buffer."""
+    return len(decode_audio_buffer(audio_path)) / AUDIO_BUFFER_RATE
+
+def load_whisper_audio(audio_path):
+    """
+    Returns the audio as Whisper expects it (mono float32 at 16 kHz) from the shared buffer,
+    without starting another ffmpeg process. AUDIO_BUFFER_RATE is a multiple of 16 kHz, so this
+    is a low-pass filter plus decimation, done in blocks to keep memory flat for long audio.
+    """
+    import numpy as np
+    buffer = decode_audio_buffer(audio_path)
+    factor = AUDIO_BUFFER_RATE // WHISPER_SAMPLE_RATE
+    if factor == 1:
+        return np.array(buffer, dtype=np.float32)
+    # Windowed-sinc low-pass at 90% of the new Nyquist frequency
+    taps = 32 * factor + 1
+    n = np.arange(taps) - (taps - 1) / 2
+    cutoff = 0.9 / factor
+    kernel = (cutoff * np.sinc(cutoff * n) * np.hamming(taps)).astype(np.float32)
+    kernel /= kernel.sum()
+
+    half = (taps - 1) // 2
+    output = np.empty((len(buffer) + factor - 1) // factor, dtype=np.float32)
+    block = factor * WHISPER_SAMPLE_RATE * 30 # 30 s of input per block
+    for start in range(0, len(buffer), block):
+        stop = min(start + block, len(buffer))
+        lo, hi = max(start - half, 0), min(stop + half, len(buffer))
+        filtered = np.convolve(buffer[lo:hi], kernel, mode="same")
+        # Keep the samples at multiples of `factor` (absolute index) that fall inside this block
+        first = start - lo + (-start % factor)
+        decimated = filtered[first:first + (stop - start - (-start % factor)):factor]
+        output[(start + factor - 1) // factor:(start + factor - 1) // factor + len(decimated)] = decimated
+    return output
+
+def _audio_input_args(audio_path):
+    """ffmpeg input arguments that read the shared decoded buffer instead of decoding the file again."""
+    buffer = decode_audio_buffer(audio_path)
+    if not hasattr(buffer, "path"):
+        return ["-i", os.path.abspath(audio_path)]
+    return ["-f", "f32le", "-ar", str(AUDIO_BUFFER_RATE), "-ac", "1", "-i", os.path.abspath(buffer.path)]
+
+def _mux_buffer_audio(video_path, audio_path, output_path):
+    """
+    Adds the audio to a silent video: the video stream is copied and the shared decoded buffer is
+    encoded once to AAC, so the track has the buffer's exact length and sample rate.
+    """
+    cmd = [
+        _ffmpeg_binary(), "-y", "-loglevel", "error",
+        "-i", os.path.abspath(video_path),
+        *_audio_input_args(audio_path),
+        "-map", "0:v", "-map", "1:a",
+        "-c:v", "copy", "-c:a", "aac",
+        "-t", f"{audio_duration(audio_path):.3f}",
+        os.path.abspath(output_path),
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"ffmpeg audio mux failed: {result.stderr.strip()[-500:]}")
+        return False
+    return True
+
+def _format_ass_time(seconds):
+    """Formats seconds as an ASS timestamp (H:MM:SS.cc)."""
+    centiseconds = int(round(max(seconds, 0) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+def _ass_color(color):
+    """Converts a colour name or RGB tuple to an ASS &HAABBGGRR colour (fully opaque)."""
+    from PIL import ImageColor
+    r, g, b = ImageColor.getrgb(color)[:3] if isinstance(color, str) else color[:3]
+    return f"&H00{b:02X}{g:02X}{r:02X}"
+
+def write_ass_subtitles(segments, ass_path, video_size, font=SUBTITLE_FONT, fontsize=SUBTITLE_FONTSIZE,
+                        color=SUBTITLE_COLOR, stroke_color=SUBTITLE_STROKE_COLOR,
+                        stroke_width=SUBTITLE_STROKE_WIDTH, width_ratio=SUBTITLE_WIDTH_RATIO,
+                        alignment=5, margin_v=0):
+    """
+    Writes the subtitle segments as an ASS file with the same look as the Pillow rasterizer:
+    centred, uppercase, white fill with a black stroke, wrapped at 85% of the video width.
+    alignment/margin_v are ASS numpad positions (5 = middle centre, 2 = bottom centre) and the
+    vertical margin in pixels.
+    """
+    pil_font = _load_subtitle_font(font, fontsize)
+    font_name = pil_font.getname()[0] # The family name libass matches against the copied font file
+    # ASS font size is the line height, so use the real ascent + descent of the font at `fontsize`
+    ass_fontsize = sum(_font_line_metrics(pil_font))
+    side_margin = int(video_size[0] * (1 - width_ratio) / 2)
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {video_size[0]}",
+        f"PlayResY: {video_size[1]}",
+        "WrapStyle: 1", # Greedy end-of-line wrapping, like ImageMagick's caption method
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Caption,{font_name},{ass_fontsize},{_ass_color(color)},{_ass_color(color)},"
+        f"{_ass_color(stroke_color)},&H00000000,0,0,0,0,100,100,0,0,1,{stroke_width},0,"
+        f"{alignment},{side_margin},{side_margin},{margin_v},1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for seg in segments:
+        text = " ".join(seg['text'].upper().split()) # Newlines would otherwise end the Dialogue line
+        text = text.replace("\\", "\\\u2060").replace("{", "\\{").replace("}", "\\}")
+        lines.append(f"Dialogue: 0,{_format_ass_time(seg['start'])},{_format_ass_time(seg['end'])},"
+                     f"Caption,,0,0,0,,{text}")
+
+    with open(ass_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return ass_path
+
+def _looped_background_input(background_video_path, background_offset=0.0):
+    """
+    ffmpeg inputs for a background that starts at background_offset and then loops from its
+    start, like MoviePy's (offset + t) % duration. Returns (input_args, filtergraph, inputs):
+    the filtergraph reads the first `inputs` inputs and outputs the label [bg].
+    An input -ss together with -stream_loop would seek again on every pass (skipping the head
+    and repeating the tail), so the first pass is a separate, trimmed input joined to the loop.
+    """
+    path = os.path.abspath(background_video_path)
+    background_duration = _media_duration(path) if background_offset > 0 else 0
+    if not background_duration or background_offset >= background_duration:
+        return ["-stream_loop", "-1", "-i", path], "[0:v]null[bg]", 1
+    input_args = [
+        "-ss", f"{background_offset:.3f}", "-t", f"{background_duration - background_offset:.3f}", "-i", path,
+        "-stream_loop", "-1", "-i", path,
+    ]
+    return input_args, "[0:v][1:v]concat=n=2:v=1:a=0[bg]", 2
+
+def _render_with_ffmpeg(audio_path, segments, output_path, video_size, background_video_path=None, fps=VIDEO_FPS,
+                        background_offset=0.0):
+    """
+    Renders the video in one ffmpeg pass: scale/crop the background, burn in the ASS subtitles
+    with libass and mux the audio. No frames go through Python.
+    """
+    width, height = video_size
+    duration = audio_duration(audio_path)
+    with tempfile.TemporaryDirectory() as work_dir:
+        # ffmpeg runs inside work_dir so the subtitles filter gets a plain relative path (no escaping needed)
+        write_ass_subtitles(segments, os.path.join(work_dir, "subtitles.ass"), video_size)
+        subtitles_filter = "subtitles=subtitles.ass" + _copy_subtitle_font(work_dir)
+
+        cmd = [_ffmpeg_binary(), "-y", "-loglevel", "error"]
+        if background_video_path:
+            # Loop the background forever from the chosen offset; -t below cuts it to the audio length
+            input_args, background_filter, inputs = _looped_background_input(background_video_path, background_offset)
+            cmd += input_args
+            video_filter = (f"{background_filter};[bg]scale={width}:{height}:force_original_aspect_ratio=increase,"
+                            f"crop={width}:{height},setsar=1,fps={fps},{subtitles_filter}[v]")
+        else:
+            color = "0x{:02x}{:02x}{:02x}".format(*BACKGROUND_COLOR)
+            cmd += ["-f", "lavfi", "-i", f"color=c={color}:s={width}x{height}:r={fps}"]
+            video_filter = f"[0:v]{subtitles_filter}[v]"
+            inputs = 1
+        cmd += _audio_input_args(audio_path)
+        cmd += [
+            "-filter_complex", video_filter,
+            "-map", "[v]", "-map", f"{inputs}:a",
+            "-t", f"{duration:.3f}",
+            "-c:v", "libx264", "-preset", "medium", "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            os.path.abspath(output_path),
+        ]
+        result = subprocess.run(cmd, cwd=work_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"ffmpeg render failed: {result.stderr.strip()[-500:]}")
+        return False
+    return True
+
+def _variant_caption_layout(variant):
+    """Caption style for an output variant: the subtitle settings scaled to its size, then its own overrides."""
+    scale = min(variant['size']) / 1080
+    layout = {
+        'fontsize': max(8, int(round(SUBTITLE_FONTSIZE * scale))),
+        'stroke_width': max(1, int(round(SUBTITLE_STROKE_WIDTH * scale))),
+        'width_ratio': SUBTITLE_WIDTH_RATIO,
+        'alignment': 5,
+        'margin_v': 0,
+    }
+    layout.update(variant.get('caption_layout') or {})
+    return layout
+
+def _render_variants_with_ffmpeg(audio_path, segments, variants, background_video_path=None, background_offset=0.0):
+    """
+    Renders every variant in one ffmpeg process: the background is decoded once and split into
+    one branch per variant (scale/crop, fps, captions burned in by libass), and each branch is
+    encoded to its own file with its own codec settings.
+    """
+    duration = audio_duration(audio_path)
+    with tempfile.TemporaryDirectory() as work_dir:
+        fontsdir = _copy_subtitle_font(work_dir)
+
+        cmd = [_ffmpeg_binary(), "-y", "-loglevel", "error"]
+        background_filter, inputs = "[0:v]null[bg]", 1
+        if is_still_image(background_video_path):
+            fps = max(variant['fps'] for variant in variants)
+            cmd += ["-loop", "1", "-framerate", str(fps), "-i", os.path.abspath(background_video_path)]
+        elif background_video_path:
+            input_args, background_filter, inputs = _looped_background_input(background_video_path, background_offset)
+            cmd += input_args
+        else:
+            width = max(variant['size'][0] for variant in variants)
+            height = max(variant['size'][1] for variant in variants)
+            fps = max(variant['fps'] for variant in variants)
+            color = "0x{:02x}{:02x}{:02x}".format(*BACKGROUND_COLOR)
+            cmd += ["-f", "lavfi", "-i", f"color=c={color}:s={width}x{height}:r={fps}"]
+        cmd += _audio_input_args(audio_path)
+
+        branches = "".join(f"[b{i}]" for i in range(len(variants)))
+        filters = [background_filter,
+                   f"[bg]split={len(variants)}{branches}" if len(variants) > 1 else "[bg]null[b0]"]
+        for i, variant in enumerate(variants):
+            width, height = variant['size']
+            layout = _variant_caption_layout(variant)
+            write_ass_subtitles(segments, os.path.join(work_dir, f"variant_{i}.ass"), variant['size'],
+                                fontsize=layout['fontsize'], stroke_width=layout['stroke_width'],
+                                width_ratio=layout['width_ratio'], alignment=layout['alignment'],
+                                margin_v=layout['margin_v'])
+            filters.append(f"[b{i}]scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},"
+                           f"setsar=1,fps={variant['fps']},subtitles=variant_{i}.ass{fontsdir}[v{i}]")
+        cmd += ["-filter_complex", ";".join(filters)]
+        for i, variant in enumerate(variants):
+            cmd += [
+                "-map", f"[v{i}]", "-map", f"{inputs}:a",
+                "-t", f"{duration:.3f}",
+                "-c:v", variant['codec'], "-crf", str(variant['crf']), "-preset", variant['preset'],
+                "-pix_fmt", "yuv420p",
+                "-c:a", "aac",
+                "-movflags", "+faststart",
+                os.path.abspath(variant['path']),
+            ]
+        result = subprocess.run(cmd, cwd=work_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"ffmpeg variant render failed: {result.stderr.strip()[-500:]}")
+        return False
+    return True
+
+def render_video_variants(audio_path, segments, variants, background_video_path=None):
+    """
+    Renders several output formats of the same video (e.g. 9:16, 1:1, 16:9 and a preview) from
+    one decode of the background and one caption timeline.
+
+    Args:
+        variants (list): Output specs, each a dict with 'path' plus either 'name' (a key of
+                         OUTPUT_VARIANTS) or its own 'size', 'fps', 'codec', 'crf', 'preset' and
+                         optional 'caption_layout' ({'fontsize', 'stroke_width', 'width_ratio',
+                         'alignment', 'margin_v'}); given keys override the named variant.
+        background_video_path (str, optional): Background video; the original is used (not the
+                         9:16 proxy) so every aspect ratio is cropped from full resolution.
+
+    Variants already in the artifact cache are copied, only the rest are rendered (nothing is
+    cached when BACKGROUND_OFFSET is "random").
+    Returns True if every variant was written.
+    """
+    variants = [{**OUTPUT_VARIANTS.get(variant.get('name'), {}), **variant} for variant in variants]
+    background_offset = 0.0
+    if background_video_path and not is_still_image(background_video_path):
+        background_offset = choose_background_offset(background_video_path, seed=file_sha256(audio_path))
+    use_cache = not _random_background_offset(background_video_path)
+    base_key = [segments, file_sha256(audio_path),
+                file_sha256(background_video_path) if background_video_path else BACKGROUND_COLOR,
+                round(background_offset, 3), SUBTITLE_FONT, SUBTITLE_COLOR, SUBTITLE_STROKE_COLOR, "aac"]
+
+    missing = []
+    for variant in variants:
+        os.makedirs(os.path.dirname(os.path.abspath(variant['path'])), exist_ok=True)
+        spec = [list(variant['size']), variant['fps'], variant['codec'], variant['crf'], variant['preset'],
+                _variant_caption_layout(variant)]
+        variant['cache_key'] = content_hash("video-variant", *base_key, *spec)
+        if use_cache and cache_get_file("video", variant['cache_key'], variant['path'], ".mp4"):
+            print(f"Using cached {variant.get('name') or variant['size']} variant: {variant['path']}")
+        else:
+            missing.append(variant)
+    if not missing:
+        return True
+    if segments and not check_subtitle_font():
+        return False
+
+    names = ", ".join(str(variant.get('name') or variant['size']) for variant in missing)
+    print(f"Rendering {len(missing)} variants in one ffmpeg pass: {names}")
+    with instrument_stage("encode", backend="ffmpeg-variants", variants=len(missing)) as record:
+        record['ok'] = _render_variants_with_ffmpeg(audio_path, segments, missing, background_video_path,
+                                                    background_offset)
+    if not record['ok']:
+        return False
+    for variant in missing:
+        if use_cache:
+            cache_put_file("video", variant['cache_key'], variant['path'], ".mp4")
+        print(f"Video successfully saved to {variant['path']}")
+    return True
+
+def prepare_background_proxy(background_video_path, video_size=(1080, 1920), fps=VIDEO_FPS):
+    """
+    One-time preprocessing of a background video: scales and centre-crops it to video_size at
+    the target fps, with a keyframe every second so random offsets seek quickly. The proxy is
+    stored in BACKGROUND_PROXY_DIR and reused by every later render. Returns its path, or None
+    if ffmpeg failed (the original is then scaled on the fly).
+    """
+    width, height = video_size
+    stem = os.path.splitext(os.path.basename(background_video_path))[0]
+    key = content_hash("proxy", file_sha256(background_video_path), list(video_size), fps, "sar1")[:16]
+    proxy_path = os.path.join(BACKGROUND_PROXY_DIR, f"{stem}_{width}x{height}_{fps}fps_{key}.mp4")
+    if os.path.exists(proxy_path):
+        return proxy_path
+
+    print(f"Preparing background proxy for {background_video_path} (one-time)...")
+    os.makedirs(BACKGROUND_PROXY_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=BACKGROUND_PROXY_DIR, suffix=".mp4")
+    os.close(fd)
+    cmd = [
+        _ffmpeg_binary(), "-y", "-loglevel", "error",
+        "-i", background_video_path,
+        "-an",
+        # setsar=1: scaling to cover can round to a sample aspect ratio like 4095:4096
+        "-vf", f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},setsar=1,fps={fps}",
+        "-c:v", "libx264", "-preset", "fast", "-crf", "18", "-pix_fmt", "yuv420p",
+        "-g", str(fps), "-keyint_min", str(fps), "-sc_threshold", "0",
+        "-movflags", "+faststart",
+        tmp_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        os.remove(tmp_path)
+        print(f"Could not prepare background proxy: {result.stderr.strip()[-500:]}")
+        return None
+    os.replace(tmp_path, proxy_path)
+    print(f"Background proxy saved to {proxy_path}")
+    return proxy_path
+
+def choose_background_offset(background_video_path, seed=None):
+    """
+    Picks where in the background video a render starts, according to BACKGROUND_OFFSET:
+    "random", "seeded" (deterministic for the same seed, e.g. the audio hash) or a number of seconds.
+    """
+    background_duration = _media_duration(background_video_path)
+    if not background_duration:
+        return 0.0
+    if BACKGROUND_OFFSET == "random":
+        return random.uniform(0, background_duration)
+    if BACKGROUND_OFFSET == "seeded":
+        return random.Random(seed).uniform(0, background_duration)
+    return float(BACKGROUND_OFFSET) % background_duration
+
+def is_still_image(path):
+    return bool(path) and path.lower().endswith(STILL_IMAGE_EXTENSIONS)
+
+def _random_background_offset(background_video_path):
+    """True if the render starts at a random point of a background video, so its output cannot be cached."""
+    return BACKGROUND_OFFSET == "random" and bool(background_video_path) and not is_still_image(background_video_path)
+
+class _StillBackground:
+    """A fixed background frame with the get_frame(t) interface of a MoviePy clip."""
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def get_frame(self, t):
+        return self.frame
+
+def static_background_frame(video_size, background_image_path=None):
+    """The background as an RGB array: the image scaled to cover video_size and centre-cropped, or BACKGROUND_COLOR."""
+    import numpy as np
+    from PIL import Image, ImageOps
+    if background_image_path:
+        with Image.open(background_image_path) as image:
+            return np.asarray(ImageOps.fit(image.convert("RGB"), tuple(video_size), Image.LANCZOS))
+    return np.full((video_size[1], video_size[0], 3), BACKGROUND_COLOR, dtype=np.uint8)
+
+def caption_change_frames(segments, total_frames, fps=VIDEO_FPS):
+    """
+    Frame indices where the picture can change: 0, the first frame at or after every segment start
+    and end (the frames a constant-rate render would switch on), and total_frames.
+    """
+    frames = {0, total_frames}
+    for seg in segments:
+        for t in (seg['start'], seg['end']):
+            frame = math.ceil(t * fps - 1e-6)
+            if 0 < frame < total_frames:
+                frames.add(frame)
+    return sorted(frames)
+
+def render_static_background_video(audio_path, segments, output_path, video_size, background_image_path=None,
+                                   fps=VIDEO_FPS):
+    """
+    Renders a video with a static background by encoding one image per caption change instead of
+    fps full frames per second: every distinct picture is composited once (with the same code as
+    the MoviePy path) and written as a PNG, and an ffmpeg concat list shows each for its duration.
+    The result is variable frame rate; each picture starts on the same frame as in a constant-rate
+    render.
+    """
+    from PIL import Image
+    total_frames = int(round(audio_duration(audio_path) * fps))
+    timeline = SubtitleTimeline(segments)
+    make_frame = make_subtitle_frame_function(_StillBackground(static_background_frame(video_size, background_image_path)),
+                                              timeline, video_size)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        picture_files = {} # Captions on screen -> PNG of that picture
+        shown = [] # [picture file, frames], consecutive identical pictures merged
+        boundaries = caption_change_frames(segments, total_frames, fps)
+        for first, last in zip(boundaries, boundaries[1:]):
+            t = first / fps
+            captions = tuple(timeline.text(i).upper() for i in timeline.active_at(t))
+            if captions not in picture_files:
+                picture_files[captions] = f"picture_{len(picture_files):05d}.png"
+                Image.fromarray(make_frame(t)).save(os.path.join(work_dir, picture_files[captions]), compress_level=1)
+            if shown and shown[-1][0] == picture_files[captions]:
+                shown[-1][1] += last - first
+            else:
+                shown.append([picture_files[captions], last - first])
+
+        list_path = os.path.join(work_dir, "pictures.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for name, frames in shown:
+                f.write(f"file '{name}'\nduration {frames / fps:.6f}\n")
+            f.write(f"file '{shown[-1][0]}'\n") # The concat demuxer ignores the last duration otherwise
+        print(f"Encoding {len(shown)} pictures ({len(picture_files)} distinct) instead of {total_frames} frames.")
+
+        cmd = [_ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+        cmd += _audio_input_args(audio_path)
+        cmd += [
+            "-map", "0:v", "-map", "1:a",
+            # No -t: it would drop the closing concat entry, and with it the last picture's duration
+            "-c:v", "libx264", "-preset", "medium", "-tune", "stillimage", "-pix_fmt", "yuv420p",
+            "-fps_mode", "vfr",
+            "-c:a", "aac",
+            "-movflags", "+faststart",
+            os.path.abspath(output_path),
+        ]
+        result = subprocess.run(cmd, cwd=work_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"ffmpeg static render failed: {result.stderr.strip()[-500:]}")
+        return False
+    return True
+
+def _open_background_clip(background_video_path, video_size, video_duration, background_offset=0.0):
+    """
+    Opens the background video starting at background_offset and looping for video_duration,
+    or a solid colour clip. Proxies are already at video_size; anything else is scaled on the fly.
+    """
+    from moviepy.editor import ColorClip, VideoFileClip
+    if background_video_path:
+        print(f"Using background video: {background_video_path}")
+        background_clip = VideoFileClip(background_video_path, audio=False)
+        if tuple(background_clip.size) != tuple(video_size):
+            # Resize background to target video_size, cropping if necessary
+            background_clip = background_clip.resize(height=video_size[1]) # Resize based on height
+            if background_clip.w < video_size[0]: # If width is still too small (after height resize), resize by width
+                 background_clip = background_clip.resize(width=video_size[0])
+            background_clip = background_clip.crop(x_center=background_clip.w/2, y_center=background_clip.h/2, width=video_size[0], height=video_size[1])
+        # Start at the offset and loop if the background is shorter than the audio
+        loop_duration = background_clip.duration
+        background_clip = background_clip.fl_time(lambda t: (background_offset + t) % loop_duration, apply_to=[])
+        background_clip = background_clip.set_duration(video_duration)
+    else:
+        print("Using solid color background.")
+        background_clip = ColorClip(size=video_size, color=BACKGROUND_COLOR, duration=video_duration) # Dark grey background
+    return background_clip
+
+def split_timeline_into_chunks(segments, duration, num_chunks, fps=VIDEO_FPS):
+    """
+    Splits [0, duration) into up to num_chunks (start_frame, end_frame) ranges.
+    Cuts land on frame boundaries at the subtitle start closest to each even split point,
+    so no caption is cut in half and every chunk renders exactly the frames the
+    single-process render would have.
+    """
+    total_frames = int(round(duration * fps))
+    # A cut at frame k shows the subtitle starting at `start` on its first frame when k = ceil(start * fps)
+    candidates = sorted({math.ceil(seg['start'] * fps - 1e-6) for seg in segments} - {0})
+    candidates = [k for k in candidates if 0 < k < total_frames]
+    cuts = []
+    for i in range(1, num_chunks):
+        target = total_frames * i / num_chunks
+        if candidates:
+            cut = min(candidates, key=lambda k: abs(k - target))
+        else:
+            cut = int(round(target))
+        if cut > (cuts[-1] if cuts else 0) and cut < total_frames:
+            cuts.append(cut)
+    boundaries = [0] + cuts + [total_frames]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def _render_video_chunk(chunk_path, segments, start_frame, end_frame, video_size, background_video_path,
+                        video_duration, fps, threads, background_offset=0.0):
+    """
+    Renders frames [start_frame, end_frame) (no audio) to chunk_path. Runs in a worker process.
+    Every chunk is encoded with identical x264 settings and a closed GOP starting on a keyframe,
+    so the chunks can be joined with stream copy.
+    """
+    from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+    background_clip = _open_background_clip(background_video_path, video_size, video_duration, background_offset)
+    timeline = SubtitleTimeline(segments)
+    make_frame = make_subtitle_frame_function(background_clip, timeline, video_size)
+    writer = FFMPEG_VideoWriter(
+        chunk_path, video_size, fps, codec="libx264", preset="medium", threads=threads,
+        ffmpeg_params=["-g", str(fps * 2), "-keyint_min", str(fps), "-sc_threshold", "0",
+                       "-x264-params", "open-gop=0", "-video_track_timescale", str(fps * 1000)],
+    )
+    try:
+        for frame_index in range(start_frame, end_frame):
+            # Frame times are absolute, so the chunk shows exactly what a single render would show
+            writer.write_frame(make_frame(frame_index / fps))
+    finally:
+        writer.close()
+        if background_video_path:
+            background_clip.close()
+    return chunk_path
+
+def render_video_parallel(audio_path, segments, output_path, video_size=(1080, 1920), background_video_path=None,
+                          workers=None, fps=VIDEO_FPS, background_offset=0.0):
+    """
+    Renders the video in `workers` processes. The timeline is split at subtitle boundaries,
+    each chunk is rendered and encoded in its own process, and a final ffmpeg pass joins the
+    chunks with stream copy and adds the full audio track.
+    """
+    workers = workers or os.cpu_count() or 1
+    video_duration = audio_duration(audio_path)
+    chunks = split_timeline_into_chunks(segments, video_duration, workers, fps)
+    threads_per_chunk = max(1, (os.cpu_count() or 1) // len(chunks))
+    print(f"Rendering {len(chunks)} chunks in parallel with {workers} worker processes...")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        futures = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for i, (start_frame, end_frame) in enumerate(chunks):
+                start_time, end_time = start_frame / fps, end_frame / fps
+                chunk_segments = [seg for seg in segments if seg['end'] > start_time and seg['start'] < end_time]
+                chunk_path = os.path.join(work_dir, f"chunk_{i:04d}.mp4")
+                futures.append(executor.submit(
+                    _render_video_chunk, chunk_path, chunk_segments, start_frame, end_frame, video_size,
+                    background_video_path, video_duration, fps, threads_per_chunk, background_offset))
+            chunk_paths = [future.result() for future in futures]
+
+        list_path = os.path.join(work_dir, "chunks.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for chunk_path in chunk_paths:
+                f.write(f"file '{os.path.basename(chunk_path)}'\n")
+        cmd = [
+            _ffmpeg_binary(), "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            *_audio_input_args(audio_path),
+            "-map", "0:v", "-map", "1:a",
+            "-c:v", "copy", "-c:a", "aac",
+            "-t", f"{video_duration:.3f}",
+            os.path.abspath(output_path),
+        ]
+        result = subprocess.run(cmd, cwd=work_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"ffmpeg concat failed: {result.stderr.strip()[-500:]}")
+        return False
+    return True
+
+def _read_frame_into(stream, view):
+    """Fills `view` with the next frame from a pipe; returns False at the end of the stream."""
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            return False
+        filled += count
+    return True
+
+def render_video_streaming(audio_path, segments, output_path, video_size=(1080, 1920), background_video_path=None,
+                           fps=VIDEO_FPS, background_offset=0.0):
+    """
+    Renders with the MoviePy backend's compositing, but in memory that does not depend on the
+    length of the video:
+    - an ffmpeg reader process decodes, scales and crops the background and hands it over one
+      frame at a time (a still image or solid colour is a single fixed frame);
+    - segments live in an array-backed SubtitleTimeline, and each caption is rasterized when it
+      first becomes active and kept only in a small LRU cache (STREAM_CAPTION_CACHE_SIZE);
+    - every frame is read and composited in one preallocated buffer and written straight to an
+      ffmpeg encoder's stdin;
+    - the encoder reads the audio from the shared decoded buffer itself, so no audio passes
+      through Python.
+    Peak RSS at 1080x1920 is about 80 MB for this process plus about 550 MB for the ffmpeg reader
+    and encoder (mostly x264 lookahead), whatever the duration (benchmark.py memory).
+
+    segments may also be a SubtitleTimeline, so callers can drop the list of dicts before rendering.
+    """
+    import numpy as np
+    width, height = video_size
+    timeline = segments if isinstance(segments, SubtitleTimeline) else SubtitleTimeline(segments)
+    total_frames = int(round(audio_duration(audio_path) * fps))
+    caption_cache = SubtitleImageCache(max_items=STREAM_CAPTION_CACHE_SIZE, cache_dir=None)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame_view = memoryview(frame).cast("B")
+
+    background = None
+    reader = None
+    with tempfile.TemporaryFile() as reader_log, tempfile.TemporaryFile() as encoder_log:
+        if background_video_path and not is_still_image(background_video_path):
+            input_args, background_filter, _ = _looped_background_input(background_video_path, background_offset)
+            reader = subprocess.Popen([
+                _ffmpeg_binary(), "-loglevel", "error",
+                *input_args,
+                "-filter_complex", f"{background_filter};[bg]scale={width}:{height}:force_original_aspect_ratio=increase,"
+                                   f"crop={width}:{height},fps={fps}[v]",
+                "-map", "[v]", "-f", "rawvideo", "-pix_fmt", "rgb24", "-",
+            ], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=reader_log)
+        else:
+            background = static_background_frame(video_size, background_video_path)
+        encoder = subprocess.Popen([
+            _ffmpeg_binary(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+            *_audio_input_args(audio_path),
+            "-map", "0:v", "-map", "1:a",
+            "-c:v", "libx264", "-preset", "medium", "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            os.path.abspath(output_path),
+        ], stdin=subprocess.PIPE, stderr=encoder_log)
+
+        ok = True
+        try:
+            for frame_index in range(total_frames):
+                if reader is None:
+                    np.copyto(frame, background)
+                elif not _read_frame_into(reader.stdout, frame_view):
+                    reader_log.seek(0)
+                    print(f"Background reader stopped early: {reader_log.read().decode(errors='replace').strip()[-500:]}")
+                    ok = False
+                    break
+                for i in timeline.active_at(frame_index / fps):
+                    rgba = render_subtitle_image(timeline.text(i).upper(), width, cache=caption_cache)
+                    _blend_rgba_onto(frame, rgba, (width - rgba.shape[1]) // 2, (height - rgba.shape[0]) // 2)
+                encoder.stdin.write(frame_view)
+        except BrokenPipeError:
+            ok = False # The encoder exited; its log says why
+        finally:
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+            encoder.wait()
+            if reader is not None:
+                reader.kill()
+                reader.stdout.close()
+                reader.wait()
+        if encoder.returncode != 0:
+            encoder_log.seek(0)
+            print(f"ffmpeg encoder failed: {encoder_log.read().decode(errors='replace').strip()[-500:]}")
+            return False
+    return ok
+
+def create_styled_subtitle_video(audio_path, segments, output_path="output_video.mp4", video_size=(1080, 1920), background_video_path=None, backend=None, workers=None):
+    """
+    Creates a video with styled, synchronized subtitles.
+
+    Args:
+        audio_path (str): Path to the audio file.
+        segments (list): A list of dictionaries, where each dictionary represents a subtitle segment.
+                         Each dict should have 'text' (str), 'start' (float), and 'end' (float) keys.
+                         Example: [{'text': 'HELLO', 'start': 0.5, 'end': 1.0}, ...]
+        output_path (str): Path to save the output video file.
+        video_size (tuple): (width, height) of the output video. Default is 1080x1920 for shorts/reels.
+        background_video_path (str, optional): Path to a background video file, or a still image. Defaults to None (solid color).
+                                 Solid colour and still image backgrounds use the static fast path
+                                 (see STATIC_BACKGROUND_FAST_PATH).
+        backend (str, optional): "moviepy", "ffmpeg", "stream" or "parallel" (MoviePy with one
+                                 worker per core unless workers is given). Defaults to RENDER_BACKEND.
+                                 The ffmpeg and stream backends fall back to MoviePy if they fail.
+                                 MoviePy renders longer than STREAM_RENDER_SECONDS use the stream
+                                 backend (after a failed parallel render too).
+        workers (int, optional): Number of processes for the MoviePy backend. Defaults to RENDER_WORKERS.
+                                 With more than one, the timeline is rendered in parallel chunks.
+                                 Ignored by the other backends.
+    """
+    backend = backend or RENDER_BACKEND
+    workers = workers or RENDER_WORKERS
+    if backend == "parallel":
+        backend = "moviepy"
+        workers = workers if workers > 1 else os.cpu_count() or 1
+
+    # The output only depends on these inputs, so an unchanged job reuses the cached video.
+    # A "seeded" or numeric BACKGROUND_OFFSET resolves to the same offset for the same inputs; a random one does not.
+    use_cache = not _random_background_offset(background_video_path)
+    video_key = content_hash(
+        "video", segments, file_sha256(audio_path),
+        file_sha256(background_video_path) if background_video_path else BACKGROUND_COLOR,
+        BACKGROUND_OFFSET, list(video_size), SUBTITLE_FONT, SUBTITLE_FONTSIZE, SUBTITLE_COLOR, SUBTITLE_STROKE_COLOR,
+        SUBTITLE_STROKE_WIDTH, SUBTITLE_WIDTH_RATIO, VIDEO_FPS, "libx264", "aac", backend, STATIC_BACKGROUND_FAST_PATH,
+    )
+    if use_cache and cache_get_file("video", video_key, output_path, ".mp4"):
+        print(f"Using cached video: {output_path}")
+        return True
+    if segments and not check_subtitle_font():
+        return False
+    if _create_styled_subtitle_video(audio_path, segments, output_path, video_size, background_video_path,
+                                     backend, workers):
+        if use_cache:
+            cache_put_file("video", video_key, output_path, ".mp4")
+        return True
+    return False
+
+def _create_styled_subtitle_video(audio_path, segments, output_path, video_size, background_video_path, backend, workers):
+    """Renders the video with the chosen backend (see create_styled_subtitle_video)."""
+    from moviepy.editor import VideoClip
+    duration = audio_duration(audio_path)
+    video_frames = int(round(duration * VIDEO_FPS))
+    if STATIC_BACKGROUND_FAST_PATH and (background_video_path is None or is_still_image(background_video_path)):
+        print("Static background: encoding only the frames where the captions change...")
+        try:
+            with instrument_stage("encode", backend="static", frames=video_frames) as record:
+                record['ok'] = render_static_background_video(audio_path, segments, output_path, video_size,
+                                                              background_video_path)
+            if record['ok']:
+                print(f"Video successfully saved to {output_path}")
+                return True
+        except Exception as e:
+            print(f"Error rendering the static background video: {e}")
+        print("Falling back to the full-frame renderers.")
+
+    background_offset = 0.0
+    if background_video_path:
+        # Scaling/cropping happens once in the proxy, not on every frame of every render
+        with instrument_stage("background_proxy"):
+            background_video_path = prepare_background_proxy(background_video_path, video_size) or background_video_path
+        background_offset = choose_background_offset(background_video_path, seed=file_sha256(audio_path))
+        print(f"Background starts at {background_offset:.1f}s.")
+
+    if backend == "ffmpeg":
+        print("Rendering with the ffmpeg backend (ASS subtitles burned in by libass)...")
+        try:
+            with instrument_stage("encode", backend="ffmpeg", frames=video_frames) as record:
+                record['ok'] = _render_with_ffmpeg(audio_path, segments, output_path, video_size, background_video_path,
+                                                   background_offset=background_offset)
+            if record['ok']:
+                print(f"Video successfully saved to {output_path}")
+                return True
+        except Exception as e:
+            print(f"Error rendering with ffmpeg: {e}")
+        print("Falling back to the MoviePy renderer.")
+
+    # Worker processes only apply to MoviePy; an explicit stream backend is honoured whatever RENDER_WORKERS says
+    if backend == "moviepy" and workers > 1 and segments:
+        try:
+            with instrument_stage("encode", backend="moviepy", workers=workers, frames=video_frames) as record:
+                record['ok'] = render_video_parallel(audio_path, segments, output_path, video_size,
+                                                     background_video_path, workers, background_offset=background_offset)
+            if record['ok']:
+                print(f"Video successfully saved to {output_path}")
+                return True
+        except Exception as e:
+            print(f"Error during parallel rendering: {e}")
+        print("Falling back to single-process rendering.")
+    if backend == "stream" or (backend == "moviepy" and duration > STREAM_RENDER_SECONDS):
+        print("Rendering with the streaming renderer (bounded memory)...")
+        try:
+            with instrument_stage("encode", backend="stream", frames=video_frames) as record:
+                record['ok'] = render_video_streaming(audio_path, segments, output_path, video_size,
+                                                      background_video_path, background_offset=background_offset)
+            if record['ok']:
+                print(f"Video successfully saved to {output_path}")
+                return True
+        except Exception as e:
+            print(f"Error during streaming rendering: {e}")
+        print("Falling back to the MoviePy renderer.")
+
+    video_duration = duration
+
+    background_clip = _open_background_clip(background_video_path, video_size, video_duration, background_offset)
+
+    # Subtitles are drawn per frame from a sorted timeline, so only the active one is touched
+    with instrument_stage("subtitles", segments=len(segments)) as record:
+        timeline = SubtitleTimeline(segments)
+        # Rasterize each distinct caption up front (as far as the cache holds them)
+        distinct_texts = list(dict.fromkeys(text.upper() for text in timeline.texts))
+        for text in distinct_texts[:_subtitle_image_cache.max_items]:
+            render_subtitle_image(text, video_size[0])
+        record['distinct_texts'] = len(distinct_texts)
+    final_video_clip = VideoClip(make_subtitle_frame_function(background_clip, timeline, video_size),
+                                 duration=video_duration)
+
+    try:
+        with instrument_stage("encode", backend="moviepy", workers=1, frames=video_frames) as record:
+            with tempfile.TemporaryDirectory() as work_dir:
+                silent_path = os.path.join(work_dir, "video.mp4")
+                final_video_clip.write_videofile(
+                    silent_path,
+                    fps=VIDEO_FPS,
+                    codec='libx264',
+                    audio=False, # Muxed by ffmpeg from the shared buffer below
+                    threads=4 # Use multiple threads for faster processing if available
+                )
+                record['ok'] = _mux_buffer_audio(silent_path, audio_path, output_path)
+        if not record['ok']:
+            return False
+        print(f"Video successfully saved to {output_path}")
+        return True
+    except Exception as e:
+        print(f"Error writing video file: {e}")
+        print("Please ensure FFMPEG is installed and accessible by MoviePy.")
+        print("If you are using a custom font, ensure the font file path is correct or the font name is recognized.")
+        print("If the subtitle font is not found, set SUBTITLE_FONT to the path of a .ttf/.otf file.")
+        return False
+    finally:
+        # Release resources
+        if background_video_path:
+            background_clip.close()
+        if 'final_video_clip' in locals():
+            final_video_clip.close()
+
+
+def build_story_job(story_text, job_id=None):
+    """
+    Returns the title, captions, tags and file paths for one story.
+    job_id (batch mode) is prefixed to the file names so stories with similar titles don't collide.
+    """
+    video_title = story_text.split('.')[0] # Use first sentence as title, or part of it
+    if len(video_title) > 80 : video_title = video_title[:80] + "..."
+    base_filename = "".join(filter(str.isalnum, video_title.lower().replace(" ", "_")))[:30]
+    if job_id is not None:
+        base_filename = f"{job_id}_{base_filename}"
+    return {
+        'id': job_id if job_id is not None else base_filename,
+        'story_text': story_text,
+        'title': video_title,
+        'description_youtube': f"AI Generated Story: {video_title}\\n\\n{story_text[:200]}...",
+        'caption_instagram': f"{video_title} #AIStory #ShortStory #ReelContent",
+        'tags': ["AIStory", "ShortStory", "AutomatedVideo", "TextToSpeech"],
+        'audio_path': f"assets/audio/{base_filename}_audio{TTS_AUDIO_EXTENSION}",
+        'output_path': f"output/{base_filename}_final_video.mp4",
+    }
+
+def load_batch_stories(source):
+    """
+    Reads stories for batch mode from a directory of .txt files (one story per file, the file
+    name is the job ID) or a JSONL file with one {"id": ..., "text": ...} object per line.
+    """
+    stories = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.endswith(".txt"):
+                with open(os.path.join(source, name), encoding="utf-8") as f:
+                    stories.append((os.path.splitext(name)[0], f.read()))
+    else:
+        with open(source, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                text = entry.get('text') or entry.get('story') or ""
+                stories.append((str(entry.get('id', line_number)), text))
+    return [(job_id, text) for job_id, text in stories if text.strip()]
+
+def _run_in(pool, fn, *args, **kwargs):
+    """
+    Runs fn in `pool` and waits for it, or in this process when there is no pool.
+    Stage metrics recorded in the worker are added to this process's, so they reach METRICS_REPORT.
+    """
+    if pool is None:
+        return fn(*args, **kwargs)
+    result, records = pool.submit(_call_collecting_stage_metrics, fn, *args, **kwargs).result()
+    with _stage_metrics_lock:
+        _stage_metrics.extend(records)
+    return result
+
+def _call_collecting_stage_metrics(fn, *args, **kwargs):
+    """Runs fn in a worker process; returns (result, the stage records fn added), removing them from the worker."""
+    with _stage_metrics_lock:
+        first = len(_stage_metrics)
+    result = fn(*args, **kwargs)
+    with _stage_metrics_lock:
+        records = _stage_metrics[first:]
+        del _stage_metrics[first:]
+    return result, records
+
+def _batch_tts_stage(job, client=None):
+    if len(job['story_text']) > TTS_CHUNK_CHARS:
+        # Timing is CPU work, so the chunks are timed by the subtitles stage, not on this TTS thread
+        job['chunks'] = text_to_speech_chunked(job['story_text'], job['audio_path'], client=client, time_words=False)
+        if not job['chunks']:
+            raise RuntimeError("audio generation failed")
+        return
+    with_timestamps = SUBTITLE_TIMING_MODE == "align"
+    if not text_to_speech_elevenlabs(job['story_text'], job['audio_path'], with_timestamps=with_timestamps,
+                                     client=client):
+        raise RuntimeError("audio generation failed")
+
+def _batch_transcribe_stage(job, pool=None):
+    if job.get('chunks'):
+        job['segments'] = _run_in(pool, time_story_chunks, job.pop('chunks'))
+    else:
+        job['segments'] = _run_in(pool, get_subtitle_segments, job['audio_path'], job['story_text'])
+    if not job['segments']:
+        raise RuntimeError("no subtitle segments were generated")
+
+def _batch_render_stage(job, pool=None):
+    background = DEFAULT_BACKGROUND_VIDEO if os.path.exists(DEFAULT_BACKGROUND_VIDEO) else None
+    ok = _run_in(pool, create_styled_subtitle_video, job['audio_path'], job['segments'],
+                 output_path=job['output_path'], background_video_path=background)
+    if not ok or not os.path.exists(job['output_path']):
+        raise RuntimeError("video rendering failed")
+
+def _job_upload_metadata(job):
+    """Outbox metadata for both targets of a story job."""
+    youtube_metadata = {'title': job['title'], 'description': job['description_youtube'], 'tags': job['tags'],
+                        'privacy_status': "public", 'made_for_kids': False}
+    instagram_metadata = {'caption': job['caption_instagram'],
+                          'first_comment': "What do you think of this? #story #Storytelling"}
+    return youtube_metadata, instagram_metadata
+
+def _batch_upload_stage(job, clients=None):
+    results = publish_video(job['output_path'], *_job_upload_metadata(job), clients=clients)
+    if not all(results.values()):
+        raise RuntimeError(f"upload failed (YouTube: {results.get('youtube')}, Instagram: {results.get('instagram')})")
+
+def run_staged_pipeline(jobs, stages, queue_size=BATCH_QUEUE_SIZE):
+    """
+    Runs every job through `stages` ([(name, workers, fn(job)), ...]) as a pipeline: each stage
+    has its own worker threads and a bounded input queue, so different jobs are in different
+    stages at the same time. A job that fails in one stage is recorded and skips the rest.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    stats = {name: {'ok': 0, 'failed': 0, 'seconds': 0.0} for name, _, _ in stages}
+    stats_lock = threading.Lock()
+
+    def worker(stage_index):
+        name, _, fn = stages[stage_index]
+        while True:
+            job = queues[stage_index].get()
+            if job is None:
+                return
+            start = time.perf_counter()
+            try:
+                fn(job)
+                succeeded = True
+            except Exception as e:
+                job['status'] = 'failed'
+                job['error'] = f"{name}: {e}"
+                print(f"[batch] Job {job['id']} failed in {name}: {e}")
+                succeeded = False
+            elapsed = time.perf_counter() - start
+            job.setdefault('stage_seconds', {})[name] = elapsed
+            with stats_lock:
+                stats[name]['ok' if succeeded else 'failed'] += 1
+                stats[name]['seconds'] += elapsed
+            if succeeded:
+                if stage_index + 1 < len(stages):
+                    queues[stage_index + 1].put(job)
+                else:
+                    job['status'] = 'done'
+                    print(f"[batch] Job {job['id']} finished.")
+
+    threads = []
+    for stage_index, (name, workers, _) in enumerate(stages):
+        stage_threads = [threading.Thread(target=worker, args=(stage_index,), name=f"{name}-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in stage_threads:
+            thread.start()
+        threads.append(stage_threads)
+
+    for job in jobs:
+        job['status'] = 'running'
+        queues[0].put(job)
+    # Shut the stages down in order: once a stage has drained, the next one gets its stop signals
+    for stage_index, stage_threads in enumerate(threads):
+        for _ in stage_threads:
+            queues[stage_index].put(None)
+        for thread in stage_threads:
+            thread.join()
+    return stats
+
+def run_batch(source, upload=True, report_path="output/batch_report.json"):
+    """
+    Batch entry point: runs every story in `source` through TTS -> subtitles -> render (-> upload).
+    TTS and uploads run in thread pools (network bound), subtitle timing and rendering in
+    process pools (CPU bound), each sized separately, so throughput approaches the slowest stage.
+    """
+    import multiprocessing
+    stories = load_batch_stories(source)
+    if not stories:
+        print(f"No stories found in {source}.")
+        return []
+    print(f"Running batch of {len(stories)} stories from {source}...")
+    os.makedirs("output", exist_ok=True)
+    os.makedirs("assets/audio", exist_ok=True)
+    jobs = [build_story_job(text, job_id) for job_id, text in stories]
+
+    # Whisper workers split the cores between them instead of each using all of them
+    whisper_threads = max(1, (os.cpu_count() or 1) // BATCH_TRANSCRIBE_WORKERS)
+    # Spawned, not forked: the pools start workers on first use, while the TTS threads may hold
+    # the cache, metrics or model locks, and a forked child would inherit them locked
+    spawn = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=BATCH_TRANSCRIBE_WORKERS, mp_context=spawn, initializer=apply_torch_thread_policy,
+                             initargs=(whisper_threads,)) as transcribe_pool, \
+         ProcessPoolExecutor(max_workers=BATCH_RENDER_WORKERS, mp_context=spawn) as render_pool:
+        stages = [
+            ("tts", BATCH_TTS_WORKERS, _batch_tts_stage),
+            ("subtitles", BATCH_TRANSCRIBE_WORKERS, lambda job: _batch_transcribe_stage(job, transcribe_pool)),
+            ("render", BATCH_RENDER_WORKERS, lambda job: _batch_render_stage(job, render_pool)),
+        ]
+        if upload:
+            stages.append(("upload", BATCH_UPLOAD_WORKERS, _batch_upload_stage))
+        stats = run_staged_pipeline(jobs, stages)
+    total_seconds = time.perf_counter() - start
+
+    succeeded = sum(1 for job in jobs if job.get('status') == 'done')
+    print("\n--- Batch Summary ---")
+    for name, stage_stats in stats.items():
+        runs = stage_stats['ok'] + stage_stats['failed']
+        average = stage_stats['seconds'] / runs if runs else 0.0
+        print(f"{name:<10} ok: {stage_stats['ok']:<4} failed: {stage_stats['failed']:<4} avg: {average:.1f}s")
+    print(f"{succeeded}/{len(jobs)} jobs succeeded in {total_seconds:.1f}s.")
+    for job in jobs:
+        if job.get('status') != 'done':
+            print(f"  {job['id']}: {job.get('error', 'not finished')}")
+
+    report = {
+        'source': source,
+        'total_seconds': total_seconds,
+        'succeeded': succeeded,
+        'failed': len(jobs) - succeeded,
+        'stages': stats,
+        'jobs': [{key: job.get(key) for key in ('id', 'status', 'error', 'stage_seconds', 'output_path')}
+                 for job in jobs],
+    }
+    _atomic_write_bytes(report_path, json.dumps(report, indent=2).encode("utf-8"))
+    print(f"Batch report saved to {report_path}")
+    return jobs
+
+def _init_daemon_worker():
+    """
+    Daemon worker initializer: loads everything a job needs once per worker process, so jobs
+    don't pay for model loading, font loading or client/login setup. A failure here only means
+    that piece is set up lazily by the job instead.
+    """
+    from elevenlabs.client import ElevenLabs
+    apply_torch_thread_policy(max(1, (os.cpu_count() or 1) // DAEMON_WORKERS))
+    check_subtitle_font()
+    try:
+        get_whisper_model()
+    except Exception as e:
+        print(f"[daemon] Could not preload the Whisper model: {e}")
+    if ELEVENLABS_API_KEY:
+        _daemon_clients['elevenlabs'] = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+    try:
+        # Only with saved credentials: a worker can't run the interactive OAuth flow
+        if os.path.exists("token.json"):
+            get_youtube_service()
+    except Exception as e:
+        print(f"[daemon] Could not set up the YouTube client: {e}")
+    try:
+        if INSTAGRAM_USERNAME and INSTAGRAM_PASSWORD:
+            get_instagram_client()
+    except Exception as e:
+        print(f"[daemon] Could not log in to Instagram: {e}")
+    print(f"[daemon] Worker {os.getpid()} ready.")
+
+def _daemon_cancel_path(job_id):
+    return os.path.join(DAEMON_DIR, "cancel", job_id)
+
+def _run_daemon_job(job, upload=True):
+    """
+    Runs one job through every stage inside a daemon worker, with the worker's warm clients.
+    Cancellation is checked between stages, so a running job stops at the next stage boundary.
+    """
+    stages = [
+        ("tts", lambda: _batch_tts_stage(job, client=_daemon_clients.get('elevenlabs'))),
+        ("subtitles", lambda: _batch_transcribe_stage(job)),
+        ("render", lambda: _batch_render_stage(job)),
+    ]
+    if upload:
+        stages.append(("upload", lambda: _batch_upload_stage(job)))
+    job['stage_seconds'] = {}
+    for name, fn in stages:
+        if os.path.exists(_daemon_cancel_path(job['id'])):
+            job['status'] = 'cancelled'
+            print(f"[daemon] Job {job['id']} cancelled before {name}.")
+            return job
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = f"{name}: {e}"
+            print(f"[daemon] Job {job['id']} failed in {name}: {e}")
+            return job
+        finally:
+            job['stage_seconds'][name] = time.perf_counter() - start
+    job['status'] = 'done'
+    print(f"[daemon] Job {job['id']} finished.")
+    return job
+
+class JobDaemon:
+    """
+    Keeps DAEMON_WORKERS warm worker processes and tracks the jobs submitted to them.
+    Workers are replaced after DAEMON_JOBS_PER_WORKER jobs to bound memory growth.
+    """
+
+    PUBLIC_FIELDS = ('id', 'status', 'error', 'title', 'output_path', 'stage_seconds', 'submitted_at', 'finished_at')
+
+    def __init__(self, workers=None, jobs_per_worker=None):
+        os.makedirs(os.path.join(DAEMON_DIR, "cancel"), exist_ok=True)
+        os.makedirs("output", exist_ok=True)
+        os.makedirs("assets/audio", exist_ok=True)
+        self.workers = workers or DAEMON_WORKERS
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_daemon_worker,
+                                        max_tasks_per_child=jobs_per_worker or DAEMON_JOBS_PER_WORKER)
+        self.jobs = {}
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.accepting = True
+
+    def submit(self, story_text, upload=True):
+        with self.lock:
+            if not self.accepting:
+                return None
+            job = build_story_job(story_text, job_id=uuid.uuid4().hex[:12])
+            job.update(status='queued', submitted_at=time.time())
+            self.jobs[job['id']] = job
+            future = self.pool.submit(_run_daemon_job, job, upload)
+            self.futures[job['id']] = future
+        future.add_done_callback(lambda f, job_id=job['id']: self._finished(job_id, f))
+        print(f"[daemon] Job {job['id']} queued: {job['title']}")
+        return self.status(job['id'])
+
+    def _finished(self, job_id, future):
+        with self.lock:
+            job = self.jobs[job_id]
+            if future.cancelled():
+                job['status'] = 'cancelled'
+            elif future.exception() is not None:
+                job.update(status='failed', error=f"worker: {future.exception()}")
+            else:
+                job.update({key: value for key, value in future.result().items() if key in self.PUBLIC_FIELDS})
+            job['finished_at'] = time.time()
+            self.futures.pop(job_id, None)
+        cancel_path = _daemon_cancel_path(job_id)
+        if os.path.exists(cancel_path):
+            os.remove(cancel_path)
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            future = self.futures.get(job_id)
+            if job['status'] == 'queued' and future is not None and future.running():
+                job['status'] = 'running'
+            return {key: job.get(key) for key in self.PUBLIC_FIELDS}
+
+    def list_jobs(self):
+        return [self.status(job_id) for job_id in list(self.jobs)]
+
+    def cancel(self, job_id):
+        """Drops a queued job, or asks a running job to stop at its next stage boundary."""
+        with self.lock:
+            future = self.futures.get(job_id)
+        if future is None:
+            return self.status(job_id)
+        if not future.cancel():
+            with open(_daemon_cancel_path(job_id), "w") as f:
+                f.write(str(time.time()))
+            with self.lock:
+                self.jobs[job_id]['status'] = 'cancelling'
+        return self.status(job_id)
+
+    def shutdown(self):
+        """Stops accepting jobs, drops the queued ones and waits for the running ones to finish."""
+        with self.lock:
+            self.accepting = False
+        print("[daemon] Shutting down: waiting for running jobs, dropping queued ones...")
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+class _DaemonRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of the daemon:
+    POST /jobs {"story": ..., "upload": true}, GET /jobs, GET /jobs/<id>,
+    POST /jobs/<id>/cancel, POST /shutdown, GET /health.
+    """
+
+    def _reply(self, code, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job_reply(self, job):
+        if job is None:
+            self._reply(404, {'error': "unknown job"})
+        else:
+            self._reply(200, job)
+
+    def do_GET(self):
+        daemon = self.server.job_daemon
+        parts = self.path.strip("/").split("/")
+        if parts == ["health"]:
+            self._reply(200, {'status': 'ok', 'pid': os.getpid()})
+        elif parts == ["jobs"]:
+            self._reply(200, daemon.list_jobs())
+        elif len(parts) == 2 and parts[0] == "jobs":
+            self._job_reply(daemon.status(parts[1]))
+        else:
+            self._reply(404, {'error': "not found"})
+
+    def do_POST(self):
+        daemon = self.server.job_daemon
+        parts = self.path.strip("/").split("/")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._reply(400, {'error': "invalid JSON"})
+            return
+        if parts == ["jobs"]:
+            story_text = payload.get('story') or ""
+            if not story_text.strip():
+                self._reply(400, {'error': "no story text"})
+                return
+            job = daemon.submit(story_text, upload=payload.get('upload', True))
+            if job is None:
+                self._reply(503, {'error': "daemon is shutting down"})
+            else:
+                self._reply(202, job)
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            self._job_reply(daemon.cancel(parts[1]))
+        elif parts == ["shutdown"]:
+            self._reply(202, {'status': 'shutting down'})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            self._reply(404, {'error': "not found"})
+
+    def log_message(self, format, *args):
+        pass # Job progress is logged by the daemon itself
+
+def run_daemon(host=None, port=None, on_listening=None):
+    """
+    Serves the job API until POST /shutdown, SIGTERM or Ctrl+C, then shuts down gracefully.
+    port=0 picks a free port; on_listening((host, port)) is called once the workers are up and
+    the server is about to accept requests.
+    """
+    daemon = JobDaemon()
+    server = ThreadingHTTPServer((host or DAEMON_HOST, DAEMON_PORT if port is None else port), _DaemonRequestHandler)
+    server.job_daemon = daemon
+    if threading.current_thread() is threading.main_thread(): # Signal handlers can only be set there
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start())
+    # Start the workers now, so the first job doesn't wait for the models to load
+    for future in [daemon.pool.submit(os.getpid) for _ in range(daemon.workers)]:
+        future.result()
+    print(f"[daemon] Listening on http://{server.server_address[0]}:{server.server_address[1]}")
+    if on_listening:
+        on_listening(server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    daemon.shutdown()
+    print("[daemon] Stopped.")
+
+def daemon_request(method, path, payload=None, timeout=10):
+    """Sends one request to the daemon; returns the decoded JSON reply, or None if it isn't running."""
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(f"http://{DAEMON_HOST}:{DAEMON_PORT}{path}", data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read() or b"{}")
+    except (urllib.error.URLError, ConnectionError, socket.timeout):
+        return None
+
+def submit_to_daemon(story_text, upload=True, poll_interval=1.0):
+    """
+    Thin-client path: hands the story to a running daemon and follows the job until it ends.
+    Returns the final job status, or None when no daemon is running.
+    """
+    job = daemon_request("POST", "/jobs", {'story': story_text, 'upload': upload})
+    if job is None:
+        return None
+    if 'id' not in job:
+        print(f"The daemon rejected the job: {job.get('error')}")
+        return job
+    print(f"Submitted job {job['id']} to the daemon.")
+    last_status = None
+    try:
+        while job.get('status') not in ('done', 'failed', 'cancelled'):
+            if job.get('status') != last_status:
+                last_status = job.get('status')
+                print(f"Job {job['id']}: {last_status}")
+            time.sleep(poll_interval)
+            job = daemon_request("GET", f"/jobs/{job['id']}") or {'status': 'failed', 'error': "daemon went away"}
+    except KeyboardInterrupt:
+        print(f"Cancelling job {job['id']}...")
+        job = daemon_request("POST", f"/jobs/{job['id']}/cancel") or job
+        return job
+    print(f"Job {job.get('id')}: {job['status']}" + (f" ({job['error']})" if job.get('error') else ""))
+    if job.get('output_path') and job['status'] == 'done':
+        print(f"Video saved to {job['output_path']}")
+    return job
+
+def read_story(path=None):
+    """Reads the story from a file, or from stdin when path is None or "-"."""
+    if path and path != "-":
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    if sys.stdin.isatty():
+        print("Please paste your story below. Press Ctrl+D (Unix) or Ctrl+Z then Enter (Windows) when done:")
+    story_lines = []
+    while True:
+        try:
+            line = input()
+            story_lines.append(line)
+        except EOFError:
+            break
+    return "\n".join(story_lines)
+
+def _default_video_path(audio_path):
+    """output/<name>_final_video.mp4 for assets/audio/<name>_audio.<ext>, like build_story_job."""
+    name = os.path.splitext(os.path.basename(audio_path))[0]
+    if name.endswith("_audio"):
+        name = name[:-len("_audio")]
+    return os.path.join("output", f"{name}_final_video.mp4")
+
+def run_tts_command(args):
+    """`tts`: story -> audio (plus TTS timestamps, and segments for long stories)."""
+    story_text = read_story(args.story)
+    if not story_text.strip():
+        print("No story text provided.")
+        return False
+    audio_path = args.audio or build_story_job(story_text)['audio_path']
+    os.makedirs(os.path.dirname(audio_path) or ".", exist_ok=True)
+    if len(story_text) > TTS_CHUNK_CHARS:
+        segments = text_to_speech_chunked(story_text, audio_path)
+        if not segments:
+            return False
+        save_segments(segments, segments_sidecar_path(audio_path))
+    elif not text_to_speech_elevenlabs(story_text, audio_path, with_timestamps=SUBTITLE_TIMING_MODE == "align"):
+        return False
+    print(f"Audio: {audio_path}")
+    return True
+
+def run_transcribe_command(args):
+    """`transcribe`: audio (+ story) -> subtitle segments JSON."""
+    story_text = read_story(args.story) if args.story else None
+    segments = get_subtitle_segments(args.audio, story_text)
+    if not segments:
+        print("No subtitle segments were generated.")
+        return False
+    save_segments(segments, args.segments or segments_sidecar_path(args.audio))
+    return True
+
+def run_render_command(args):
+    """`render`: audio + segments JSON -> video."""
+    segments = load_segments(args.segments or segments_sidecar_path(args.audio))
+    if not segments:
+        return False
+    output_path = args.output or _default_video_path(args.audio)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    background = args.background
+    if background is None and os.path.exists(DEFAULT_BACKGROUND_VIDEO):
+        background = DEFAULT_BACKGROUND_VIDEO
+    if args.variants:
+        names = [name.strip() for name in args.variants.split(",") if name.strip()]
+        unknown = [name for name in names if name not in OUTPUT_VARIANTS]
+        if unknown:
+            print(f"Unknown variants: {', '.join(unknown)} (known: {', '.join(OUTPUT_VARIANTS)})")
+            return False
+        stem = os.path.splitext(output_path)[0]
+        return render_video_variants(args.audio, segments, [{'name': name, 'path': f"{stem}_{name}.mp4"} for name in names],
+                                     background_video_path=background or None)
+    create_styled_subtitle_video(args.audio, segments, output_path=output_path,
+                                 background_video_path=background or None, backend=args.backend)
+    return os.path.exists(output_path)
+
+def _upload_metadata(args):
+    """Title, descriptions and tags for the upload commands: from --story like a full run, overridden by flags."""
+    job = build_story_job(read_story(args.story)) if args.story else {}
+    return {
+        'title': args.title or job.get('title') or os.path.splitext(os.path.basename(args.video))[0],
+        'description': args.description if args.description is not None else job.get('description_youtube', ""),
+        'caption': args.caption if args.caption is not None else job.get('caption_instagram', ""),
+        'tags': args.tags.split(",") if args.tags else job.get('tags', []),
+    }
+
+def run_upload_youtube_command(args):
+    """`upload-youtube`: video -> YouTube (through the outbox, so a rerun resumes instead of re-uploading)."""
+    metadata = _upload_metadata(args)
+    youtube_metadata = {'title': metadata['title'], 'description': metadata['description'],
+                        'tags': metadata['tags'], 'privacy_status': args.privacy, 'made_for_kids': False}
+    return publish_video(args.video, youtube_metadata=youtube_metadata)['youtube']
+
+def run_upload_instagram_command(args):
+    """`upload-instagram`: video -> Instagram Reel (through the outbox)."""
+    metadata = _upload_metadata(args)
+    instagram_metadata = {'caption': metadata['caption'], 'first_comment': args.first_comment}
+    return publish_video(args.video, instagram_metadata=instagram_metadata)['instagram']
+
+def run_outbox_command(args):
+    """`outbox`: lists the outbox, or retries everything still pending (e.g. after a crash)."""
+    if args.list:
+        for entry in load_outbox_entries():
+            print(f"{entry['id'][:12]} {entry['target']:<10} {entry['status']:<8} attempts: {entry['attempts']} "
+                  f"{entry['video_path']}" + (f" ({entry['last_error']})" if entry.get('last_error') else ""))
+        return True
+    entries = drain_outbox()
+    print(f"Outbox drained: {sum(entry['status'] == 'done' for entry in entries)}/{len(entries)} uploads succeeded.")
+    return all(entry['status'] == 'done' for entry in entries)
+
+
+def build_arg_parser():
+    """Command-line options: the full run, batch and daemon modes, and one subcommand per stage."""
+    parser = argparse.ArgumentParser(description="Turn a story into a narrated, subtitled short video and upload it.")
+    parser.add_argument("--batch", metavar="SOURCE",
+                        help="Directory of .txt stories or a JSONL file of {\"id\", \"text\"} objects to process as a batch.")
+    parser.add_argument("--no-upload", action="store_true", help="Render only, skip the uploads (batch mode and full runs).")
+    parser.add_argument("--prepare-background", metavar="VIDEO", action="append",
+                        help="Pre-scale a background video into the proxy cache and exit (repeatable).")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Run as a daemon with warm models and clients, serving jobs on DAEMON_HOST:DAEMON_PORT.")
+    parser.add_argument("--local", action="store_true", help="Run the story in this process even if a daemon is running.")
+    parser.add_argument("--status", metavar="JOB_ID", nargs="?", const="",
+                        help="Show a daemon job (or all jobs when no ID is given) and exit.")
+    parser.add_argument("--cancel", metavar="JOB_ID", help="Cancel a daemon job and exit.")
+    parser.add_argument("--stop-daemon", action="store_true", help="Ask the daemon to shut down gracefully and exit.")
+
+    # One subcommand per stage, each reading and writing files so a single stage can be rerun.
+    # Only the dependencies of the chosen stage get imported.
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    tts_parser = subparsers.add_parser("tts", help="Story -> audio.")
+    tts_parser.add_argument("--story", help="Story text file (default: stdin).")
+    tts_parser.add_argument("--audio", help="Output audio path (default: assets/audio/<title>_audio.mp3).")
+    tts_parser.set_defaults(func=run_tts_command)
+
+    transcribe_parser = subparsers.add_parser("transcribe", help="Audio -> subtitle segments JSON.")
+    transcribe_parser.add_argument("audio")
+    transcribe_parser.add_argument("--story", help="Story text file to align to (default: transcribe with Whisper).")
+    transcribe_parser.add_argument("--segments", help="Output JSON path (default: <audio>_segments.json).")
+    transcribe_parser.set_defaults(func=run_transcribe_command)
+
+    render_parser = subparsers.add_parser("render", help="Audio + segments JSON -> video.")
+    render_parser.add_argument("audio")
+    render_parser.add_argument("--segments", help="Segments JSON (default: <audio>_segments.json).")
+    render_parser.add_argument("--output", help="Output video path (default: output/<title>_final_video.mp4).")
+    render_parser.add_argument("--background", help=f"Background video ('' for a solid colour, default: {DEFAULT_BACKGROUND_VIDEO}).")
+    render_parser.add_argument("--backend", choices=["moviepy", "ffmpeg", "parallel", "stream"], help="Render backend (default: RENDER_BACKEND).")
+    render_parser.add_argument("--variants", help=f"Comma-separated output variants to render in one pass "
+                                                  f"({', '.join(OUTPUT_VARIANTS)}); written as <output>_<variant>.mp4.")
+    render_parser.set_defaults(func=run_render_command)
+
+    for name, upload_command in (("upload-youtube", run_upload_youtube_command),
+                                 ("upload-instagram", run_upload_instagram_command)):
+        upload_parser = subparsers.add_parser(name, help=f"Video -> {name.split('-')[1].capitalize()}.")
+        upload_parser.add_argument("video")
+        upload_parser.add_argument("--story", help="Story text file to derive the title, description and caption from.")
+        upload_parser.add_argument("--title")
+        upload_parser.add_argument("--description")
+        upload_parser.add_argument("--caption")
+        upload_parser.add_argument("--tags", help="Comma-separated tags.")
+        upload_parser.set_defaults(func=upload_command)
+        if name == "upload-youtube":
+            upload_parser.add_argument("--privacy", default="public", choices=["public", "unlisted", "private"])
+        else:
+            upload_parser.add_argument("--first-comment", default="What do you think of this? #story #Storytelling")
+
+    outbox_parser = subparsers.add_parser("outbox", help="Retry pending uploads from the outbox.")
+    outbox_parser.add_argument("--list", action="store_true", help="Only list the outbox entries.")
+    outbox_parser.set_defaults(func=run_outbox_command)
+
+    # --no-upload and --local are top-level options: `main.py --no-upload run --story story.txt`
+    run_parser = subparsers.add_parser("run", help="All stages: story -> audio -> segments -> video -> uploads (the default).")
+    run_parser.add_argument("--story", help="Story text file (default: stdin).")
+    return parser
+
+if __name__ == '__main__':
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    if METRICS_REPORT_PATH:
+        atexit.register(write_metrics_report) # Also written when a step fails and the script exits early
+    if args.prepare_background:
+        proxies = [prepare_background_proxy(path) for path in args.prepare_background]
+        exit(0 if all(proxies) else 1)
+    if args.batch:
+        jobs = run_batch(args.batch, upload=not args.no_upload)
+        exit(0 if jobs and all(job.get('status') == 'done' for job in jobs) else 1)
+    if args.daemon:
+        run_daemon()
+        exit(0)
+    if args.status is not None or args.cancel or args.stop_daemon:
+        if args.cancel:
+            reply = daemon_request("POST", f"/jobs/{args.cancel}/cancel")
+        elif args.stop_daemon:
+            reply = daemon_request("POST", "/shutdown")
+        else:
+            reply = daemon_request("GET", f"/jobs/{args.status}" if args.status else "/jobs")
+        if reply is None:
+            print(f"No daemon is running on {DAEMON_HOST}:{DAEMON_PORT}.")
+            exit(1)
+        print(json.dumps(reply, indent=2))
+        exit(0)
+    if getattr(args, "func", None):
+        exit(0 if args.func(args) else 1)
+
+    # --- Step 0: Get story from user ---
+    story_text = read_story(getattr(args, "story", None))
+
+    if not story_text.strip():
+        print("No story text provided. Exiting.")
+        exit()
+
+    # With a daemon running, this script is just a client: the daemon already has everything loaded
+    if not args.local:
+        daemon_job = submit_to_daemon(story_text, upload=not args.no_upload)
+        if daemon_job is not None:
+            exit(0 if daemon_job.get('status') == 'done' else 1)
+    
+    job = build_story_job(story_text)
+
+
+    # --- Step 1: Configure paths ---
+    generated_audio_file = job['audio_path']
+    your_background_video = DEFAULT_BACKGROUND_VIDEO
+    output_video_file = job['output_path']
+
+    # Create output directories if they don't exist
+    os.makedirs("output", exist_ok=True)
+    os.makedirs("assets/audio", exist_ok=True)
+    os.makedirs("assets/video", exist_ok=True)
+
+    # --- Step 1b: Generate Audio from Text ---
+    print("\\n--- Generating Audio ---")
+    chunked_segments = []
+    if len(story_text) > TTS_CHUNK_CHARS:
+        # Long story: synthesise sentence chunks concurrently and time each one as it arrives
+        chunked_segments = text_to_speech_chunked(story_text, generated_audio_file)
+        if not chunked_segments:
+            print("Failed to generate audio. Exiting.")
+            exit()
+    else:
+        # In "align" mode, ask for character timestamps so subtitles can skip Whisper entirely
+        with_timestamps = SUBTITLE_TIMING_MODE == "align"
+        if not text_to_speech_elevenlabs(story_text, generated_audio_file, with_timestamps=with_timestamps):
+            print("Failed to generate audio. Exiting.")
+            exit()
+    
+    your_audio_file = generated_audio_file # Use the newly generated audio
+
+    # Check if the audio/video paths exist
+    if not os.path.exists(your_audio_file):
+        print("="*50)
         print(f"IMPORTANT: Audio file not found at '{your_audio_file}'.")
         print("Please ensure the audio file exists or update the path in the script.")
         print("The script cannot proceed without the audio file for transcription.")
@@ -447,13 +3447,14 @@ if __name__ == '__main__':
         print("="*50)
         your_background_video = None # Fallback to solid color
 
-    # --- Step 2: Transcribe audio to get subtitle segments ---
-    print("Starting audio transcription process...")
-    subtitle_segments = transcribe_audio_to_segments(your_audio_file)
+    # --- Step 2: Get subtitle segments (aligned to the known story, or transcribed) ---
+    print("Starting subtitle timing process...")
+    subtitle_segments = chunked_segments or get_subtitle_segments(your_audio_file, story_text)
 
     if not subtitle_segments:
         print("No subtitle segments were generated. Exiting.")
         exit()
+    save_segments(subtitle_segments, segments_sidecar_path(your_audio_file)) # Lets `render` rerun just step 3
 
     # --- Step 3: Create the video ---
     print(f"Attempting to create video with audio: {your_audio_file}")
@@ -473,24 +3474,15 @@ if __name__ == '__main__':
     if not os.path.exists(output_video_file):
         print(f"Video generation failed or file not found at {output_video_file}. Skipping uploads.")
         exit()
+    if args.no_upload:
+        print(f"\\n--- Script Finished (uploads skipped): {output_video_file} ---")
+        exit()
         
-    # --- Step 4: Upload to YouTube ---
-    print("\\n--- Uploading to YouTube ---")
-    upload_to_youtube(
-        output_video_file,
-        title=video_title,
-        description=video_description_youtube,
-        tags=hashtags_youtube,
-        privacy_status="public",
-        made_for_kids=False
-    )
-
-    # --- Step 5: Upload to Instagram ---
-    print("\\n--- Uploading to Instagram ---")
-    upload_to_instagram_reel(
-        output_video_file,
-        caption=video_caption_instagram,
-        first_comment=f"What do you think of this? #story #Storytelling"
-    )
+    # --- Step 4: Upload to YouTube and Instagram at the same time ---
+    print("\\n--- Uploading to YouTube and Instagram ---")
+    upload_results = publish_video(output_video_file, *_job_upload_metadata(job))
+    for target, uploaded in upload_results.items():
+        if not uploaded:
+            print(f"Upload to {target} did not succeed; it stays in the outbox ('python main.py outbox' retries it).")
 
     print("\\n--- Script Finished ---")
@@ -0,0 +1,29 @@
+import glob
+import os
+import sys
+
+import pytest
+
+# main.py and benchmark.py live at the repository root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Impact is not installed on most Linux machines: render with whatever TrueType font there is,
+# before main reads SUBTITLE_FONT at import time
+FONT_DIRS = ["/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~/.fonts"),
+             "/Library/Fonts", "/System/Library/Fonts", "C:/Windows/Fonts"]
+if "SUBTITLE_FONT" not in os.environ:
+    for font_dir in FONT_DIRS:
+        fonts = sorted(glob.glob(os.path.join(font_dir, "**", "*.ttf"), recursive=True))
+        if fonts:
+            os.environ["SUBTITLE_FONT"] = fonts[0]
+            break
+
+
+@pytest.fixture
+def subtitle_font():
+    """Skips the test if no subtitle font can be loaded (set SUBTITLE_FONT to a .ttf/.otf file)."""
+    import main
+    try:
+        return main._load_subtitle_font(main.SUBTITLE_FONT, main.SUBTITLE_FONTSIZE)
+    except OSError as e:
+        pytest.skip(str(e))
@@ -0,0 +1,120 @@
+"""Tests for the content-addressed artifact cache (keys, LRU eviction, atomic writes)."""
+import os
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / "artifacts")
+    monkeypatch.setattr(main, "ARTIFACT_CACHE_ENABLED", True)
+    monkeypatch.setattr(main, "ARTIFACT_CACHE_DIR", path)
+    monkeypatch.setattr(main, "ARTIFACT_CACHE_MAX_BYTES", 10 ** 9)
+    return path
+
+
+def test_content_hash_is_stable():
+    key = main.content_hash("video", [{'text': "hi", 'start': 0.0, 'end': 1.0}], (1080, 1920), "random")
+    # Dict key order does not matter, and the key does not change between runs or releases
+    assert key == main.content_hash("video", [{'end': 1.0, 'start': 0.0, 'text': "hi"}], (1080, 1920), "random")
+    assert key == "e1ebb6f9a8d40ffc8ac5b4a23edd2515ca38fb559c7edab65f1740e5fa3cc78f"
+    assert key != main.content_hash("video", [{'text': "hi", 'start': 0.0, 'end': 1.5}], (1080, 1920), "random")
+    assert main.content_hash("a", 1) != main.content_hash("a", "1")
+
+
+def _put(cache_dir, kind, name, size, mtime):
+    path = os.path.join(cache_dir, kind, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_eviction_removes_least_recently_used_first(cache_dir):
+    oldest = _put(cache_dir, "video", "a.mp4", 400, 1000)
+    middle = _put(cache_dir, "audio", "b.mp3", 400, 2000)
+    newest = _put(cache_dir, "video", "c.mp4", 400, 3000)
+    partial = _put(cache_dir, "video", "d.tmp", 400, 500) # An in-progress write is never evicted
+
+    main.evict_artifact_cache(max_bytes=900)
+    assert not os.path.exists(oldest)
+    assert os.path.exists(middle) and os.path.exists(newest) and os.path.exists(partial)
+
+    main.evict_artifact_cache(max_bytes=400)
+    assert not os.path.exists(middle)
+    assert os.path.exists(newest)
+
+
+def test_cache_hit_marks_artifact_as_recently_used(cache_dir, tmp_path):
+    source = str(tmp_path / "video.mp4")
+    with open(source, "wb") as f:
+        f.write(b"x" * 400)
+    main.cache_put_file("video", "first", source, ".mp4")
+    main.cache_put_file("video", "second", source, ".mp4")
+    first = main._artifact_path("video", "first", ".mp4")
+    second = main._artifact_path("video", "second", ".mp4")
+    os.utime(first, (1000, 1000))
+    os.utime(second, (2000, 2000))
+
+    assert main.cache_get_file("video", "first", str(tmp_path / "copy.mp4"), ".mp4")
+    main.evict_artifact_cache(max_bytes=400)
+    assert os.path.exists(first) and not os.path.exists(second)
+
+
+def test_atomic_write_leaves_the_old_file_on_failure(tmp_path, monkeypatch):
+    path = str(tmp_path / "out" / "data.json")
+    main._atomic_write_bytes(path, b"old")
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(main.os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        main._atomic_write_bytes(path, b"new")
+    with pytest.raises(OSError):
+        main._atomic_copy(__file__, path)
+    monkeypatch.undo()
+
+    with open(path, "rb") as f:
+        assert f.read() == b"old"
+    assert os.listdir(os.path.dirname(path)) == ["data.json"] # No temporary files left behind
+
+
+def test_atomic_copy(tmp_path):
+    src = str(tmp_path / "src.bin")
+    with open(src, "wb") as f:
+        f.write(b"payload")
+    dst = str(tmp_path / "nested" / "dst.bin")
+    main._atomic_copy(src, dst)
+    with open(dst, "rb") as f:
+        assert f.read() == b"payload"
+
+
+def test_random_background_offset_skips_the_video_cache(cache_dir, tmp_path, monkeypatch):
+    audio_path = str(tmp_path / "audio.mp3")
+    background_path = str(tmp_path / "background.mp4")
+    for path in (audio_path, background_path):
+        with open(path, "wb") as f:
+            f.write(os.urandom(64))
+    renders = []
+
+    def render(*args):
+        renders.append(args)
+        with open(args[2], "wb") as f:
+            f.write(b"video")
+        return True
+    monkeypatch.setattr(main, "_create_styled_subtitle_video", render)
+
+    monkeypatch.setattr(main, "BACKGROUND_OFFSET", "random")
+    for _ in range(2):
+        assert main.create_styled_subtitle_video(audio_path, [], str(tmp_path / "out.mp4"),
+                                                 background_video_path=background_path)
+    assert len(renders) == 2 # Each render starts somewhere else, so none is reused
+
+    monkeypatch.setattr(main, "BACKGROUND_OFFSET", "seeded")
+    for _ in range(2):
+        assert main.create_styled_subtitle_video(audio_path, [], str(tmp_path / "out.mp4"),
+                                                 background_video_path=background_path)
+    assert len(renders) == 3
@@ -0,0 +1,45 @@
+"""Tests for splitting long stories into sentence chunks for TTS."""
+import main
+
+
+def test_chunks_respect_the_size_limit_and_keep_every_word():
+    story = " ".join(f"Sentence number {i} is here." for i in range(40))
+    chunks = main.split_story_into_chunks(story, max_chars=100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert " ".join(chunks) == story
+    # Chunks end at sentence boundaries and are filled as far as the limit allows
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert all(len(a) + 1 + len(b.split(". ")[0]) + 1 > 100 for a, b in zip(chunks, chunks[1:]))
+
+
+def test_oversized_sentence_is_split_between_words():
+    long_sentence = " ".join(["word"] * 60) + "."
+    chunks = main.split_story_into_chunks(f"Short one. {long_sentence} Another.", max_chars=50)
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert " ".join(chunks) == f"Short one. {long_sentence} Another."
+    assert all(set(chunk.rstrip(".").split()) <= {"Short", "one", "one.", "word", "Another"} for chunk in chunks)
+
+
+def test_single_word_longer_than_the_limit_is_kept_whole():
+    assert main.split_story_into_chunks("Supercalifragilistic.", max_chars=10) == ["Supercalifragilistic."]
+
+
+def test_abbreviations_and_initials_do_not_end_sentences():
+    text = "Dr. Smith met Mrs. J. Doe at St. Mary's. They talked, e.g. about the U.S. economy. Then they left."
+    assert main.split_sentences(text) == [
+        "Dr. Smith met Mrs. J. Doe at St. Mary's.",
+        "They talked, e.g. about the U.S. economy.",
+        "Then they left.",
+    ]
+    chunks = main.split_story_into_chunks(text, max_chars=45)
+    assert chunks[0] == "Dr. Smith met Mrs. J. Doe at St. Mary's."
+    assert not any(chunk.endswith(("Dr.", "Mrs.", "J.", "St.")) for chunk in chunks)
+
+
+def test_sentences_end_after_closing_quotes():
+    assert main.split_sentences('She said "Run!" Then he ran. (It worked.) Good?') == [
+        'She said "Run!"', "Then he ran.", "(It worked.)", "Good?"]
+
+
+def test_empty_story_has_no_chunks():
+    assert main.split_story_into_chunks("   ", max_chars=100) == []
@@ -0,0 +1,83 @@
+"""Argument parsing of every subcommand (nothing is run)."""
+import pytest
+
+import main
+
+
+@pytest.fixture
+def parse():
+    parser = main.build_arg_parser()
+    return lambda *argv: parser.parse_args(list(argv))
+
+
+def test_full_run_is_the_default(parse):
+    args = parse()
+    assert args.command is None and not hasattr(args, "func")
+    assert not args.no_upload and not args.local and not args.daemon
+    args = parse("--no-upload", "--local", "run", "--story", "story.txt")
+    assert args.command == "run" and args.story == "story.txt" and args.no_upload and args.local
+    assert not hasattr(args, "func") # Falls through to the full pipeline
+
+
+def test_tts(parse):
+    args = parse("tts", "--story", "story.txt", "--audio", "out.mp3")
+    assert args.func is main.run_tts_command
+    assert (args.story, args.audio) == ("story.txt", "out.mp3")
+    assert (parse("tts").story, parse("tts").audio) == (None, None) # stdin, derived path
+
+
+def test_transcribe(parse):
+    args = parse("transcribe", "audio.mp3", "--story", "story.txt", "--segments", "segments.json")
+    assert args.func is main.run_transcribe_command
+    assert (args.audio, args.story, args.segments) == ("audio.mp3", "story.txt", "segments.json")
+    with pytest.raises(SystemExit):
+        parse("transcribe") # The audio file is required
+
+
+def test_render(parse):
+    args = parse("render", "audio.mp3", "--segments", "s.json", "--output", "v.mp4", "--background", "",
+                 "--backend", "stream", "--variants", "vertical,square")
+    assert args.func is main.run_render_command
+    assert (args.audio, args.segments, args.output) == ("audio.mp3", "s.json", "v.mp4")
+    assert args.background == "" and args.backend == "stream" and args.variants == "vertical,square"
+    assert parse("render", "audio.mp3").backend is None # RENDER_BACKEND
+    with pytest.raises(SystemExit):
+        parse("render", "audio.mp3", "--backend", "gpu")
+
+
+def test_upload_youtube(parse):
+    args = parse("upload-youtube", "v.mp4", "--title", "T", "--description", "D", "--tags", "a,b",
+                 "--privacy", "unlisted")
+    assert args.func is main.run_upload_youtube_command
+    assert (args.video, args.title, args.description, args.tags, args.privacy) == ("v.mp4", "T", "D", "a,b", "unlisted")
+    assert parse("upload-youtube", "v.mp4").privacy == "public"
+    with pytest.raises(SystemExit):
+        parse("upload-youtube", "v.mp4", "--first-comment", "x") # Instagram only
+
+
+def test_upload_instagram(parse):
+    args = parse("upload-instagram", "v.mp4", "--story", "story.txt", "--caption", "C", "--first-comment", "Hi")
+    assert args.func is main.run_upload_instagram_command
+    assert (args.video, args.story, args.caption, args.first_comment) == ("v.mp4", "story.txt", "C", "Hi")
+    assert parse("upload-instagram", "v.mp4").first_comment.startswith("What do you think")
+    with pytest.raises(SystemExit):
+        parse("upload-instagram", "v.mp4", "--privacy", "private") # YouTube only
+
+
+def test_outbox(parse):
+    assert parse("outbox").func is main.run_outbox_command
+    assert not parse("outbox").list and parse("outbox", "--list").list
+
+
+def test_daemon_and_batch_options(parse):
+    assert parse("--batch", "stories/").batch == "stories/"
+    assert parse("--daemon").daemon
+    assert parse("--status").status == "" and parse("--status", "abc").status == "abc"
+    assert parse("--cancel", "abc").cancel == "abc"
+    assert parse("--stop-daemon").stop_daemon
+    assert parse("--prepare-background", "a.mp4", "--prepare-background", "b.mp4").prepare_background == ["a.mp4", "b.mp4"]
+
+
+def test_unknown_command_is_rejected(parse):
+    with pytest.raises(SystemExit):
+        parse("publish")
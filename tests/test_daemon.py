@@ -0,0 +1,101 @@
+"""Runs the job daemon on a free port with a stub job function instead of the real pipeline."""
+import os
+import threading
+import time
+
+import pytest
+
+import main
+
+
+def _no_warm_up():
+    """Stands in for _init_daemon_worker: no models or clients to load."""
+
+
+def _stub_job(job, upload=True):
+    """Stands in for _run_daemon_job. Stories containing "slow" run until they are cancelled."""
+    deadline = time.time() + 30
+    while True:
+        if os.path.exists(main._daemon_cancel_path(job['id'])): # Checked before starting, like each stage
+            job['status'] = 'cancelled'
+            return job
+        if "slow" not in job['story_text'] or time.time() > deadline:
+            break
+        time.sleep(0.05)
+    if "broken" in job['story_text']:
+        job.update(status='failed', error="render: stub failure")
+        return job
+    job.update(status='done', stage_seconds={'tts': 0.0})
+    return job
+
+
+def _wait_for(job_id, statuses, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = main.daemon_request("GET", f"/jobs/{job_id}")
+        if job.get('status') in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not reach {statuses}: {job}")
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    # Workers are spawned, so they find the stubs by importing this module, and .daemon by the shared cwd
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "_init_daemon_worker", _no_warm_up)
+    monkeypatch.setattr(main, "_run_daemon_job", _stub_job)
+    monkeypatch.setattr(main, "DAEMON_WORKERS", 1)
+    address = {}
+    listening = threading.Event()
+
+    def on_listening(server_address):
+        address['port'] = server_address[1]
+        listening.set()
+    thread = threading.Thread(target=main.run_daemon, kwargs={'host': "127.0.0.1", 'port': 0,
+                                                              'on_listening': on_listening}, daemon=True)
+    thread.start()
+    assert listening.wait(60), "the daemon did not start"
+    monkeypatch.setattr(main, "DAEMON_HOST", "127.0.0.1")
+    monkeypatch.setattr(main, "DAEMON_PORT", address['port'])
+    yield thread
+    if thread.is_alive():
+        main.daemon_request("POST", "/shutdown")
+        thread.join(30)
+
+
+def test_daemon_serves_jobs_and_shuts_down(daemon):
+    assert main.daemon_request("GET", "/health")['status'] == 'ok'
+    assert main.daemon_request("POST", "/jobs", {'story': "   "}) == {'error': "no story text"}
+    assert main.daemon_request("GET", "/jobs/nope") == {'error': "unknown job"}
+
+    done = main.daemon_request("POST", "/jobs", {'story': "A quick story. The end.", 'upload': False})
+    assert done['status'] in ('queued', 'running', 'done') and done['title'] == "A quick story"
+    assert _wait_for(done['id'], {'done'})['stage_seconds'] == {'tts': 0.0}
+    failed = main.daemon_request("POST", "/jobs", {'story': "A broken story."})
+    assert _wait_for(failed['id'], {'failed'})['error'] == "render: stub failure"
+
+    # With one worker, the slow job occupies it and the next one waits in the queue. The queued job
+    # is dropped, or (if the pool already handed it to the worker's call queue) stops before its first stage
+    running = main.daemon_request("POST", "/jobs", {'story': "A slow story."})
+    queued = main.daemon_request("POST", "/jobs", {'story': "Waiting its turn."})
+    _wait_for(running['id'], {'running'})
+    assert main.daemon_request("POST", f"/jobs/{queued['id']}/cancel")['status'] in ('cancelled', 'cancelling')
+    assert main.daemon_request("POST", f"/jobs/{running['id']}/cancel")['status'] == 'cancelling'
+    assert _wait_for(running['id'], {'cancelled'})['finished_at'] is not None
+    _wait_for(queued['id'], {'cancelled'})
+    for job_id in (running['id'], queued['id']):
+        assert not os.path.exists(main._daemon_cancel_path(job_id)) # Cleaned up when the job ended
+
+    jobs = {job['id']: job['status'] for job in main.daemon_request("GET", "/jobs")}
+    assert jobs == {done['id']: 'done', failed['id']: 'failed', running['id']: 'cancelled', queued['id']: 'cancelled'}
+
+    assert main.daemon_request("POST", "/shutdown") == {'status': 'shutting down'}
+    daemon.join(30)
+    assert not daemon.is_alive()
+    assert main.daemon_request("GET", "/health") is None
+
+
+def test_thin_client_follows_the_job(daemon):
+    job = main.submit_to_daemon("A quick story. The end.", upload=False, poll_interval=0.05)
+    assert job['status'] == 'done' and job['output_path'].endswith("_final_video.mp4")
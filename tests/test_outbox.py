@@ -0,0 +1,115 @@
+"""Upload outbox against the local fake endpoints from benchmark.py: de-duplication and resume."""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+import benchmark
+import main
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "OUTBOX_DIR", str(tmp_path / "outbox"))
+    monkeypatch.setattr(main, "ARTIFACT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(main, "UPLOAD_RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(main, "UPLOAD_MAX_ATTEMPTS", 20)
+    monkeypatch.setattr(main, "YOUTUBE_UPLOAD_CHUNK_SIZE", 256 * 1024)
+    return tmp_path
+
+
+def _make_videos(directory, count, size=1024 * 1024):
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"video_{i}.mp4")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def _publish(path, clients):
+    return main.publish_video(path, {'title': os.path.basename(path), 'description': "", 'tags': []},
+                              {'caption': os.path.basename(path)}, clients=clients)
+
+
+def test_enqueue_is_keyed_by_target_and_content(outbox):
+    path, = _make_videos(str(outbox), 1)
+    first = main.enqueue_upload(path, 'youtube', {'title': "a", 'description': "", 'tags': []})
+    again = main.enqueue_upload(path, 'youtube', {'title': "b", 'description': "", 'tags': []})
+    other_target = main.enqueue_upload(path, 'instagram', {'caption': "a"})
+    assert first['id'] == again['id'] != other_target['id']
+    assert len(main.load_outbox_entries()) == 2
+
+
+def test_publishing_twice_uploads_once(outbox):
+    clients = {'youtube': benchmark.FakeYouTubeService(), 'instagram': benchmark.FakeInstagramClient()}
+    path, = _make_videos(str(outbox), 1)
+    assert _publish(path, clients) == {'youtube': True, 'instagram': True}
+    assert _publish(path, clients) == {'youtube': True, 'instagram': True}
+    assert list(clients['youtube'].uploads.values()) == [1]
+    assert list(clients['instagram'].uploads.values()) == [1]
+
+
+def test_drain_resumes_after_failures_and_a_crash(outbox):
+    size = 1024 * 1024
+    youtube = benchmark.FakeYouTubeService(fail_rate=0.2, crash_after_chunks=10, seed=3)
+    instagram = benchmark.FakeInstagramClient(fail_rate=0.2, seed=4)
+    clients = {'youtube': youtube, 'instagram': instagram}
+    paths = _make_videos(str(outbox), 5, size)
+    for path in paths:
+        main.enqueue_upload(path, 'youtube', {'title': os.path.basename(path), 'description': "", 'tags': []})
+        main.enqueue_upload(path, 'instagram', {'caption': os.path.basename(path)})
+
+    with pytest.raises(benchmark.SimulatedCrash):
+        main.drain_outbox(clients=clients)
+    main.drain_outbox(clients=clients) # A restarted process continues from the entries on disk
+    for path in paths:
+        assert _publish(path, clients) == {'youtube': True, 'instagram': True}
+
+    assert all(entry['status'] == 'done' for entry in main.load_outbox_entries())
+    assert len(youtube.uploads) == len(instagram.uploads) == len(paths)
+    assert set(youtube.uploads.values()) == set(instagram.uploads.values()) == {1}
+    # The interrupted upload continued its session instead of sending the whole file again
+    assert youtube.resumed > 0
+    assert youtube.bytes_received < 1.5 * size * len(paths)
+
+
+def test_missing_credentials_fail_without_retrying(outbox, monkeypatch):
+    monkeypatch.setattr(main, "get_instagram_client", lambda: None)
+    path, = _make_videos(str(outbox), 1)
+    assert main.publish_video(path, instagram_metadata={'caption': "x"}) == {'instagram': False}
+    entry, = main.load_outbox_entries()
+    assert entry['status'] == 'failed' and entry['attempts'] == 1
+
+
+def test_resuming_a_finished_session_does_not_upload_again(outbox):
+    youtube = benchmark.FakeYouTubeService()
+    path, = _make_videos(str(outbox), 1)
+    state = {}
+    assert main.upload_to_youtube(path, "t", "", [], youtube=youtube, upload_state=state)
+    # As if the process died after the last chunk, before the session was cleared
+    state['resumable_uri'] = "fake://upload/0"
+    assert main.upload_to_youtube(path, "t", "", [], youtube=youtube, upload_state=state)
+    assert state['result_id'] == "local-video-0"
+    assert list(youtube.uploads.values()) == [1]
+
+
+class _SlowInstagramClient(benchmark.FakeInstagramClient):
+    def video_upload(self, path, caption, **kwargs):
+        main.time.sleep(1.0)
+        return super().video_upload(path, caption, **kwargs)
+
+
+def test_retries_do_not_wait_for_slower_uploads(outbox):
+    youtube = benchmark.FakeYouTubeService(fail_rate=0.5)
+    youtube.random = SimpleNamespace(random=iter([0.0] + [1.0] * 100).__next__) # Only the first chunk fails
+    clients = {'youtube': youtube, 'instagram': _SlowInstagramClient()}
+    path, = _make_videos(str(outbox), 1)
+    assert _publish(path, clients) == {'youtube': True, 'instagram': True}
+    entries = {entry['target']: entry for entry in main.load_outbox_entries()}
+    assert entries['youtube']['attempts'] == 2
+    # The YouTube retry ran while the Instagram upload was still going
+    assert entries['youtube']['finished_at'] < entries['instagram']['finished_at']
@@ -0,0 +1,92 @@
+"""Runs the staged batch pipeline against the local ElevenLabs stand-in (no network, no Whisper)."""
+import os
+
+import pytest
+
+benchmark = pytest.importorskip("benchmark")
+pytest.importorskip("elevenlabs")
+
+import main
+
+
+class FailingElevenLabsClient(benchmark.FakeElevenLabsClient):
+    """Fails every request whose text contains "FAIL", like an API error for one story."""
+
+    def convert_with_timestamps(self, voice_id, text, output_format=None, **kwargs):
+        if "FAIL" in text:
+            raise RuntimeError("simulated API error")
+        return super().convert_with_timestamps(voice_id, text, output_format=output_format, **kwargs)
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "ARTIFACT_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "SUBTITLE_TIMING_MODE", "align")
+    monkeypatch.setattr(main, "TTS_CHUNK_CHARS", 60)
+    monkeypatch.setattr(main, "TTS_CHUNK_RETRIES", 0)
+
+    def no_whisper(*args, **kwargs):
+        raise AssertionError("Whisper should not run when the TTS returned character timestamps")
+    for name in ("transcribe_audio_to_words", "transcribe_audio_to_segments", "force_align_words"):
+        monkeypatch.setattr(main, name, no_whisper)
+
+
+def _job(job_id, text, tmp_path):
+    return {'id': job_id, 'story_text': text, 'audio_path': str(tmp_path / f"{job_id}.mp3")}
+
+
+def test_failed_job_does_not_stop_the_others(offline, tmp_path, monkeypatch):
+    long_story = "The first sentence is here. A second one follows it. And a third one ends the story."
+    jobs = [_job("short", "A short story.", tmp_path),
+            _job("broken", "This story will FAIL.", tmp_path),
+            _job("long", long_story, tmp_path)]
+    client = FailingElevenLabsClient()
+    timing_threads, finished = set(), []
+    time_chunk_words = main._time_chunk_words
+
+    def record_timing_thread(*args):
+        timing_threads.add(main.threading.current_thread().name)
+        return time_chunk_words(*args)
+    monkeypatch.setattr(main, "_time_chunk_words", record_timing_thread)
+
+    stats = main.run_staged_pipeline(jobs, [("tts", 2, lambda job: main._batch_tts_stage(job, client=client)),
+                                            ("subtitles", 1, main._batch_transcribe_stage),
+                                            ("finish", 1, lambda job: finished.append(job['id']))])
+
+    by_id = {job['id']: job for job in jobs}
+    assert by_id['broken']['status'] == 'failed'
+    assert by_id['broken']['error'].startswith("tts:")
+    assert 'subtitles' not in by_id['broken']['stage_seconds'] # Skipped the later stages
+    assert sorted(finished) == ["long", "short"]
+    assert stats['tts'] == {'ok': 2, 'failed': 1, 'seconds': stats['tts']['seconds']}
+    assert stats['subtitles']['ok'] == 2 and stats['subtitles']['failed'] == 0
+
+    # The long story was synthesised in chunks and timed by the subtitles stage, not during TTS
+    long_job = by_id['long']
+    assert 'chunks' not in long_job
+    assert " ".join(seg['text'] for seg in long_job['segments']) == long_story
+    starts = [seg['start'] for seg in long_job['segments']]
+    assert starts == sorted(starts)
+    assert long_job['segments'][-1]['end'] <= main.audio_duration(long_job['audio_path']) + 0.1
+    assert timing_threads == {"subtitles-0"}
+
+
+def test_untimed_chunks_are_timed_and_cleaned_up(offline, tmp_path):
+    story = "The first sentence is here. A second one follows it. And a third one ends the story."
+    audio_path = str(tmp_path / "story.mp3")
+    chunks = main.text_to_speech_chunked(story, audio_path, client=benchmark.FakeElevenLabsClient(),
+                                         time_words=False)
+    assert len(chunks) == len(main.split_story_into_chunks(story, 60)) > 1
+    assert [chunk['text'] for chunk in chunks] == main.split_story_into_chunks(story, 60)
+    assert chunks[0]['offset'] == 0.0
+    assert all(a['offset'] < b['offset'] for a, b in zip(chunks, chunks[1:]))
+    assert all(os.path.exists(chunk['path']) for chunk in chunks)
+
+    segments = main.time_story_chunks(chunks)
+    assert " ".join(seg['text'] for seg in segments) == story
+    # Each chunk's words start at that chunk's offset in the joined audio
+    first_words = [chunk['text'].split()[0] for chunk in chunks]
+    offsets = [seg['start'] for seg in segments if seg['text'] in first_words]
+    assert offsets == pytest.approx([chunk['offset'] for chunk in chunks], abs=0.01)
+    assert not os.path.exists(os.path.dirname(chunks[0]['path']))
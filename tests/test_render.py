@@ -0,0 +1,236 @@
+"""Render tests: the audio track and background of each backend, backend dispatch and subtitle caching."""
+import os
+import subprocess
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("moviepy")
+pytest.importorskip("PIL")
+
+import main
+
+TONE_SECONDS = 2.0
+TONE_HZ = 220
+
+
+@pytest.fixture
+def tone(tmp_path, monkeypatch, subtitle_font):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "ARTIFACT_CACHE_ENABLED", False)
+    path = str(tmp_path / "tone.mp3")
+    subprocess.run([main._ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "lavfi",
+                    "-i", f"sine=frequency={TONE_HZ}:duration={TONE_SECONDS}", path], check=True)
+    return path
+
+
+def _decoded_audio(video_path, rate=48000):
+    cmd = [main._ffmpeg_binary(), "-loglevel", "error", "-i", video_path, "-vn",
+           "-f", "f32le", "-ac", "1", "-ar", str(rate), "-"]
+    return np.frombuffer(subprocess.run(cmd, check=True, capture_output=True).stdout, dtype=np.float32)
+
+
+@pytest.mark.parametrize("backend,workers,fast_path", [
+    ("moviepy", 1, False),
+    ("parallel", 2, False),
+    ("ffmpeg", 1, False),
+    ("stream", 1, False),
+    ("moviepy", 1, True), # Static background fast path
+])
+def test_rendered_audio_keeps_length_and_pitch(tone, tmp_path, monkeypatch, backend, workers, fast_path):
+    monkeypatch.setattr(main, "STATIC_BACKGROUND_FAST_PATH", fast_path)
+    output_path = str(tmp_path / "video.mp4")
+    segments = [{'text': "hello", 'start': 0.2, 'end': 1.2}, {'text': "world", 'start': 1.2, 'end': 1.9}]
+    assert main.create_styled_subtitle_video(tone, segments, output_path=output_path, video_size=(90, 160),
+                                             backend=backend, workers=workers)
+
+    samples = _decoded_audio(output_path)
+    assert len(samples) / 48000 == pytest.approx(TONE_SECONDS, abs=0.05)
+    spectrum = np.abs(np.fft.rfft(samples[:48000])) # One second, so bin index = frequency in Hz
+    assert int(np.argmax(spectrum)) == pytest.approx(TONE_HZ, abs=2)
+
+
+@pytest.fixture
+def render_calls(monkeypatch):
+    """Records which renderers _create_styled_subtitle_video tries; each returns the value set in `results`."""
+    calls, results = [], {}
+
+    def recorder(name):
+        def render(*args, **kwargs):
+            calls.append(name)
+            return results.get(name, True)
+        return render
+
+    monkeypatch.setattr(main, "STATIC_BACKGROUND_FAST_PATH", False)
+    monkeypatch.setattr(main, "render_video_parallel", recorder("parallel"))
+    monkeypatch.setattr(main, "render_video_streaming", recorder("stream"))
+    return calls, results
+
+
+def test_explicit_stream_backend_ignores_workers(tone, tmp_path, render_calls):
+    calls, _ = render_calls
+    segments = [{'text': "hello", 'start': 0.2, 'end': 1.2}]
+    assert main._create_styled_subtitle_video(tone, segments, str(tmp_path / "video.mp4"), (90, 160), None,
+                                              "stream", 4)
+    assert calls == ["stream"]
+
+
+def test_failed_parallel_render_of_a_long_video_falls_back_to_stream(tone, tmp_path, monkeypatch, render_calls):
+    calls, results = render_calls
+    results['parallel'] = False
+    monkeypatch.setattr(main, "STREAM_RENDER_SECONDS", 1)
+    segments = [{'text': "hello", 'start': 0.2, 'end': 1.2}]
+    assert main._create_styled_subtitle_video(tone, segments, str(tmp_path / "video.mp4"), (90, 160), None,
+                                              "moviepy", 4)
+    assert calls == ["parallel", "stream"]
+
+
+@pytest.fixture
+def numbered_background(tmp_path, subtitle_font):
+    """A 10 s, 10 fps background showing its frame number as 8 black/white bit columns."""
+    path = str(tmp_path / "numbered.mp4")
+    subprocess.run([main._ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "lavfi",
+                    "-i", "color=black:s=64x64:r=10:d=10",
+                    "-vf", "geq=lum='if(mod(floor(N/pow(2,floor(X/8))),2),235,16)':cb=128:cr=128",
+                    "-c:v", "libx264", "-g", "10", "-pix_fmt", "yuv420p", path], check=True)
+    return path
+
+
+def _decoded_frames(video_path):
+    cmd = [main._ffmpeg_binary(), "-loglevel", "error", "-i", video_path, "-f", "rawvideo", "-pix_fmt", "gray", "-"]
+    frames = np.frombuffer(subprocess.run(cmd, check=True, capture_output=True).stdout, dtype=np.uint8)
+    return frames.reshape(-1, 64, 64)
+
+
+def _frame_numbers(frames):
+    """Source frame number of each frame of the numbered background."""
+    numbers = []
+    for frame in frames:
+        bits = [frame[:16, 8 * bit + 2:8 * bit + 6].mean() > 128 for bit in range(8)]
+        numbers.append(sum(1 << bit for bit, value in enumerate(bits) if value))
+    return numbers
+
+
+def _render_looped_ffmpeg(audio_path, output_path, background_path, offset):
+    return main._render_with_ffmpeg(audio_path, [], output_path, (64, 64), background_path, fps=10,
+                                    background_offset=offset)
+
+
+def _render_looped_stream(audio_path, output_path, background_path, offset):
+    return main.render_video_streaming(audio_path, [], output_path, (64, 64), background_path, fps=10,
+                                       background_offset=offset)
+
+
+def _render_looped_variants(audio_path, output_path, background_path, offset):
+    variants = [{'size': (64, 64), 'fps': 10, 'codec': "libx264", 'crf': 18, 'preset': "ultrafast", 'path': output_path},
+                {'size': (32, 32), 'fps': 10, 'codec': "libx264", 'crf': 30, 'preset': "ultrafast",
+                 'path': output_path + ".preview.mp4"}]
+    return main._render_variants_with_ffmpeg(audio_path, [], variants, background_path, offset)
+
+
+@pytest.mark.parametrize("render", [_render_looped_ffmpeg, _render_looped_stream, _render_looped_variants])
+def test_background_loops_from_the_offset(tmp_path, numbered_background, render):
+    audio_path = str(tmp_path / "silence.wav")
+    subprocess.run([main._ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "lavfi",
+                    "-i", "anullsrc=r=48000:cl=mono", "-t", "6", audio_path], check=True)
+    output_path = str(tmp_path / "looped.mp4")
+    assert render(audio_path, output_path, numbered_background, 8.0)
+
+    numbers = _frame_numbers(_decoded_frames(output_path))
+    # 8 s into a 10 s background: 80..99, then from the start again, never skipping or repeating
+    assert numbers == [(80 + k) % 100 for k in range(60)]
+    # Same frames as the MoviePy path
+    clip = main._open_background_clip(numbered_background, (64, 64), 6.0, 8.0)
+    assert numbers == _frame_numbers([clip.get_frame(k / 10).mean(axis=2) for k in range(60)])
+
+
+def test_subtitle_image_cache_evicts_least_recently_used():
+    cache = main.SubtitleImageCache(max_items=2)
+    images = {key: np.full((2, 2, 4), i, dtype=np.uint8) for i, key in enumerate("abc")}
+    cache.put("a", images["a"])
+    cache.put("b", images["b"])
+    assert cache.get("a") is images["a"] # "a" is now the most recently used
+    cache.put("c", images["c"])
+    assert cache.get("b") is None
+    assert cache.get("a") is images["a"] and cache.get("c") is images["c"]
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_subtitle_image_cache_round_trips_through_disk(tmp_path):
+    key = ("HELLO", "font.ttf", 100, "white", "black", 5, 918)
+    image = np.arange(3 * 4 * 4, dtype=np.uint8).reshape(3, 4, 4)
+    main.SubtitleImageCache(cache_dir=str(tmp_path)).put(key, image)
+    assert not image.flags.writeable # Shared with later frames, so it must not be changed in place
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+    later_run = main.SubtitleImageCache(max_items=1, cache_dir=str(tmp_path))
+    loaded = later_run.get(key)
+    np.testing.assert_array_equal(loaded, image)
+    assert later_run.get(("OTHER",) + key[1:]) is None
+
+
+def test_missing_subtitle_font_fails_instead_of_falling_back(tone, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "SUBTITLE_FONT", "No Such Font")
+    with pytest.raises(FileNotFoundError):
+        main._load_subtitle_font("No Such Font", 100)
+    segments = [{'text': "hello", 'start': 0.2, 'end': 1.2}]
+    assert not main.create_styled_subtitle_video(tone, segments, output_path=str(tmp_path / "video.mp4"),
+                                                 video_size=(90, 160))
+    assert not os.path.exists(tmp_path / "video.mp4")
+
+
+def test_ass_subtitles_name_the_font_pillow_measured(tmp_path, subtitle_font):
+    ass_path = str(tmp_path / "subtitles.ass")
+    main.write_ass_subtitles([{'text': "hello", 'start': 0.0, 'end': 1.0}], ass_path, (1080, 1920))
+    with open(ass_path, encoding="utf-8") as f:
+        style = next(line for line in f if line.startswith("Style: Caption,"))
+    assert style.split(",")[1] == subtitle_font.getname()[0]
+
+
+def _ass_dialogue_texts(ass_path):
+    with open(ass_path, encoding="utf-8") as f:
+        return [line.rstrip("\n").split(",", 9)[9] for line in f if line.startswith("Dialogue:")]
+
+
+def test_ass_subtitles_escape_override_characters(tmp_path, subtitle_font):
+    ass_path = str(tmp_path / "subtitles.ass")
+    segments = [{'text': text, 'start': 0.0, 'end': 1.0}
+                for text in ["{\\i1}hi", "a}b", "back\\slash", "new\\Nline", "two\nlines", "  spaced   out "]]
+    main.write_ass_subtitles(segments, ass_path, (1080, 1920))
+    texts = _ass_dialogue_texts(ass_path)
+    assert texts[0] == "\\{\\\u2060I1\\}HI"
+    assert texts[1] == "A\\}B"
+    assert texts[2] == "BACK\\\u2060SLASH"
+    assert texts[3] == "NEW\\\u2060NLINE" # Not a \N line break
+    assert texts[4] == "TWO LINES"
+    assert texts[5] == "SPACED OUT"
+    # Exactly one Dialogue line per segment: a newline in the text did not start a new line
+    assert len(texts) == len(segments)
+
+
+def _libass_frame(tmp_path, text):
+    """The caption `text` burned in by libass on a black 320x180 frame, as a gray array."""
+    ass_path = str(tmp_path / "caption.ass")
+    main.write_ass_subtitles([{'text': text, 'start': 0.0, 'end': 2.0}], ass_path, (320, 180), fontsize=30)
+    fontsdir = main._copy_subtitle_font(str(tmp_path))
+    cmd = [main._ffmpeg_binary(), "-loglevel", "error", "-f", "lavfi", "-i", "color=black:s=320x180:d=1",
+           "-vf", f"subtitles=caption.ass{fontsdir}", "-frames:v", "1", "-f", "rawvideo", "-pix_fmt", "gray", "-"]
+    result = subprocess.run(cmd, cwd=str(tmp_path), check=True, capture_output=True)
+    return np.frombuffer(result.stdout, dtype=np.uint8).reshape(180, 320)
+
+
+def _ink_extent(frame):
+    """(width, height) of the bright pixels in a frame."""
+    cols = np.where(frame.max(axis=0) > 128)[0]
+    rows = np.where(frame.max(axis=1) > 128)[0]
+    return cols.max() - cols.min(), rows.max() - rows.min()
+
+
+def test_libass_draws_escaped_text_literally(tmp_path, subtitle_font):
+    plain_width, plain_height = _ink_extent(_libass_frame(tmp_path, "AB"))
+    # Braces are drawn instead of starting an override block (which would hide "\i1")
+    braced_width, _ = _ink_extent(_libass_frame(tmp_path, "A{\\i1}B"))
+    assert braced_width > 2 * plain_width
+    # "\N" is drawn as text on the same line instead of breaking it
+    _, break_height = _ink_extent(_libass_frame(tmp_path, "A\\NB"))
+    assert break_height < 1.5 * plain_height
@@ -0,0 +1,161 @@
+"""Offline tests for the subtitle timing and timeline helpers (no models, no network)."""
+import pytest
+
+import main
+
+
+def _segments(*spans):
+    return [{'text': text, 'start': start, 'end': end} for text, start, end in spans]
+
+
+def test_words_from_character_alignment_splits_on_whitespace():
+    text = "Hi  there.\nOk"
+    starts = [i * 0.1 for i in range(len(text))]
+    alignment = {
+        'characters': list(text),
+        'character_start_times_seconds': starts,
+        'character_end_times_seconds': [start + 0.1 for start in starts],
+    }
+    words = main.words_from_character_alignment(alignment)
+    assert [word['text'] for word in words] == ["Hi", "there.", "Ok"]
+    assert words[0]['start'] == 0.0 and words[0]['end'] == pytest.approx(0.2)
+    assert words[1]['start'] == pytest.approx(0.4) and words[1]['end'] == pytest.approx(1.0)
+    assert words[2]['start'] == pytest.approx(1.1) and words[2]['end'] == pytest.approx(1.3)
+
+
+def test_words_from_character_alignment_empty():
+    alignment = {'characters': [], 'character_start_times_seconds': [], 'character_end_times_seconds': []}
+    assert main.words_from_character_alignment(alignment) == []
+
+
+def test_timeline_active_at_matches_a_linear_scan():
+    segments = _segments(("c", 2.0, 3.0), ("a", 0.0, 1.0), ("long", 0.5, 4.0), ("b", 1.0, 2.0), ("a", 5.0, 5.5))
+    timeline = main.SubtitleTimeline(segments)
+    for step in range(0, 60):
+        t = step / 10
+        expected = [i for i, seg in enumerate(segments) if seg['start'] <= t < seg['end']]
+        active = [timeline.order[i] for i in timeline.active_at(t)]
+        assert active == expected, t # Visible segments, stacked in their original order
+    assert len(timeline) == 5
+    assert timeline.texts == ["a", "long", "b", "c"] # Each distinct text stored once
+    assert [timeline.text(i) for i in range(len(timeline))] == ["a", "long", "b", "c", "a"]
+
+
+def test_timeline_end_is_exclusive():
+    timeline = main.SubtitleTimeline(_segments(("a", 0.0, 1.0), ("b", 1.0, 2.0)))
+    assert [timeline.text(i) for i in timeline.active_at(1.0)] == ["b"]
+    assert timeline.active_at(2.0) == []
+
+
+def test_split_timeline_into_chunks_cuts_at_subtitle_starts():
+    fps = 10
+    segments = _segments(*[(f"w{i}", i * 0.7, i * 0.7 + 0.5) for i in range(15)])
+    chunks = main.split_timeline_into_chunks(segments, 10.0, 3, fps)
+    assert chunks[0][0] == 0 and chunks[-1][1] == 100
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end == start # Contiguous, every frame rendered exactly once
+    starts = {round(seg['start'] * fps) for seg in segments}
+    assert all(end in starts for _, end in chunks[:-1])
+    assert len(chunks) == 3
+
+
+def test_split_timeline_into_chunks_without_segments():
+    assert main.split_timeline_into_chunks([], 4.0, 4, 10) == [(0, 10), (10, 20), (20, 30), (30, 40)]
+    assert main.split_timeline_into_chunks([], 4.0, 1, 10) == [(0, 40)]
+
+
+def test_merge_piece_words_keeps_each_word_once_around_splits():
+    splits = [10.0]
+    first = _segments(("one", 8.0, 8.5), ("two", 9.6, 10.2), ("three", 10.5, 11.0))
+    second = _segments(("two", 9.65, 10.25), ("three", 10.5, 11.0), ("four", 12.0, 12.5))
+    merged = main.merge_piece_words([first, second], splits)
+    assert [word['text'] for word in merged] == ["one", "two", "three", "four"]
+    assert merged[2] is second[1] # After the split, the second piece's timing wins
+
+
+def test_merge_piece_words_drops_a_repeat_heard_by_both_pieces():
+    # Both pieces assign the word to their own side of the split, at overlapping times
+    first = _segments(("Hello,", 9.7, 9.95))
+    second = _segments(("hello", 9.8, 10.3))
+    merged = main.merge_piece_words([first, second], [10.0])
+    assert [word['text'] for word in merged] == ["Hello,"]
+
+
+def test_caption_change_frames():
+    fps = 10
+    segments = _segments(("a", 0.0, 0.55), ("b", 0.55, 1.0), ("c", 2.0, 9.0))
+    frames = main.caption_change_frames(segments, 30, fps)
+    assert frames == [0, 6, 10, 20, 30] # Frame 90 (the end of "c") lies past the last frame
+    assert main.caption_change_frames([], 30, fps) == [0, 30]
+
+
+def test_tts_character_timestamps_time_the_subtitles_without_whisper(tmp_path, monkeypatch):
+    benchmark = pytest.importorskip("benchmark")
+    pytest.importorskip("elevenlabs")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "ARTIFACT_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "MAX_WORDS_PER_SUBTITLE", 1)
+
+    def no_whisper(*args, **kwargs):
+        raise AssertionError("Whisper should not run when the TTS returned character timestamps")
+    for name in ("transcribe_audio_to_words", "transcribe_audio_to_segments", "force_align_words"):
+        monkeypatch.setattr(main, name, no_whisper)
+
+    script = "The quick brown fox jumps over the lazy dog."
+    audio_path = str(tmp_path / "story.mp3")
+    assert main.text_to_speech_elevenlabs(script, audio_path, with_timestamps=True,
+                                          client=benchmark.FakeElevenLabsClient())
+    segments = main.get_subtitle_segments(audio_path, script_text=script, mode="align")
+
+    assert [seg['text'] for seg in segments] == script.split()
+    starts = [seg['start'] for seg in segments]
+    assert starts == sorted(starts)
+    assert all(seg['start'] < seg['end'] for seg in segments)
+    assert all(a['end'] <= b['start'] for a, b in zip(segments, segments[1:]))
+
+
+def _speech_with_pauses(pauses, duration=10.0, sample_rate=16000):
+    """A loud noise signal with silent gaps at the given (start, end) times."""
+    np = pytest.importorskip("numpy")
+    samples = np.random.default_rng(0).uniform(-0.5, 0.5, int(duration * sample_rate)).astype(np.float32)
+    for start, end in pauses:
+        samples[int(start * sample_rate):int(end * sample_rate)] = 0.0
+    return samples
+
+
+def test_find_silence_splits_lands_in_pauses():
+    pauses = [(2.2, 2.5), (4.9, 5.2), (7.6, 7.9)]
+    splits = main.find_silence_splits(_speech_with_pauses(pauses), 16000, piece_seconds=2.5, search_seconds=0.6)
+    assert len(splits) == len(pauses)
+    for split, (start, end) in zip(splits, pauses):
+        assert start <= split <= end
+
+
+def test_find_silence_splits_without_pauses_keeps_the_piece_length():
+    splits = main.find_silence_splits(_speech_with_pauses([]), 16000, piece_seconds=2.5, search_seconds=0.5)
+    gaps = [b - a for a, b in zip([0.0] + splits, splits + [10.0])]
+    assert all(2.0 <= gap <= 3.75 for gap in gaps) # No piece drifts, and the last one is not tiny
+    assert main.find_silence_splits(_speech_with_pauses([], duration=2.0), 16000, piece_seconds=2.5) == []
+    assert main.find_silence_splits(_speech_with_pauses([], duration=0.0), 16000) == []
+
+
+def test_long_audio_mode_does_not_nest_pools_in_workers(monkeypatch):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    monkeypatch.setattr(main, "LONG_AUDIO_WORKERS", 0)
+    assert main._long_audio_workers() == (main.os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        assert pool.submit(main._long_audio_workers).result() == 1
+
+
+@pytest.mark.parametrize("seconds,expected", [
+    (0, "0:00:00.00"),
+    (1.234, "0:00:01.23"),
+    (59.996, "0:01:00.00"), # Rounding carries into the minutes
+    (3599.999, "1:00:00.00"),
+    (3661.5, "1:01:01.50"),
+    (36000.07, "10:00:00.07"),
+    (-0.2, "0:00:00.00"),
+])
+def test_format_ass_time(seconds, expected):
+    assert main._format_ass_time(seconds) == expected